@@ -1,9 +1,13 @@
 from django.contrib import admin          # Imports Django’s built-in admin interface
-from .models import User, DojoClass, Enrollment, Payment, Schedule   # Imports all your models from models.py
+from .models import User, Attendance, ClassSession, DojoClass, Enrollment, Job, Payment, Schedule, WaitlistEntry   # Imports all your models from models.py
 
 # Registers each model so they appear in the Django admin dashboard
 admin.site.register(User)
 admin.site.register(DojoClass)
 admin.site.register(Enrollment)
 admin.site.register(Payment)
-admin.site.register(Schedule)
\ No newline at end of file
+admin.site.register(Schedule)
+admin.site.register(WaitlistEntry)
+admin.site.register(Job)
+admin.site.register(ClassSession)
+admin.site.register(Attendance)
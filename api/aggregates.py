@@ -0,0 +1,223 @@
+"""
+Maintained report aggregates: per-role user, class and enrollment counters
+(ReportCounter) and monthly payment totals (PaymentTotal).
+
+Every counter is split over SHARDS rows and each change goes to a random
+one, so concurrent writers rarely wait on the same row; reads sum the
+shards, which keeps admin stats one indexed read however many classes there
+are. The enrollment counter moves with DojoClass.enrolled_count: api/services.py
+bumps it wherever a seat is taken or released.
+"""
+import random
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import DojoClass, Enrollment, Payment, PaymentTotal, ReportCounter
+
+User = get_user_model()
+
+CLASSES = "classes"
+ENROLLMENTS = "enrollments"
+CENTS = Decimal("0.01")
+
+
+def _config():
+    return {
+        # rows per counter; raising it is safe, after lowering it run rebuild_aggregates
+        "SHARDS": 8,
+        **getattr(settings, "AGGREGATES", {}),
+    }
+
+
+def role_key(role):
+    return f"users:{role}"
+
+
+def _shard_keys(key):
+    # shard 0 is the bare key, which is what rebuild() writes
+    return [key] + [f"{key}#{slot}" for slot in range(1, _config()["SHARDS"])]
+
+
+def _slot():
+    return random.randrange(_config()["SHARDS"])
+
+
+def bump(key, delta=1):
+    """Add `delta` to one shard of a counter, creating it on first use."""
+    if not delta:
+        return
+    key = _shard_keys(key)[_slot()]
+    if ReportCounter.objects.filter(key=key).update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            ReportCounter.objects.create(key=key, value=delta)
+    except IntegrityError:
+        # created concurrently
+        ReportCounter.objects.filter(key=key).update(value=F('value') + delta)
+
+
+def _counter_rows(keys):
+    shards = {shard: key for key in keys for shard in _shard_keys(key)}
+    return shards, ReportCounter.objects.filter(key__in=shards).values_list('key', 'value')
+
+
+def read_counters(*keys):
+    """One indexed read for any number of counters, summing their shards; missing keys read as 0."""
+    shards, rows = _counter_rows(keys)
+    totals = dict.fromkeys(keys, 0)
+    for shard, value in rows:
+        totals[shards[shard]] += value
+    return totals
+
+
+async def aread_counters(*keys):
+    shards, rows = _counter_rows(keys)
+    totals = dict.fromkeys(keys, 0)
+    async for shard, value in rows:
+        totals[shards[shard]] += value
+    return totals
+
+
+def payment_totals():
+    """PaymentTotal shards summed per (status, month), empty buckets left out."""
+    return (
+        PaymentTotal.objects.values('month', 'status')
+        .annotate(total_count=Sum('count'), total_amount=Sum('amount'))
+        .filter(total_count__gt=0)
+        .order_by('month', 'status')
+    )
+
+
+def enrollment_report():
+    """Enrollment totals, per-class counts and monthly payment totals, all read from the aggregates."""
+    # Per-class counts come from DojoClass.enrolled_count, no scan of Enrollment
+    class_stats = [
+        {'martial_class__name': name, 'count': count}
+        for name, count in DojoClass.objects.filter(enrolled_count__gt=0)
+        .order_by('-enrolled_count')
+        .values_list('name', 'enrolled_count')
+    ]
+
+    payment_summary = [
+        {'month': row['month'].strftime('%Y-%m'), 'status': row['status'],
+         'count': row['total_count'], 'amount': str(row['total_amount'].quantize(CENTS))}
+        for row in payment_totals()
+    ]
+
+    return {
+        'total_enrollments': sum(row['count'] for row in class_stats),
+        'class_summary': class_stats,
+        'payment_summary': payment_summary,
+    }
+
+
+def _month(date):
+    return date.replace(day=1)
+
+
+def _apply_payment_total(status, month, count, amount):
+    # a shard may go negative (a removal landing on another shard than the payment did); the sum is what counts
+    slot = _slot()
+    bucket = PaymentTotal.objects.filter(status=status, month=month, slot=slot)
+    if bucket.update(count=F('count') + count, amount=F('amount') + amount):
+        return
+    try:
+        with transaction.atomic():
+            PaymentTotal.objects.create(status=status, month=month, slot=slot, count=count, amount=amount)
+    except IntegrityError:
+        bucket.update(count=F('count') + count, amount=F('amount') + amount)
+
+
+def add_payment(status, date, amount, sign=1):
+    """Apply one payment (sign=1) or its removal (sign=-1) to the monthly totals."""
+    _apply_payment_total(status, _month(date), sign, Decimal(amount) * sign)
+
+
+def add_payments(payments):
+    """Apply a batch of new payments with one UPDATE per (status, month) bucket."""
+    buckets = {}
+    for payment in payments:
+        key = (payment.status, _month(payment.date))
+        count, amount = buckets.get(key, (0, Decimal(0)))
+        buckets[key] = (count + 1, amount + Decimal(payment.amount))
+    for (status, month), (count, amount) in buckets.items():
+        _apply_payment_total(status, month, count, amount)
+
+
+# --- full recomputation, used by the management command -----------------
+
+def expected_counters():
+    counters = {role_key(role): 0 for role, _ in User.ROLE_CHOICES}
+    for role, n in User.objects.values_list('role').annotate(n=Count('id')).order_by():
+        counters[role_key(role)] = n
+    counters[CLASSES] = DojoClass.objects.count()
+    counters[ENROLLMENTS] = Enrollment.objects.count()
+    return counters
+
+
+def expected_payment_totals():
+    rows = (
+        Payment.objects.annotate(month=TruncMonth('date'))
+        .values('status', 'month')
+        .annotate(count=Count('id'), amount=Sum('amount'))
+        .order_by()
+    )
+    return {(r['status'], r['month']): (r['count'], r['amount']) for r in rows}
+
+
+def expected_class_counts():
+    return dict(
+        DojoClass.objects.annotate(n=Count('enrollments')).values_list('id', 'n')
+    )
+
+
+def verify():
+    """Return a list of human-readable mismatches between the aggregates and the base tables."""
+    problems = []
+
+    expected = expected_counters()
+    stored = read_counters(*expected)
+    for key, value in expected.items():
+        if stored[key] != value:
+            problems.append(f"counter {key}: stored {stored[key]}, actual {value}")
+
+    stored_totals = {
+        (row['status'], row['month']): (row['total_count'], row['total_amount']) for row in payment_totals()
+    }
+    actual_totals = expected_payment_totals()
+    for bucket in stored_totals.keys() | actual_totals.keys():
+        if stored_totals.get(bucket) != actual_totals.get(bucket):
+            problems.append(
+                f"payments {bucket[0]} {bucket[1]:%Y-%m}: stored {stored_totals.get(bucket)}, "
+                f"actual {actual_totals.get(bucket)}"
+            )
+
+    stored_classes = dict(DojoClass.objects.values_list('id', 'enrolled_count'))
+    for class_id, n in expected_class_counts().items():
+        if stored_classes.get(class_id) != n:
+            problems.append(f"class {class_id} enrolled_count: stored {stored_classes.get(class_id)}, actual {n}")
+
+    return problems
+
+
+@transaction.atomic
+def rebuild():
+    ReportCounter.objects.all().delete()
+    ReportCounter.objects.bulk_create(
+        ReportCounter(key=key, value=value) for key, value in expected_counters().items()
+    )
+
+    PaymentTotal.objects.all().delete()
+    PaymentTotal.objects.bulk_create(
+        PaymentTotal(status=status, month=month, count=count, amount=amount)
+        for (status, month), (count, amount) in expected_payment_totals().items()
+    )
+
+    for class_id, n in expected_class_counts().items():
+        DojoClass.objects.filter(pk=class_id).update(enrolled_count=n)
@@ -0,0 +1,125 @@
+"""
+Async implementations of the read-heavy endpoints, used when ASYNC_VIEWS is on
+(the ASGI entrypoint turns it on; see dojo_backend/asgi.py and gunicorn.conf.py).
+
+They answer GETs with the same JSON as the DRF views, but while a query is in
+flight the event loop keeps serving other requests instead of blocking a worker.
+Anything they don't handle (writes, pagination, non-JSON renderers) falls
+through to the regular DRF view.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from . import aggregates, views
+from .authentication import StatelessJWTAuthentication
+from .cache import acached_response, conditional_response, enrollments_of
+from .models import DojoClass, Schedule
+from .prefetch import optimize_queryset
+from .serializers import DojoClassSerializer, ScheduleSerializer, UserSerializer
+
+User = get_user_model()
+
+_authenticator = StatelessJWTAuthentication()
+
+
+async def _authenticate(request):
+    """Returns (user, error_response); the token check itself needs no DB."""
+    try:
+        result = await sync_to_async(_authenticator.authenticate)(request)
+    except (AuthenticationFailed, InvalidToken) as exc:
+        return None, _json({"detail": str(exc.detail)}, status=401)
+    if result is None:
+        return None, _json({"detail": "Authentication credentials were not provided."}, status=401)
+    return result[0], None
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type="application/json", status=status)
+
+
+def _wants_plain_json(request):
+    # pagination, sparse fields etc. are handled by the DRF view
+    accept = request.headers.get("Accept", "application/json")
+    return request.method == "GET" and not request.GET and "text/html" not in accept
+
+
+_sync_class_list = sync_to_async(views.DojoClassListCreateView.as_view())
+_sync_schedule_list = sync_to_async(views.ScheduleListCreateView.as_view())
+
+
+async def _serialize(serializer_class, queryset):
+    serializer = serializer_class(many=True)
+    queryset = optimize_queryset(queryset, serializer)
+    rows = [obj async for obj in queryset]
+    # prefetches are already loaded, so this touches no DB
+    return serializer_class(rows, many=True).data
+
+
+@csrf_exempt
+async def class_list(request):
+    if not _wants_plain_json(request):
+        return await _sync_class_list(request)
+
+    async def build():
+        return await _serialize(DojoClassSerializer, DojoClass.objects.all())
+    return await acached_response(request, views.DojoClassListCreateView.cache_models, build)
+
+
+@csrf_exempt
+async def schedule_list(request):
+    if not _wants_plain_json(request):
+        return await _sync_schedule_list(request)
+
+    async def build():
+        return await _serialize(ScheduleSerializer, Schedule.objects.all())
+    return await acached_response(request, views.ScheduleListCreateView.cache_models, build)
+
+
+async def list_instructors(request):
+    if request.method != "GET":
+        return _json({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    async def build():
+        return await _serialize(UserSerializer, User.objects.filter(role="instructor"))
+    return await acached_response(request, (User,), build)
+
+
+async def student_schedule(request):
+    if request.method != "GET":
+        return _json({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    user, error = await _authenticate(request)
+    if error:
+        return error
+
+    async def build():
+        return await _serialize(ScheduleSerializer, views.student_schedules(user.id))
+    response = await acached_response(request, (Schedule, enrollments_of(user.id)), build, extra=f"student={user.id}")
+    response["Link"] = await sync_to_async(views.calendar_link)(request, user.id)
+    return response
+
+
+async def admin_stats(request):
+    if request.method != "GET":
+        return _json({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    user, error = await _authenticate(request)
+    if error:
+        return error
+    if getattr(user, "role", None) != "admin":
+        return _json({"detail": "Not authorized"}, status=403)
+
+    counters = await aggregates.aread_counters(
+        aggregates.role_key("student"), aggregates.CLASSES, aggregates.ENROLLMENTS, aggregates.role_key("instructor"),
+    )
+    data = {
+        "totalStudents": counters[aggregates.role_key("student")],
+        "totalClasses": counters[aggregates.CLASSES],
+        "totalEnrollments": counters[aggregates.ENROLLMENTS],
+        "activeInstructors": counters[aggregates.role_key("instructor")],
+    }
+    # same ETag as the sync view, so the 304 doesn't depend on SERVER_MODE
+    return conditional_response(request, data.values(), lambda: _json(data))
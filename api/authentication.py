@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+
+User = get_user_model()
+
+
+class ClaimsUser(TokenUser):
+    """
+    Request user built from the claims CustomTokenObtainPairSerializer puts in the token.
+    Good for role checks; views that need the real row should load it by `id`.
+    """
+
+    @cached_property
+    def role(self):
+        return self.token.get('role', 'student')
+
+
+class _ActiveStatusCache:
+    """
+    Per-process {user_id: (expires_at, is_active)} so revocation costs one query per TTL.
+    Holds at most `max_entries` users, least recently seen dropped first.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_active(self, user_id, ttl, max_entries=10000):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(user_id)
+            if hit and hit[0] > now:
+                self._entries.move_to_end(user_id)
+                return hit[1]
+
+        active = User.objects.filter(pk=user_id, is_active=True).exists()
+        with self._lock:
+            self._entries[user_id] = (now + ttl, active)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+        return active
+
+    def __len__(self):
+        return len(self._entries)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+active_status = _ActiveStatusCache()
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication without the per-request User lookup.
+
+    settings.STATELESS_JWT['ACTIVE_CACHE_TTL'] (seconds) controls how long a user's
+    active flag is trusted; 0 skips the check and makes authentication query-free.
+    ['ACTIVE_CACHE_SIZE'] caps how many users' flags each process remembers.
+    """
+
+    def get_user(self, validated_token):
+        user = ClaimsUser(super().get_user(validated_token).token)
+        config = getattr(settings, 'STATELESS_JWT', {})
+        ttl = config.get('ACTIVE_CACHE_TTL', 30)
+        if ttl and not active_status.is_active(user.id, ttl, config.get('ACTIVE_CACHE_SIZE', 10000)):
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
@@ -0,0 +1,367 @@
+"""
+Versioned response cache for the public read endpoints.
+
+Cached entries are keyed by the request URL plus a version number per model the
+response depends on. Saving or deleting one of those models bumps its version
+(see api/signals.py), so stale entries are never read again and simply age out.
+
+The backend is chosen by settings.RESPONSE_CACHE:
+
+    RESPONSE_CACHE = {
+        'BACKEND': 'api.cache.LocalLRUBackend',   # per-process, default
+        'OPTIONS': {'max_entries': 1000, 'timeout': 300},
+    }
+
+Versions decide ETags and 304s, so every worker must see the same bumps: with
+more than one (WEB_CONCURRENCY) the settings default to 'api.cache.DjangoCacheBackend'
+on the shared CACHES entry (file based on one host, Redis across hosts).
+
+Besides models, a response can depend on a narrower scope named by a string,
+such as enrollments_of(student_id), which is bumped on its own.
+
+ETags are derived from what determines a body (the cache key, or the
+row_version() of the rows a view would serialize plus the versions of the
+models nested in them), never by hashing the body, so a matching
+If-None-Match is answered with 304 before anything is built. Uncached
+list/detail views get that through ConditionalGetMixin.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Count, Max
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import rendering
+
+DEFAULT_CONFIG = {
+    'BACKEND': 'api.cache.LocalLRUBackend',
+    'OPTIONS': {},
+}
+
+
+class LocalLRUBackend:
+    """In-process LRU with per-entry TTL. Versions live outside the LRU so they are never evicted."""
+    # versions bumped here are invisible to other workers
+    per_process = True
+
+    def __init__(self, max_entries=1000, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_version(self, name):
+        with self._lock:
+            return self._versions.setdefault(name, time.time_ns())
+
+    def bump_version(self, name):
+        with self._lock:
+            self._versions[name] = self._versions.get(name, time.time_ns()) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+class DjangoCacheBackend:
+    """Delegates to a Django CACHES alias (Redis, file based, or locmem as a stand-in in tests)."""
+
+    def __init__(self, alias='default', timeout=300, prefix='api-response'):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(self._key(key), value, self.timeout if timeout is None else timeout)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def get_version(self, name):
+        key = self._key(f"version:{name}")
+        version = self.cache.get(key)
+        if version is None:
+            # a missing (evicted) version restarts from the clock, never from an old value
+            self.cache.add(key, time.time_ns(), None)
+            version = self.cache.get(key)
+        return version
+
+    def bump_version(self, name):
+        key = self._key(f"version:{name}")
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, time.time_ns(), None)
+
+    def clear(self):
+        self.cache.clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = {**DEFAULT_CONFIG, **getattr(settings, 'RESPONSE_CACHE', {})}
+                backend_class = import_string(config['BACKEND'])
+                workers = getattr(settings, 'WEB_CONCURRENCY', 1)
+                if getattr(backend_class, 'per_process', False) and workers > 1:
+                    # other workers would answer revalidations with 304 on versions they never saw bumped
+                    raise ImproperlyConfigured(
+                        f"RESPONSE_CACHE['BACKEND'] {config['BACKEND']} keeps versions per process, "
+                        f"but WEB_CONCURRENCY is {workers}; use api.cache.DjangoCacheBackend on a shared cache."
+                    )
+                _backend = backend_class(**config.get('OPTIONS', {}))
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    global _backend
+    if setting == 'RESPONSE_CACHE':
+        _backend = None
+
+
+def _version_name(model):
+    return model if isinstance(model, str) else model._meta.label_lower
+
+
+def enrollments_of(student_id):
+    """Version scope for responses built from one student's enrollments."""
+    return f"api.enrollment:student={student_id}"
+
+
+def bump_version(model):
+    """Invalidate every cached response that depends on `model` (a model or a scope name)."""
+    get_backend().bump_version(_version_name(model))
+    # bump again once the writing transaction commits, so a response cached from
+    # pre-commit data in the meantime is not served afterwards
+    transaction.on_commit(lambda: get_backend().bump_version(_version_name(model)))
+
+
+def version_of(model):
+    return get_backend().get_version(_version_name(model))
+
+
+def response_key(request, models, extra=''):
+    backend = get_backend()
+    versions = ','.join(str(backend.get_version(_version_name(m))) for m in models)
+    query = '&'.join(sorted(request.META.get('QUERY_STRING', '').split('&')))
+    return f"{request.path}?{query}|{extra}|{versions}"
+
+
+def compute_etag(*parts):
+    """Strong ETag from the inputs that determine a body."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b'\0')
+    return '"%s"' % digest.hexdigest()
+
+
+# api/compression.py tags compressed bodies "<etag>-<encoding>"
+_ENCODING_SUFFIX = re.compile(r'-(?:br|zstd|gzip)"$')
+
+
+def etag_matches(request, etag, exists=True):
+    """If-None-Match names `etag`, or is `*` and the resource exists (`*` matches any current representation)."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = {_ENCODING_SUFFIX.sub('"', tag) for tag in parse_etags(header)}
+    return (exists and '*' in tags) or etag in tags
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def row_version(queryset):
+    """
+    What changes when a row of `queryset` is added or saved: the latest
+    updated_at (an index lookup), or the row count and highest pk for models
+    without one. Deletions are caught by the model's cache version instead,
+    which api/signals.py bumps on delete.
+    """
+    if any(field.name == 'updated_at' for field in queryset.model._meta.concrete_fields):
+        fields = {'changed': Max('updated_at')}
+    else:
+        fields = {'rows': Count('pk'), 'last_pk': Max('pk')}
+    version = queryset.order_by().aggregate(**fields)
+    return tuple(version[name] for name in fields)
+
+
+def conditional_response(request, parts, build, exists=True):
+    """`build()` tagged with the ETag of `parts`, or a 304 when the client already has it."""
+    etag = compute_etag(request.get_full_path(), *parts)
+    if etag_matches(request, etag, exists):
+        return not_modified(etag)
+    response = build()
+    if response.status_code == 200 and not response.has_header('ETag'):
+        response['ETag'] = etag
+    return response
+
+
+def cached_response(request, models, build, extra=''):
+    """
+    Serve `build()` (a DRF Response, or pre-rendered JSON) from the cache when the client asked for JSON.
+    The stored entry is the rendered body and its ETag, so hits skip serialization
+    and rendering entirely; a matching If-None-Match gets a 304.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is not None and renderer.format != 'json':
+        return build()
+
+    backend = get_backend()
+    key = response_key(request, models, extra)
+    etag = compute_etag(key)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    entry = backend.get(key)
+    if entry is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+        # fast-path lists (api/fastpath.py) come back already rendered
+        if hasattr(response, 'data'):
+            with rendering():
+                body = JSONRenderer().render(response.data)
+        else:
+            body = response.content
+        entry = (body, etag)
+        backend.set(key, entry)
+
+    return entry_response(request, entry)
+
+
+def cached_content(request, models, build_body, content_type, extra=''):
+    """cached_response() for non-JSON bodies: `build_body()` returns the bytes to serve."""
+    backend = get_backend()
+    key = response_key(request, models, extra)
+    etag = compute_etag(key)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    entry = backend.get(key)
+    if entry is None:
+        entry = (build_body(), etag)
+        backend.set(key, entry)
+    return entry_response(request, entry, content_type)
+
+
+async def acached_response(request, models, abuild, extra=''):
+    """Async twin of cached_response(); `abuild()` is a coroutine returning plain data."""
+    backend = get_backend()
+    key = await sync_to_async(response_key)(request, models, extra)
+    etag = compute_etag(key)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    entry = await sync_to_async(backend.get)(key)
+    if entry is None:
+        data = await abuild()
+        with rendering():
+            entry = (JSONRenderer().render(data), etag)
+        await sync_to_async(backend.set)(key, entry)
+    return entry_response(request, entry)
+
+
+def entry_response(request, entry, content_type='application/json'):
+    body, etag = entry
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response = HttpResponse(body, content_type=content_type)
+    response['ETag'] = etag
+    return response
+
+
+class CachedListMixin:
+    """List views whose GET is served through cached_response(); set `cache_models`."""
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            request, self.cache_models, lambda: super(CachedListMixin, self).list(request, *args, **kwargs)
+        )
+
+
+class ConditionalGetMixin:
+    """
+    Generic list/detail views: GET is tagged from row_version() of the rows it
+    serializes plus the cache versions of its model and of `etag_models` (the
+    models nested in them), and a matching If-None-Match gets 304 without
+    serializing anything.
+    """
+    etag_models = ()
+
+    def get(self, request, *args, **kwargs):
+        parts, exists = self.etag_state()
+        return conditional_response(
+            request, parts, lambda: super(ConditionalGetMixin, self).get(request, *args, **kwargs), exists,
+        )
+
+    def etag_state(self):
+        """(ETag parts, whether the resource exists); a detail lookup matching no row doesn't."""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        detail = lookup in self.kwargs
+        if detail:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup]})
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        version = row_version(queryset)
+        parts = [
+            renderer.format if renderer else '',
+            version,
+            *(version_of(model) for model in (queryset.model, *self.etag_models)),
+        ]
+        # no rows: a NULL Max(updated_at), or a count of 0
+        return parts, not detail or any(version)
@@ -0,0 +1,186 @@
+"""
+Dated class sessions and attendance.
+
+A Schedule row says "Tuesdays 18:00-19:30"; ClassSession rows are the actual
+Tuesdays. `manage.py generate_sessions` (run it daily) creates them in bulk
+SESSIONS['WINDOW_DAYS'] ahead, so clients list dates instead of expanding
+recurrences and attendance has a row to point at. Re-running it only adds
+what is missing (unique_session_schedule_start). Editing a slot moves its
+future sessions nobody has checked into, to its new times or its new class,
+and deleting it drops them
+(api/signals.py); sessions with attendance are kept as they were.
+
+Check-in takes a batch of students for one session and costs the same few
+queries whatever the batch size: lock the session, read who is enrolled and
+who is already in, one INSERT, one counter UPDATE. Students beyond the
+session's capacity are turned away, and the counter UPDATE is conditional on
+the room left, as services.enroll() does for seats. The session's
+checked_in_count is its occupancy, so "who's in class now" is a range lookup
+on session_time_range_idx with the counts already on the rows.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Attendance, ClassSession, Enrollment, Schedule
+
+# slots are at most a day long (Schedule.sync_timetable), and so are their sessions
+MAX_LENGTH = datetime.timedelta(days=1)
+
+
+def _config():
+    return {
+        "WINDOW_DAYS": 28,
+        # how early before the start the front desk can check students in
+        "CHECK_IN_OPENS_MINUTES": 60,
+        **getattr(settings, "SESSIONS", {}),
+    }
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+
+
+def starting_between(start, end, queryset=None):
+    """Sessions starting on the dates [start, end), in the current time zone."""
+    queryset = ClassSession.objects.all() if queryset is None else queryset
+    return queryset.filter(starts_at__gte=_midnight(start), starts_at__lt=_midnight(end))
+
+
+def window(start=None, days=None):
+    """[start, end) dates covered by generation: from today, WINDOW_DAYS long."""
+    start = start or timezone.localdate()
+    return start, start + datetime.timedelta(days=days or _config()["WINDOW_DAYS"])
+
+
+def occurrences(schedule, start, end):
+    """(starts_at, ends_at) of each of the slot's dates in [start, end), in the current time zone."""
+    day = start + datetime.timedelta(days=(schedule.weekday_index - start.weekday()) % 7)
+    length = datetime.timedelta(minutes=schedule.end_minute - schedule.start_minute)
+    while day < end:
+        starts_at = timezone.make_aware(datetime.datetime.combine(day, schedule.start_time))
+        yield starts_at, starts_at + length
+        day += datetime.timedelta(days=7)
+
+
+def _session(schedule, starts_at, ends_at):
+    return ClassSession(
+        schedule=schedule, dojo_class_id=schedule.dojo_class_id, starts_at=starts_at, ends_at=ends_at,
+        location=schedule.location, capacity=schedule.dojo_class.capacity,
+    )
+
+
+def generate(start=None, days=None, schedules=None, batch_size=2000):
+    """Create the missing sessions of `schedules` (every slot) for the window; returns how many were added."""
+    start, end = window(start, days)
+    in_window = starting_between(start, end)
+    before = in_window.count()
+    if schedules is None:
+        schedules = Schedule.objects.select_related("dojo_class").order_by("pk").iterator(chunk_size=batch_size)
+    batch = []
+    for schedule in schedules:
+        batch.extend(_session(schedule, *dates) for dates in occurrences(schedule, start, end))
+        if len(batch) >= batch_size:
+            ClassSession.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        ClassSession.objects.bulk_create(batch, ignore_conflicts=True)
+    return in_window.count() - before
+
+
+def reschedule(schedule, using="default"):
+    """After `schedule` was saved: bring its future sessions nobody has checked into in line with it."""
+    now = timezone.now()
+    start, end = window()
+    expected = [dates for dates in occurrences(schedule, start, end) if dates[0] >= now]
+    starts = [starts_at for starts_at, _ in expected]
+    future = ClassSession.objects.using(using).filter(schedule=schedule, starts_at__gte=now)
+    with transaction.atomic(using=using):
+        # a slot moved to another class regenerates them like a move in time, capacity included
+        future.filter(checked_in_count=0).exclude(starts_at__in=starts, dojo_class_id=schedule.dojo_class_id).delete()
+        future.filter(starts_at__in=starts, dojo_class_id=schedule.dojo_class_id).update(
+            ends_at=F("starts_at") + datetime.timedelta(minutes=schedule.end_minute - schedule.start_minute),
+            location=schedule.location,
+        )
+        ClassSession.objects.using(using).bulk_create(
+            [_session(schedule, *dates) for dates in expected], ignore_conflicts=True,
+        )
+
+
+def unschedule(schedule, using="default"):
+    """Before `schedule` is deleted: drop its future sessions nobody has checked into."""
+    ClassSession.objects.using(using).filter(
+        schedule=schedule, starts_at__gte=timezone.now(), checked_in_count=0,
+    ).delete()
+
+
+def resize(dojo_class, using="default"):
+    """After the class capacity changed: carry it to the class's future sessions."""
+    ClassSession.objects.using(using).filter(
+        dojo_class=dojo_class, starts_at__gte=timezone.now(),
+    ).exclude(capacity=dojo_class.capacity).update(capacity=dojo_class.capacity)
+
+
+def running_at(moment=None, queryset=None):
+    """Sessions in progress at `moment` (now)."""
+    moment = moment or timezone.now()
+    queryset = ClassSession.objects.all() if queryset is None else queryset
+    # the length bound keeps this a starts_at range on session_time_range_idx
+    return queryset.filter(starts_at__gt=moment - MAX_LENGTH, starts_at__lte=moment, ends_at__gt=moment)
+
+
+def check_in(session_id, student_ids, now=None):
+    """
+    Check the students into the session. Students not enrolled in its class are
+    refused, and so are those arriving once it is at capacity (in the order given);
+    checking someone in twice is a no-op. Returns {"checked_in": [...],
+    "already_checked_in": [...], "not_enrolled": [...], "full": [...], "checked_in_count": n}.
+    """
+    now = now or timezone.now()
+    student_ids = list(dict.fromkeys(student_ids))
+    with transaction.atomic():
+        # the row lock queues concurrent batches for one session, so the counter stays exact
+        session = ClassSession.objects.select_for_update().get(pk=session_id)
+        opens = session.starts_at - datetime.timedelta(minutes=_config()["CHECK_IN_OPENS_MINUTES"])
+        if now < opens:
+            raise ValidationError({"session": f"Check-in opens at {timezone.localtime(opens):%Y-%m-%d %H:%M}."})
+
+        enrolled = set(
+            Enrollment.objects.filter(martial_class_id=session.dojo_class_id, student_id__in=student_ids)
+            .values_list("student_id", flat=True)
+        )
+        present = set(
+            Attendance.objects.filter(session=session, student_id__in=student_ids).values_list("student_id", flat=True)
+        )
+        arriving = [s for s in student_ids if s in enrolled and s not in present]
+        room = max(session.capacity - session.checked_in_count, 0)
+        admitted, full = arriving[:room], arriving[room:]
+        if admitted:
+            # bulk_create skips post_save, so the counter is bumped here, once
+            Attendance.objects.bulk_create(
+                Attendance(session=session, student_id=student_id, checked_in_at=now) for student_id in admitted
+            )
+            # single Attendance saves (api/signals.py) move the counter without the lock
+            if not ClassSession.objects.filter(
+                pk=session.pk, checked_in_count__lte=session.capacity - len(admitted)
+            ).update(checked_in_count=F("checked_in_count") + len(admitted)):
+                raise ValidationError({"session": "The session is full."})
+    return {
+        "checked_in": admitted,
+        "already_checked_in": [s for s in student_ids if s in present],
+        "not_enrolled": [s for s in student_ids if s not in enrolled and s not in present],
+        "full": full,
+        "checked_in_count": session.checked_in_count + len(admitted),
+    }
+
+
+def count_attendance(session_id, delta, using="default"):
+    """For single Attendance saves and deletes (api/signals.py); check_in() counts its own."""
+    sessions = ClassSession.objects.using(using).filter(pk=session_id)
+    if delta < 0:
+        sessions = sessions.filter(checked_in_count__gte=-delta)
+    sessions.update(checked_in_count=F("checked_in_count") + delta)
@@ -0,0 +1,183 @@
+"""
+Negotiated response compression.
+
+CompressionMiddleware encodes text and JSON responses with the best encoding
+the client accepts: brotli and zstd when their packages are installed, gzip
+always. Bodies smaller than COMPRESSION['MIN_SIZE'] go out as they are;
+streamed exports are compressed chunk by chunk. A compressed response keeps a
+strong ETag that names its encoding ("<tag>-br"), and etag_matches() in
+api/cache.py accepts either form back in If-None-Match.
+"""
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+_ACCEPT_ITEM = re.compile(r"^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$")
+
+
+def _config():
+    return {
+        "MIN_SIZE": 1024,
+        # preference when the client rates several encodings the same
+        "ENCODINGS": ("br", "zstd", "gzip"),
+        # fast settings: these run on every large response
+        "LEVELS": {"br": 4, "zstd": 3, "gzip": 6},
+        **getattr(settings, "COMPRESSION", {}),
+    }
+
+
+def _gzip(level):
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class _Brotli:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+# encoding -> factory for an object with compress(bytes) and flush()
+COMPRESSORS = {"gzip": _gzip}
+if brotli is not None:
+    COMPRESSORS["br"] = _Brotli
+if zstandard is not None:
+    COMPRESSORS["zstd"] = _Zstd
+
+
+def accepted_encodings(header):
+    """{encoding: q} from an Accept-Encoding header; unparseable items are ignored."""
+    accepted = {}
+    for item in header.split(","):
+        match = _ACCEPT_ITEM.match(item)
+        if match:
+            try:
+                accepted[match[1].lower()] = float(match[2]) if match[2] else 1.0
+            except ValueError:
+                continue
+    return accepted
+
+
+def choose_encoding(header, preference):
+    accepted = accepted_encodings(header)
+    best, best_q = None, 0.0
+    for name in preference:
+        if name not in COMPRESSORS:
+            continue
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(encoding, data, level):
+    compressor = COMPRESSORS[encoding](level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(encoding, chunks, level):
+    compressor = COMPRESSORS[encoding](level)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def acompress_stream(encoding, chunks, level):
+    compressor = COMPRESSORS[encoding](level)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encoded_etag(etag, encoding):
+    if etag.startswith('"') and etag.endswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return etag  # weak or malformed: leave it
+
+
+class CompressionMiddleware:
+    """Compress large text/JSON responses with the client's preferred encoding."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
+        if response.has_header("Content-Encoding") or not 200 <= response.status_code < 300:
+            return response
+        if response.status_code == 206:  # a byte range of the unencoded body
+            return response
+        content_type = response.get("Content-Type", "")
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        # the body differs by encoding even when we end up not compressing
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        config = _config()
+        if not response.streaming and len(response.content) < config["MIN_SIZE"]:
+            return response
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""), config["ENCODINGS"])
+        if encoding is None:
+            return response
+        level = config["LEVELS"][encoding]
+
+        if response.streaming:
+            stream = acompress_stream if response.is_async else compress_stream
+            response.streaming_content = stream(encoding, response.streaming_content, level)
+            del response["Content-Length"]
+        else:
+            body = compress(encoding, response.content, level)
+            if len(body) >= len(response.content):
+                return response
+            response.content = body
+            response["Content-Length"] = str(len(body))
+        if response.has_header("ETag"):
+            response["ETag"] = encoded_etag(response["ETag"], encoding)
+        response["Content-Encoding"] = encoding
+        return response
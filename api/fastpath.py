@@ -0,0 +1,208 @@
+"""
+Fast read path for large list responses.
+
+A RowMapper is compiled once from a serializer's read fields: it lists the
+columns to fetch with values_list() and knows how to turn each tuple into the
+dict the serializer would have produced, in the same key order and with the
+same field conversions. To-many nested serializers are filled from one extra
+query each, like the prefetch plan (api/prefetch.py) would. The result is
+rendered with orjson when it is installed (json otherwise), post-processed to
+the exact bytes DRF's JSONRenderer emits.
+
+Serializers with fields the mapper cannot reproduce (method fields, dotted
+sources, many-to-many, custom relations) are served by DRF as before.
+"""
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.http import HttpResponse
+from rest_framework import serializers
+
+from .metrics import rendering
+from .prefetch import _nested_serializer
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+# fields whose to_representation() returns the DB value unchanged
+PASSTHROUGH = (
+    serializers.CharField, serializers.EmailField, serializers.SlugField, serializers.URLField,
+    serializers.IntegerField, serializers.BooleanField, serializers.ChoiceField,
+)
+
+
+class Unsupported(Exception):
+    pass
+
+
+class RowMapper:
+    """values_list() columns plus a function mapping one row to the serializer's dict."""
+
+    def __init__(self, serializer):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        self.model = serializer.Meta.model
+        self.columns = []
+        self.many = []
+        self.map_row = self._compile(serializer, self.model, '')
+
+    def _column(self, path):
+        if path not in self.columns:
+            self.columns.append(path)
+        return self.columns.index(path)
+
+    def _compile(self, serializer, model, prefix):
+        steps = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source:
+                raise Unsupported(f"{type(serializer).__name__}.{name}")
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                raise Unsupported(f"{type(serializer).__name__}.{name}")
+
+            child, many = _nested_serializer(field)
+            if child is not None:
+                if model_field.many_to_many:
+                    raise Unsupported(f"{type(serializer).__name__}.{name}")
+                if many or model_field.one_to_many:
+                    plan = _ManyPlan(child, model_field)
+                    self.many.append(plan)
+                    steps.append((name, 'many', self._column(prefix + 'pk'), len(self.many) - 1))
+                else:
+                    fk = self._column(prefix + field.source)
+                    nested = self._compile(child, model_field.related_model, f"{prefix}{field.source}__")
+                    steps.append((name, 'one', fk, nested))
+            elif isinstance(field, serializers.RelatedField):
+                pk_only = (
+                    isinstance(field, serializers.PrimaryKeyRelatedField) and not field.pk_field
+                    and type(field).to_representation is serializers.PrimaryKeyRelatedField.to_representation
+                )
+                if not pk_only or not model_field.concrete:
+                    raise Unsupported(f"{type(serializer).__name__}.{name}")
+                steps.append((name, 'value', self._column(prefix + field.source), None))
+            else:
+                if model_field.is_relation or not model_field.concrete:
+                    raise Unsupported(f"{type(serializer).__name__}.{name}")
+                convert = None if type(field) in PASSTHROUGH else field.to_representation
+                steps.append((name, 'value', self._column(prefix + field.source), convert))
+
+        def map_row(row, pending):
+            out = {}
+            for name, kind, index, extra in steps:
+                value = row[index]
+                if kind == 'value':
+                    out[name] = value if extra is None or value is None else extra(value)
+                elif kind == 'one':
+                    out[name] = None if value is None else extra(row, pending)
+                else:
+                    out[name] = None  # keeps the key order; filled in by run()
+                    pending[extra].append((out, name, value))
+            return out
+        return map_row
+
+    def run(self, queryset, group_by=None):
+        """Rows of `queryset` as serializer dicts; with `group_by`, (group value, dict) pairs."""
+        columns = self.columns + [group_by] if group_by else self.columns
+        rows = queryset.prefetch_related(None).values_list(*columns)
+        pending = [[] for _ in self.many]
+        if group_by:
+            results = [(row[-1], self.map_row(row, pending)) for row in rows]
+        else:
+            results = [self.map_row(row, pending) for row in rows]
+        for plan, waiting in zip(self.many, pending):
+            if waiting:
+                plan.fill(waiting)
+        return results
+
+
+class _ManyPlan:
+    def __init__(self, serializer, relation):
+        self.mapper = RowMapper(serializer)
+        self.remote = relation.field.name
+
+    def fill(self, waiting):
+        # same rows and order as Prefetch(path, queryset=Model._default_manager.all())
+        keys = {key for _, _, key in waiting}
+        queryset = self.mapper.model._default_manager.filter(**{f"{self.remote}__in": keys})
+        grouped = defaultdict(list)
+        for key, item in self.mapper.run(queryset, group_by=self.remote):
+            grouped[key].append(item)
+        for out, name, key in waiting:
+            out[name] = grouped.get(key, [])
+
+
+_mappers = {}
+_mappers_lock = threading.Lock()
+
+
+def mapper_for(serializer, cacheable=True):
+    """The compiled RowMapper for `serializer`, or None if it can't be reproduced."""
+    key = type(serializer)
+    if cacheable and key in _mappers:
+        return _mappers[key]
+    try:
+        mapper = RowMapper(serializer)
+    except Unsupported:
+        mapper = None
+    if cacheable:
+        with _mappers_lock:
+            _mappers[key] = mapper
+    return mapper
+
+
+def render_json(data):
+    """Same bytes as rest_framework.renderers.JSONRenderer().render(data) for mapper output."""
+    body = None
+    if orjson is not None:
+        try:
+            body = orjson.dumps(data)
+        except TypeError:  # e.g. integers beyond 64 bits, lone surrogates
+            pass
+    if body is None:
+        body = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+    # JSONRenderer escapes these two for JavaScript compatibility
+    return body.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastListMixin:
+    """
+    List views: plain JSON GETs are answered through a RowMapper instead of the
+    serializer. Paginated requests, non-JSON renderers and serializers the mapper
+    can't reproduce use the regular list(). Off with settings.FAST_READS = False.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not self._fast_read_allowed(request):
+            return super().list(request, *args, **kwargs)
+        mapper = mapper_for(self.get_serializer(), cacheable=not request.query_params.keys() & {'fields', 'expand'})
+        if mapper is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        with rendering():
+            body = render_json(mapper.run(queryset))
+        return HttpResponse(body, content_type='application/json')
+
+    def get_queryset(self):
+        # both paths must list rows in the same order, so unordered lists go by pk
+        queryset = super().get_queryset()
+        return queryset if queryset.ordered else queryset.order_by('pk')
+
+    def _fast_read_allowed(self, request):
+        if not getattr(settings, 'FAST_READS', True):
+            return False
+        renderer = getattr(request, 'accepted_renderer', None)
+        if renderer is None or renderer.format != 'json' or 'indent' in (request.accepted_media_type or ''):
+            return False
+        paginator = self.paginator
+        if paginator is None:
+            return True
+        is_paginating = getattr(paginator, 'is_paginating', None)
+        return is_paginating is not None and not is_paginating(request)
@@ -0,0 +1,113 @@
+"""
+iCalendar (RFC 5545) feed of a student's weekly classes.
+
+Calendar apps poll a feed URL and cannot send an Authorization header, so the
+feed also accepts a signed `?token=` naming the student and their
+User.feed_token_version. The token does not expire; /api/student/schedule/
+hands it out in its Link header, and POST /api/student/calendar-token/ bumps
+the version so a leaked URL stops working. The version is read from the
+database on every use (a primary-key lookup): a cached copy would keep a
+revoked URL working in the workers that hadn't seen the bump.
+
+Times are written in UTC ("Z"), which needs no VTIMEZONE component.
+"""
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db.models import F
+from django.utils import timezone
+
+
+FEED_SALT = "api.ical.feed"
+
+User = get_user_model()
+
+
+def feed_version(student_id):
+    """The student's current feed token version, None for no such user."""
+    return User.objects.filter(pk=student_id).values_list("feed_token_version", flat=True).first()
+
+
+def feed_token(student_id):
+    return signing.dumps([student_id, feed_version(student_id)], salt=FEED_SALT)
+
+
+def student_for_token(token):
+    try:
+        payload = signing.loads(token, salt=FEED_SALT)
+    except signing.BadSignature:
+        return None
+    # tokens from before versioning signed the bare id; they count as version 0
+    student_id, version = payload if isinstance(payload, list) else (payload, 0)
+    if version is None or feed_version(student_id) != version:
+        return None
+    return student_id
+
+
+def rotate(student_id):
+    """Revoke the student's feed URLs; returns the new token."""
+    User.objects.filter(pk=student_id).update(feed_token_version=F("feed_token_version") + 1)
+    return feed_token(student_id)
+
+
+def _escape(text):
+    return (
+        str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line):
+    # content lines are limited to 75 octets; continuations start with a space
+    data = line.encode()
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74
+        while cut and (data[cut] & 0xC0) == 0x80:  # don't split a UTF-8 sequence
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+    parts.append(data)
+    return b"\r\n ".join(parts)
+
+
+def _first_occurrence(start, weekday_index):
+    return start + datetime.timedelta(days=(weekday_index - start.weekday()) % 7)
+
+
+def render(schedules):
+    """
+    One weekly recurring VEVENT per schedule. Each schedule needs `dojo_class`
+    loaded and an `enrolled_on` date; the series starts on the first matching
+    weekday from then, which also keeps the output stable for ETags.
+    """
+    local = timezone.get_default_timezone()
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Dojo Backend//Class Schedule//EN",
+        "CALSCALE:GREGORIAN",
+        "X-WR-CALNAME:My classes",
+    ]
+    for schedule in schedules:
+        day = _first_occurrence(schedule.enrolled_on, schedule.weekday_index)
+        start = datetime.datetime.combine(day, schedule.start_time)
+        end = datetime.datetime.combine(day, schedule.end_time)
+        if end <= start:
+            end += datetime.timedelta(days=1)
+        # slot times are wall-clock times in TIME_ZONE
+        start = timezone.make_aware(start, local).astimezone(datetime.timezone.utc)
+        end = timezone.make_aware(end, local).astimezone(datetime.timezone.utc)
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:schedule-{schedule.pk}@dojo-backend",
+            f"DTSTAMP:{schedule.enrolled_on:%Y%m%d}T000000Z",
+            f"DTSTART:{start:%Y%m%dT%H%M%S}Z",
+            f"DTEND:{end:%Y%m%dT%H%M%S}Z",
+            "RRULE:FREQ=WEEKLY",
+            f"SUMMARY:{_escape(schedule.dojo_class.name)}",
+            f"LOCATION:{_escape(schedule.location)}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return b"\r\n".join(_fold(line) for line in lines) + b"\r\n"
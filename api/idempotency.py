@@ -0,0 +1,132 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client that may retry a POST sends a unique Idempotency-Key header. The
+first request with a key claims an IdempotencyRecord row before the view runs
+and stores the response once it has one; a retry with the same key (from the
+same caller to the same path) gets that stored response back after a single
+indexed lookup, without running validation or touching the business tables.
+
+- a retry that arrives while the first request is still running gets 409
+- reusing a key for a different body gets 422
+- 5xx responses and unhandled errors release the key so the retry runs again
+- records expire after IDEMPOTENCY['TTL_SECONDS'] (`manage.py sweep_idempotency`)
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+HEADER = "Idempotency-Key"
+# response headers worth replaying
+REPLAYED_HEADERS = ("Location", "Preference-Applied")
+
+
+def _config():
+    return {"TTL_SECONDS": 24 * 3600, "LOCK_SECONDS": 60, **getattr(settings, "IDEMPOTENCY", {})}
+
+
+def _sha256(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def record_key(request, key):
+    user = request.user.pk if request.user and request.user.is_authenticated else "anonymous"
+    return _sha256(user, request.path, key)
+
+
+def fingerprint(request):
+    return _sha256(request.method, request.get_full_path(), request.body)
+
+
+def _error(code, detail, **headers):
+    return Response({"detail": detail}, status=code, headers=headers)
+
+
+def claim(key, fingerprint):
+    """(record, None) if this request should run, or (None, response) to answer with instead."""
+    now = timezone.now()
+    config = _config()
+    # retries are the common case here, so look before trying to insert
+    record = IdempotencyRecord.objects.filter(key=key).first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                record = IdempotencyRecord.objects.create(
+                    key=key, fingerprint=fingerprint, expires_at=now + timedelta(seconds=config["TTL_SECONDS"]),
+                )
+            return record, None
+        except IntegrityError:
+            # a concurrent first attempt got there first
+            return claim(key, fingerprint)
+
+    abandoned = record.status_code is None and record.created_at < now - timedelta(seconds=config["LOCK_SECONDS"])
+    if record.expires_at <= now or abandoned:
+        # expired, or its request died half way: start over with this one
+        IdempotencyRecord.objects.filter(pk=record.pk).delete()
+        return claim(key, fingerprint)
+    if record.fingerprint != fingerprint:
+        return None, _error(
+            status.HTTP_422_UNPROCESSABLE_ENTITY, f"This {HEADER} was already used for a different request."
+        )
+    if record.status_code is None:
+        return None, _error(
+            status.HTTP_409_CONFLICT, f"A request with this {HEADER} is still being processed.", **{"Retry-After": "1"}
+        )
+    return None, Response(
+        record.response, status=record.status_code, headers={**record.headers, "Idempotent-Replayed": "true"}
+    )
+
+
+def complete(record, response):
+    if response.status_code >= 500:
+        record.delete()
+        return
+    record.status_code = response.status_code
+    record.response = response.data
+    record.headers = {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)}
+    record.save(update_fields=["status_code", "response", "headers"])
+
+
+def sweep(batch_size=5000):
+    """Delete expired records in batches; returns how many went."""
+    removed = 0
+    expired = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now())
+    while True:
+        ids = list(expired.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += IdempotencyRecord.objects.filter(pk__in=ids).delete()[0]
+
+
+class IdempotentCreateMixin:
+    """Honour Idempotency-Key on POST; requests without the header are unaffected."""
+
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().post(request, *args, **kwargs)
+        if len(key) > 255:
+            return _error(status.HTTP_400_BAD_REQUEST, f"{HEADER} must be at most 255 characters.")
+
+        record, response = claim(record_key(request, key), fingerprint(request))
+        if response is not None:
+            return response
+        try:
+            response = super().post(request, *args, **kwargs)
+        except Exception:
+            # validation and permission errors too: the retry gets a fresh answer
+            record.delete()
+            raise
+        complete(record, response)
+        return response
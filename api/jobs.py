@@ -0,0 +1,198 @@
+"""
+Database-backed background jobs.
+
+Views enqueue() work instead of doing it on the request thread; `manage.py
+runworker` claims due jobs and runs the registered task function with the
+job's JSON payload. The queue is the api_job table, so a job enqueued inside
+a request's transaction only becomes visible to workers once that commits.
+
+A failing job is retried with exponential backoff (plus jitter) until it has
+used max_attempts; PermanentError (and DRF's ValidationError) fail it at once.
+While a job runs its worker renews the lease (locked_at) every third of
+LEASE_SECONDS, so only jobs left running by a worker that died are queued
+again; a worker that lost its lease anyway does not overwrite the new run.
+An idempotency key makes enqueue() return the existing job for a repeated
+request instead of queueing the work twice.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import Job
+from .serializers import JobSerializer
+
+logger = logging.getLogger("api.jobs")
+
+_tasks = {}
+
+
+def _config():
+    return {
+        "BACKOFF_SECONDS": 5,
+        "MAX_BACKOFF_SECONDS": 600,
+        "LEASE_SECONDS": 300,
+        **getattr(settings, "JOBS", {}),
+    }
+
+
+class PermanentError(Exception):
+    """Raised by a task when retrying cannot help."""
+
+
+def task(name, max_attempts=5):
+    """Register `fn(payload)` as the task `name`; its return value (JSON) is stored on the job."""
+    def register(fn):
+        _tasks[name] = (fn, max_attempts)
+        return fn
+    return register
+
+
+def enqueue(name, payload, key=None, user=None, delay=0):
+    """Queue `name` with `payload`; with `key`, a job already queued under it is returned instead."""
+    _, max_attempts = _tasks[name]
+    fields = {
+        "task": name,
+        "payload": payload,
+        "max_attempts": max_attempts,
+        "run_at": timezone.now() + timedelta(seconds=delay),
+        "created_by": user if getattr(user, "pk", None) else None,
+    }
+    if key is None:
+        return Job.objects.create(**fields)
+    key = f"{name}:{key}"[:255]
+    try:
+        with transaction.atomic():
+            return Job.objects.create(idempotency_key=key, **fields)
+    except IntegrityError:
+        return Job.objects.get(idempotency_key=key)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def requeue_stale():
+    """Put back jobs whose worker stopped without finishing them."""
+    cutoff = timezone.now() - timedelta(seconds=_config()["LEASE_SECONDS"])
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_by="", locked_at=None,
+    )
+
+
+def renew(job):
+    """Push back the lease on `job`; False once another worker has taken it over."""
+    return bool(Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(
+        locked_at=timezone.now(),
+    ))
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a running job's lease until stopped."""
+
+    def __init__(self, job):
+        super().__init__(name=f"heartbeat-{job.pk}", daemon=True)
+        self.job = job
+        self.interval = _config()["LEASE_SECONDS"] / 3
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                if not renew(self.job):
+                    return
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.join()
+
+
+def claim(worker, batch=10):
+    """Take the oldest due job for `worker`, or None. Safe with any number of workers."""
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by("run_at", "id")
+    for pk in due.values_list("pk", flat=True)[:batch]:
+        # compare-and-set: only one worker's update matches a still-queued row
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1,
+        ):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def backoff(attempts):
+    config = _config()
+    delay = min(config["BACKOFF_SECONDS"] * 2 ** (attempts - 1), config["MAX_BACKOFF_SECONDS"])
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run(job):
+    """Run a claimed job and record the outcome."""
+    entry = _tasks.get(job.task)
+    try:
+        if entry is None:
+            raise PermanentError(f"Unknown task {job.task!r}.")
+        with _Heartbeat(job):
+            result = entry[0](job.payload)
+    except Exception as exc:
+        permanent = isinstance(exc, (PermanentError, ValidationError))
+        job.error = "".join(traceback.format_exception_only(exc)).strip()
+        if isinstance(exc, ValidationError):
+            job.result = {"errors": exc.detail}
+        if permanent or job.attempts >= job.max_attempts:
+            job.status, job.finished_at = Job.FAILED, timezone.now()
+            logger.error("job %s failed after %d attempt(s): %s", job, job.attempts, job.error)
+        else:
+            job.status, job.run_at = Job.QUEUED, timezone.now() + timedelta(seconds=backoff(job.attempts))
+            logger.warning("job %s attempt %d failed, retrying at %s: %s", job, job.attempts, job.run_at, job.error)
+    else:
+        job.status, job.result, job.error, job.finished_at = Job.SUCCEEDED, result, "", timezone.now()
+    # fenced on the lease: a job requeued while this worker stalled belongs to its new run
+    finished = Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(
+        status=job.status, result=job.result, error=job.error, run_at=job.run_at,
+        finished_at=job.finished_at, locked_by="", locked_at=None,
+    )
+    if not finished:
+        logger.warning("job %s lost its lease before finishing; outcome discarded", job)
+    job.locked_by, job.locked_at = "", None
+    return job
+
+
+def work_once(worker=None):
+    """Claim and run one job; returns it, or None when nothing is due."""
+    job = claim(worker or worker_name())
+    return run(job) if job is not None else None
+
+
+def prefers_async(request):
+    """RFC 7240 `Prefer: respond-async`."""
+    prefer = request.headers.get("Prefer", "")
+    return "respond-async" in (token.strip().lower() for token in prefer.split(","))
+
+
+def accepted(request, job):
+    """202 pointing at the job's status URL."""
+    url = reverse("job-detail", args=[job.pk])
+    return Response(
+        JobSerializer(job).data,
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": request.build_absolute_uri(url), "Preference-Applied": "respond-async"},
+    )
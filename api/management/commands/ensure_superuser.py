@@ -0,0 +1,26 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the superuser named by DJANGO_SUPERUSER_USERNAME / _EMAIL / _PASSWORD if it doesn't exist. "
+        "Safe to run on every release; does nothing when the variables aren't set."
+    )
+
+    def handle(self, *args, **options):
+        username = os.environ.get("DJANGO_SUPERUSER_USERNAME")
+        password = os.environ.get("DJANGO_SUPERUSER_PASSWORD")
+        if not (username and password):
+            self.stdout.write("DJANGO_SUPERUSER_USERNAME/PASSWORD not set; skipped.")
+            return
+        User = get_user_model()
+        if User.objects.filter(username=username).exists():
+            self.stdout.write(f"Superuser {username} exists.")
+            return
+        User.objects.create_superuser(
+            username=username, email=os.environ.get("DJANGO_SUPERUSER_EMAIL", ""), password=password,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Created superuser {username}."))
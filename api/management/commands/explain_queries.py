@@ -0,0 +1,115 @@
+import re
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+from api.models import DojoClass, Enrollment, Payment, Schedule, WaitlistEntry
+from api.pagination import EnrollmentPagination, PaymentPagination
+from api.timetable import overlapping, running_at
+from api.views import student_schedules
+
+User = get_user_model()
+
+# sequential scans in EXPLAIN output, per backend; SQLite's "SCAN t USING INDEX" is an index walk
+SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)(?! USING)(?:\s|$)'),
+}
+
+
+def access_patterns():
+    """(name, queryset) for the lookups behind each endpoint, with ids sampled from the data."""
+    student = User.objects.filter(role='student', enrollment__isnull=False).order_by('pk').first()
+    enrollment = Enrollment.objects.order_by('pk').first()
+    schedule = Schedule.objects.select_related('dojo_class').order_by('pk').first()
+    payment = Payment.objects.order_by('pk').first()
+    if not all([student, enrollment, schedule, payment]):
+        raise CommandError("Database is empty; run `manage.py seed_data` first.")
+    class_id = enrollment.martial_class_id
+
+    enrollment_seek = EnrollmentPagination().seek_filter([enrollment.date_enrolled, enrollment.pk])
+    payment_seek = PaymentPagination().seek_filter([payment.date, payment.pk])
+    return [
+        # users
+        ("user_list ?role=", User.objects.filter(role='student').order_by('pk')[:50]),
+        ("instructor-list", User.objects.filter(role='instructor').order_by('pk')),
+        ("role choice lookup", User.objects.filter(role='student', pk=student.pk)),
+        ("role counters", User.objects.values_list('role').annotate(n=Count('id')).order_by()),
+        # enrollments
+        ("enrollment page 1", Enrollment.objects.order_by('date_enrolled', 'id')[:50]),
+        ("enrollment page n", Enrollment.objects.filter(enrollment_seek).order_by('date_enrolled', 'id')[:50]),
+        ("enrollments of student", Enrollment.objects.filter(student_id=student.pk)),
+        ("duplicate enrollment check",
+         Enrollment.objects.filter(student_id=student.pk, martial_class_id=class_id)[:1]),
+        ("class roster prefetch", Enrollment.objects.filter(martial_class_id__in=[class_id])),
+        ("student-schedule", student_schedules(student.pk)),
+        ("waitlist head", WaitlistEntry.objects.filter(martial_class_id=class_id).order_by('created_at', 'id')[:1]),
+        # payments
+        ("payment page 1", Payment.objects.order_by('date', 'id')[:50]),
+        ("payment page n", Payment.objects.filter(payment_seek).order_by('date', 'id')[:50]),
+        ("payment export range",
+         Payment.objects.filter(date__gte=payment.date, date__lte=payment.date).order_by('date', 'id')),
+        ("payments of enrollment", Payment.objects.filter(enrollment_id=enrollment.pk)),
+        ("payment totals rebuild",
+         Payment.objects.annotate(month=TruncMonth('date')).values('status', 'month')
+         .annotate(count=Count('id'), amount=Sum('amount')).order_by()),
+        # schedules
+        ("class schedules prefetch", Schedule.objects.filter(dojo_class_id__in=[class_id])),
+        ("timetable ?at=", running_at(schedule.start_minute).order_by('start_minute', 'location', 'id')),
+        ("location conflicts", overlapping(
+            schedule.start_minute, schedule.end_minute, Schedule.objects.filter(location=schedule.location))),
+        ("instructor conflicts", overlapping(
+            schedule.start_minute, schedule.end_minute,
+            Schedule.objects.filter(dojo_class__instructor_id=schedule.dojo_class.instructor_id))),
+        ("classes by instructor", DojoClass.objects.filter(instructor_id=schedule.dojo_class.instructor_id)),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN the queryset behind each endpoint and flag sequential scans. "
+        "Plans only mean something on realistic data: seed it first, e.g. "
+        "`manage.py seed_data --students 50000 --enrollments 1000000 --payments 1000000`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Times each query is run for the timing column.")
+        parser.add_argument("--verbose-plans", action="store_true", help="Print every plan, not just flagged ones.")
+        parser.add_argument("--fail-on-scan", action="store_true", help="Exit non-zero if any plan has a sequential scan.")
+        parser.add_argument("--only", action="append", help="Pattern name to check (repeatable).")
+
+    def handle(self, *args, **opts):
+        scan = SCAN_PATTERNS.get(connection.vendor)
+        if scan is None:
+            self.stderr.write(f"Don't know how to read {connection.vendor} plans; printing them unchecked.")
+
+        flagged = []
+        self.stdout.write(f"{'access pattern':30} {'median ms':>10}  plan")
+        for name, queryset in access_patterns():
+            if opts["only"] and name not in opts["only"]:
+                continue
+            plan = queryset.explain()
+            scanned = sorted(set(scan.findall(plan))) if scan else []
+
+            timings = []
+            for _ in range(max(opts["repeat"], 1)):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+
+            verdict = f"SEQ SCAN {', '.join(scanned)}" if scanned else "indexed"
+            line = f"{name:30} {statistics.median(timings):>10.2f}  {verdict}"
+            self.stdout.write(self.style.WARNING(line) if scanned else line)
+            if scanned or opts["verbose_plans"]:
+                self.stdout.write("    " + plan.replace("\n", "\n    "))
+            if scanned:
+                flagged.append(name)
+
+        if flagged and opts["fail_on_scan"]:
+            raise CommandError(f"Sequential scans in: {', '.join(flagged)}")
+        self.stdout.write(self.style.SUCCESS(f"{len(flagged)} pattern(s) with sequential scans."))
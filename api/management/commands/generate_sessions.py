@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api import class_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the dated class sessions of every schedule slot for SESSIONS['WINDOW_DAYS'] from today. "
+        "Idempotent; run it daily (cron or a scheduler) to keep the window rolling."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First date, YYYY-MM-DD (default: today).")
+        parser.add_argument("--days", type=int, help="Window length (default: SESSIONS['WINDOW_DAYS']).")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Rows inserted per statement.")
+
+    def handle(self, *args, **options):
+        start = None
+        if options["start"]:
+            start = parse_date(options["start"])
+            if start is None:
+                raise CommandError("--start must be YYYY-MM-DD.")
+        created = class_sessions.generate(start, options["days"], batch_size=options["batch_size"])
+        first, end = class_sessions.window(start, options["days"])
+        last = end - datetime.timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Created {created} session(s) for {first} to {last}."))
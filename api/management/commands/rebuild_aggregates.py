@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute report counters, payment totals and class enrollment counts from the base tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Only compare the stored aggregates with the base tables; exit non-zero on drift.",
+        )
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            problems = aggregates.verify()
+            for problem in problems:
+                self.stderr.write(problem)
+            if problems:
+                raise CommandError(f"{len(problems)} aggregate(s) out of date; run rebuild_aggregates.")
+            self.stdout.write(self.style.SUCCESS("Aggregates match the base tables."))
+            return
+
+        aggregates.rebuild()
+        self.stdout.write(self.style.SUCCESS("Aggregates rebuilt."))
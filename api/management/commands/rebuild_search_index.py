@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Recreate the search entries for every class and user (after bulk loads or a restore)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Rows inserted per statement.")
+
+    def handle(self, *args, **options):
+        search.rebuild(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
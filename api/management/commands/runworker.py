@@ -0,0 +1,67 @@
+import signal
+import threading
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs from the api_job queue. Each thread claims and runs one job at a "
+        "time; run more workers (processes or hosts) to scale out, they never take the same job."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4, help="Jobs run concurrently by this process.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Run every job that is due, then exit.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        counts, counts_lock = Counter(), threading.Lock()
+        name = jobs.worker_name()
+
+        def work(thread_name):
+            try:
+                while not stop.is_set():
+                    close_old_connections()
+                    job = jobs.work_once(thread_name)
+                    if job is not None:
+                        with counts_lock:
+                            counts[job.status] += 1
+                    elif options["once"]:
+                        return
+                    else:
+                        stop.wait(options["poll_interval"])
+            finally:
+                connection.close()
+
+        def shutdown(signum, frame):
+            self.stdout.write("Finishing running jobs, then stopping.")
+            stop.set()
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, shutdown)
+            signal.signal(signal.SIGINT, shutdown)
+
+        stale = jobs.requeue_stale()
+        if stale:
+            self.stdout.write(f"Requeued {stale} job(s) left running by a stopped worker.")
+
+        threads = [
+            threading.Thread(target=work, args=(f"{name}/{i}",), daemon=True)
+            for i in range(max(options["threads"], 1))
+        ]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=options["poll_interval"])
+            if not options["once"] and not stop.is_set():
+                jobs.requeue_stale()
+
+        ran = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} job(s), {counts[jobs.Job.FAILED]} failed."))
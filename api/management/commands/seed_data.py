@@ -0,0 +1,149 @@
+import datetime
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import aggregates, class_sessions, search
+from api.cache import bump_version
+from api.models import DojoClass, Enrollment, Payment, Schedule
+
+User = get_user_model()
+
+LOCATIONS = ["Main Dojo", "Studio A", "Studio B", "Outdoor Mat", "Annex"]
+WEEKDAYS = [code for code, _ in Schedule.WEEKDAY_CHOICES]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic dataset for benchmarks. "
+        "Everything is written with bulk_create in batches, so millions of rows are fine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--instructors", type=int, default=200)
+        parser.add_argument("--students", type=int, default=10000)
+        parser.add_argument("--classes", type=int, default=2000)
+        parser.add_argument("--schedules-per-class", type=int, default=3)
+        parser.add_argument("--enrollments", type=int, default=200000)
+        parser.add_argument("--payments", type=int, default=200000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=1234)
+        parser.add_argument(
+            "--admin-password", default="bench-pass",
+            help="Password for the 'bench-admin' user the benchmark driver logs in as.",
+        )
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        self.batch_size = opts["batch_size"]
+        today = datetime.date.today()
+
+        admin, _ = User.objects.get_or_create(username="bench-admin", defaults={"role": "admin", "is_staff": True})
+        admin.set_password(opts["admin_password"])
+        admin.save()
+
+        run = rng.randrange(10**6)  # keeps usernames unique across repeated runs
+        instructors = self.bulk(User, (
+            User(username=f"bench-i{run}-{i}", first_name="Sensei", last_name=str(i),
+                 email=f"sensei{i}@example.com", role="instructor", password="!")
+            for i in range(opts["instructors"])
+        ))
+        students = self.bulk(User, (
+            User(username=f"bench-s{run}-{i}", first_name="Student", last_name=str(i),
+                 email=f"student{i}@example.com", role="student", password="!")
+            for i in range(opts["students"])
+        ))
+        self.stdout.write(f"users: {len(instructors)} instructors, {len(students)} students")
+
+        per_class = -(-opts["enrollments"] // max(opts["classes"], 1))  # ceil
+        classes = self.bulk(DojoClass, (
+            DojoClass(
+                name=f"{rng.choice(['Karate', 'Judo', 'BJJ', 'Aikido', 'Kendo', 'Taekwondo'])} {i}",
+                description=f"Synthetic class {i}",
+                instructor_id=rng.choice(instructors).pk,
+                schedule="",
+                capacity=per_class + rng.randrange(0, 20),
+            )
+            for i in range(opts["classes"])
+        ))
+        self.stdout.write(f"classes: {len(classes)}")
+
+        def rooms():
+            # every (room, weekday, hour) cell is used once, so no location is double-booked
+            cells = [(weekday, hour) for weekday in WEEKDAYS for hour in range(6, 21)]
+            room = -(-Schedule.objects.count() // len(cells))  # rooms from earlier runs stay untouched
+            while True:
+                name = LOCATIONS[room % len(LOCATIONS)] + (f" {room // len(LOCATIONS) + 1}" if room >= len(LOCATIONS) else "")
+                yield from ((name, weekday, hour) for weekday, hour in rng.sample(cells, len(cells)))
+                room += 1
+
+        def schedules():
+            slots = rooms()
+            for dojo_class in classes:
+                for _ in range(opts["schedules_per_class"]):
+                    location, weekday, hour = next(slots)
+                    schedule = Schedule(
+                        dojo_class_id=dojo_class.pk, weekday=weekday,
+                        start_time=datetime.time(hour, 0), end_time=datetime.time(hour, 50),
+                        location=location,
+                    )
+                    schedule.sync_timetable()
+                    yield schedule
+        self.stdout.write(f"schedules: {len(self.bulk(Schedule, schedules()))}")
+
+        student_ids = [s.pk for s in students]
+
+        def enrollments():
+            remaining = opts["enrollments"]
+            for dojo_class in classes:
+                n = min(remaining, per_class, len(student_ids))
+                for student_id in rng.sample(student_ids, n):
+                    yield Enrollment(student_id=student_id, martial_class_id=dojo_class.pk)
+                remaining -= n
+                if not remaining:
+                    return
+        enrollment_ids = [e.pk for e in self.bulk(Enrollment, enrollments(), backdate="date_enrolled", rng=rng, today=today)]
+        self.stdout.write(f"enrollments: {len(enrollment_ids)}")
+
+        payments = self.bulk(Payment, (
+            Payment(
+                enrollment_id=rng.choice(enrollment_ids),
+                amount=f"{rng.randrange(20, 200)}.00",
+                status=rng.choice(["paid", "paid", "paid", "pending"]),
+            )
+            for _ in range(opts["payments"] if enrollment_ids else 0)
+        ), backdate="date", rng=rng, today=today)
+        self.stdout.write(f"payments: {len(payments)}")
+
+        # bulk_create skipped the signals: recompute counters and drop cached responses
+        aggregates.rebuild()
+        search.rebuild()
+        class_sessions.generate(batch_size=self.batch_size)
+        for model in (User, DojoClass, Schedule):
+            bump_version(model)
+        self.stdout.write(self.style.SUCCESS("Seeded. Log in as bench-admin to benchmark."))
+
+    def bulk(self, model, objs, backdate=None, rng=None, today=None):
+        """bulk_create in batches; `backdate` spreads an auto_now_add date over the last year."""
+        created, batch = [], []
+
+        def flush():
+            with transaction.atomic():
+                rows = model.objects.bulk_create(batch)
+                if backdate:
+                    # auto_now_add wins on insert, so each batch gets its date afterwards
+                    day = today - datetime.timedelta(days=rng.randrange(365))
+                    model.objects.filter(pk__in=[r.pk for r in rows]).update(**{backdate: day})
+            # keep only what later steps need: the primary key
+            created.extend(model(pk=r.pk) for r in rows)
+            batch.clear()
+
+        for obj in objs:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+        return created
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api import sync
+
+
+class Command(BaseCommand):
+    help = "Delete sync tombstones older than SYNC['TOMBSTONE_DAYS']. Run it periodically (cron or a scheduler)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows deleted per statement.")
+
+    def handle(self, *args, **options):
+        removed = sync.sweep(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} tombstone(s)."))
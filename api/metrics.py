@@ -0,0 +1,265 @@
+"""
+Per-request instrumentation: query count and time, render time and total time.
+
+RequestMetricsMiddleware records each request under its URL name from
+api/urls.py, adds a Server-Timing header (for staff only, unless
+REQUEST_METRICS['SERVER_TIMING'] says otherwise), feeds the in-process histograms
+exposed at /api/metrics/ (Prometheus text format), and logs the query
+fingerprints of requests slower than REQUEST_METRICS['SLOW_REQUEST_MS'].
+
+Queries are counted by an execute wrapper installed on every connection; it
+finds the current request through a contextvar, so it also sees queries that
+async views run in sync_to_async threads.
+
+Render time is serialization plus encoding, measured where each happens:
+`rendering()` blocks around serializer output (api/serializers.py), fast-path
+rows (api/fastpath.py) and cached bodies (api/cache.py), and DRF's own
+Response.render(). Queries run inside a block count as db time, not render
+time; cache hits render nothing and report zero.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger("api.slow_requests")
+
+# seconds; upper bounds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+def _config():
+    return {"ENABLED": True, "SLOW_REQUEST_MS": 500, "SERVER_TIMING": "staff", **getattr(settings, "REQUEST_METRICS", {})}
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "render_start", "render_time", "rendering")
+
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+        self.render_start = None
+        self.render_time = 0.0
+        self.rendering = False
+
+
+@contextmanager
+def rendering():
+    """Add the block to the current request's render time; nested blocks count once."""
+    stats = _current.get()
+    if stats is None or stats.rendering:
+        yield
+        return
+    stats.rendering = True
+    start, db_time = time.perf_counter(), stats.db_time
+    try:
+        yield
+    finally:
+        stats.rendering = False
+        # lazy querysets evaluated while serializing are database time
+        stats.render_time += time.perf_counter() - start - (stats.db_time - db_time)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - start
+        stats.queries.append(sql)
+
+
+def _install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+@receiver(connection_created)
+def _install_on_new_connection(sender, connection, **kwargs):
+    _install(connection)
+
+
+_NUMBER = re.compile(r"\b\d+\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r"IN \((?:%s|\?)(?:,\s*(?:%s|\?))*\)")
+
+
+def fingerprint(sql):
+    """Collapse literals and IN lists so repeated queries (N+1s) group together."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+class _Series:
+    __slots__ = ("count", "total", "buckets", "queries", "db_time", "render_time")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+
+class MetricsRegistry:
+    """Cumulative per-endpoint histograms; Prometheus derives rates and quantiles from them."""
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, duration, queries, db_time, render_time):
+        with self._lock:
+            series = self._series.get(endpoint)
+            if series is None:
+                series = self._series[endpoint] = _Series()
+            series.count += 1
+            series.total += duration
+            series.queries += queries
+            series.db_time += db_time
+            series.render_time += render_time
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    series.buckets[i] += 1
+                    break
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        with self._lock:
+            snapshot = {name: (s.count, s.total, list(s.buckets), s.queries, s.db_time, s.render_time)
+                        for name, s in sorted(self._series.items())}
+
+        lines = [
+            "# HELP api_request_duration_seconds Request latency by endpoint.",
+            "# TYPE api_request_duration_seconds histogram",
+        ]
+        for name, (count, total, buckets, *_rest) in snapshot.items():
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'api_request_duration_seconds_bucket{{endpoint="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'api_request_duration_seconds_bucket{{endpoint="{name}",le="+Inf"}} {count}')
+            lines.append(f'api_request_duration_seconds_sum{{endpoint="{name}"}} {total:.6f}')
+            lines.append(f'api_request_duration_seconds_count{{endpoint="{name}"}} {count}')
+
+        for metric, index, help_text, fmt in (
+            ("api_request_queries_total", 3, "Database queries run by endpoint.", "{}"),
+            ("api_request_db_seconds_total", 4, "Time spent in the database by endpoint.", "{:.6f}"),
+            ("api_request_render_seconds_total", 5, "Time spent serializing and rendering responses by endpoint.", "{:.6f}"),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, values in snapshot.items():
+                lines.append(f'{metric}{{endpoint="{name}"}} {fmt.format(values[index])}')
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def _endpoint_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.url_name or match.route or "unnamed"
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = _config()["ENABLED"]
+        self.slow_seconds = _config()["SLOW_REQUEST_MS"] / 1000
+        self.server_timing = _config()["SERVER_TIMING"]
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        for connection in connections.all():
+            _install(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        stats, token, start = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats, token, start = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, start)
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time that separately
+        stats = getattr(request, "_metrics", None)
+        if stats is not None:
+            stats.render_start = time.perf_counter()
+
+            def rendered(response):
+                stats.render_time += time.perf_counter() - stats.render_start
+            response.add_post_render_callback(rendered)
+        return response
+
+    def _start(self, request):
+        stats = RequestStats()
+        request._metrics = stats
+        return stats, _current.set(stats), time.perf_counter()
+
+    def _shows_timing(self, request):
+        if self.server_timing != "staff":
+            return self.server_timing == "all"
+        # DRF's authentication sets the user on the Django request as well
+        user = getattr(request, "user", None)
+        return bool(getattr(user, "is_staff", False) or getattr(user, "role", None) == "admin")
+
+    def _finish(self, request, response, stats, start):
+        total = time.perf_counter() - start
+        endpoint = _endpoint_name(request)
+        registry.observe(endpoint, total, len(stats.queries), stats.db_time, stats.render_time)
+
+        if self._shows_timing(request):
+            response["Server-Timing"] = (
+                f'db;dur={stats.db_time * 1000:.1f};desc="{len(stats.queries)} queries", '
+                f"render;dur={stats.render_time * 1000:.1f}, "
+                f"total;dur={total * 1000:.1f}"
+            )
+
+        if total >= self.slow_seconds:
+            top = Counter(fingerprint(sql) for sql in stats.queries).most_common(5)
+            logger.warning(
+                "slow request %s %s (%s) %.0fms, %d queries in %.0fms; top fingerprints: %s",
+                request.method, request.path, endpoint, total * 1000, len(stats.queries),
+                stats.db_time * 1000, "; ".join(f"{n}x {fp}" for fp, n in top) or "none",
+            )
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_schedule_weekday'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='description',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
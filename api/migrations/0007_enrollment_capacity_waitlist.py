@@ -0,0 +1,87 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def dedupe_and_count(apps, schema_editor):
+    Enrollment = apps.get_model('api', 'Enrollment')
+    DojoClass = apps.get_model('api', 'DojoClass')
+    Payment = apps.get_model('api', 'Payment')
+    db = schema_editor.connection.alias
+
+    # keep the oldest row for every duplicated (student, class) pair; its payments move over
+    duplicates = (
+        Enrollment.objects.using(db).values('student_id', 'martial_class_id')
+        .annotate(first_id=models.Min('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for dup in duplicates:
+        extra = Enrollment.objects.using(db).filter(
+            student_id=dup['student_id'], martial_class_id=dup['martial_class_id'],
+        ).exclude(id=dup['first_id'])
+        Payment.objects.using(db).filter(enrollment__in=extra).update(enrollment_id=dup['first_id'])
+        extra.delete()
+
+    if schema_editor.connection.vendor == 'postgresql':
+        # the moves above queue deferred FK checks, and Postgres won't ALTER api_enrollment
+        # (the constraint below) with trigger events pending; fire them now
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    taken = models.Subquery(
+        Enrollment.objects.using(db).filter(martial_class_id=models.OuterRef('pk'))
+        .values('martial_class_id')
+        .annotate(n=models.Count('id'))
+        .values('n')
+    )
+    DojoClass.objects.using(db).update(enrolled_count=Coalesce(taken, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='dojoclass',
+            name='enrolled_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(dedupe_and_count, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(fields=('student', 'martial_class'), name='unique_student_class'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='martial_class',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='api.dojoclass'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='student',
+            field=models.ForeignKey(limit_choices_to={'role': 'student'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(fields=['martial_class', 'created_at', 'id'], name='waitlist_class_order_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='waitlistentry',
+            constraint=models.UniqueConstraint(fields=('student', 'martial_class'), name='unique_waitlist_student_class'),
+        ),
+    ]
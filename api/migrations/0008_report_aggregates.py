@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:22
+
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+
+def populate(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    DojoClass = apps.get_model('api', 'DojoClass')
+    Enrollment = apps.get_model('api', 'Enrollment')
+    Payment = apps.get_model('api', 'Payment')
+    ReportCounter = apps.get_model('api', 'ReportCounter')
+    PaymentTotal = apps.get_model('api', 'PaymentTotal')
+    db = schema_editor.connection.alias
+
+    counters = {f'users:{role}': 0 for role in ('admin', 'instructor', 'student')}
+    for role, n in User.objects.using(db).values_list('role').annotate(n=models.Count('id')).order_by():
+        counters[f'users:{role}'] = n
+    counters['classes'] = DojoClass.objects.using(db).count()
+    counters['enrollments'] = Enrollment.objects.using(db).count()
+    ReportCounter.objects.using(db).bulk_create(ReportCounter(key=k, value=v) for k, v in counters.items())
+
+    rows = (
+        Payment.objects.using(db).annotate(month=TruncMonth('date'))
+        .values('status', 'month')
+        .annotate(count=models.Count('id'), amount=models.Sum('amount'))
+        .order_by()
+    )
+    PaymentTotal.objects.using(db).bulk_create(PaymentTotal(**row) for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_enrollment_capacity_waitlist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportCounter',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PaymentTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20)),
+                ('month', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['month', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('status', 'month'), name='unique_payment_total_bucket')],
+            },
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:36
+
+import warnings
+
+from django.db import migrations, models
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+def backfill(apps, schema_editor):
+    Schedule = apps.get_model('api', 'Schedule')
+    db = schema_editor.connection.alias
+    batch = []
+    for schedule in Schedule.objects.using(db).order_by('pk').iterator(chunk_size=2000):
+        # the old default was the invalid 'Monday'
+        schedule.weekday = schedule.weekday[:3].lower()
+        if schedule.weekday not in WEEKDAYS:
+            schedule.weekday = 'mon'
+        schedule.weekday_index = WEEKDAYS.index(schedule.weekday)
+        day = schedule.weekday_index * 1440
+        schedule.start_minute = day + schedule.start_time.hour * 60 + schedule.start_time.minute
+        schedule.end_minute = day + schedule.end_time.hour * 60 + schedule.end_time.minute
+        if schedule.end_minute <= schedule.start_minute:
+            schedule.end_minute += 1440
+        batch.append(schedule)
+        if len(batch) >= 2000:
+            Schedule.objects.using(db).bulk_update(batch, ['weekday', 'weekday_index', 'start_minute', 'end_minute'])
+            batch = []
+    Schedule.objects.using(db).bulk_update(batch, ['weekday', 'weekday_index', 'start_minute', 'end_minute'])
+
+
+def add_location_exclusion(apps, schema_editor):
+    # Postgres can refuse overlapping bookings of a location outright; the
+    # serializers check the same thing everywhere else (and for instructors).
+    # Slots booked before those checks may already overlap: they are reported
+    # and the constraint is left out, rather than failing the deploy or
+    # guessing which booking to move.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.id, b.id, a.location FROM api_schedule a JOIN api_schedule b "
+            "ON a.location = b.location AND a.id < b.id AND a.location <> '' "
+            "AND int4range(a.start_minute, a.end_minute) && int4range(b.start_minute, b.end_minute) "
+            "ORDER BY a.id, b.id"
+        )
+        clashes = cursor.fetchall()
+    if clashes:
+        warnings.warn(
+            f"schedule_location_no_overlap not added: {len(clashes)} pair(s) of slots already overlap "
+            f"(schedule ids, location: {clashes[:20]}). Move them apart, then add it as below, "
+            "or on Postgres 14+ rerun 0017 (`manage.py migrate api 0016`, `manage.py migrate api`)."
+        )
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        "ALTER TABLE api_schedule ADD CONSTRAINT schedule_location_no_overlap "
+        "EXCLUDE USING gist (location WITH =, int4range(start_minute, end_minute) WITH &&) "
+        "WHERE (location <> '')"
+    )
+
+
+def drop_location_exclusion(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE api_schedule DROP CONSTRAINT IF EXISTS schedule_location_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_report_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='schedule',
+            options={'ordering': ['dojo_class', 'start_minute']},
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='end_minute',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='start_minute',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='weekday_index',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='weekday',
+            field=models.CharField(choices=[('mon', 'Monday'), ('tue', 'Tuesday'), ('wed', 'Wednesday'), ('thu', 'Thursday'), ('fri', 'Friday'), ('sat', 'Saturday'), ('sun', 'Sunday')], default='mon', max_length=3),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['start_minute', 'end_minute'], name='schedule_week_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['location', 'start_minute', 'end_minute'], name='schedule_location_range_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(add_location_exclusion, drop_location_exclusion),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE api_searchentry_fts USING fts5(
+        title, body, content='api_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER api_searchentry_fts_insert AFTER INSERT ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER api_searchentry_fts_delete AFTER DELETE ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER api_searchentry_fts_update AFTER UPDATE ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO api_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+
+POSTGRES_FTS = [
+    """CREATE INDEX search_document_idx ON api_searchentry
+        USING GIN (to_tsvector('simple', api_searchentry.title || ' ' || api_searchentry.body))""",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_FTS, 'postgresql': POSTGRES_FTS}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS api_searchentry_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS search_document_idx')
+
+
+def populate(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    DojoClass = apps.get_model('api', 'DojoClass')
+    SearchEntry = apps.get_model('api', 'SearchEntry')
+    db = schema_editor.connection.alias
+
+    def join(*parts):
+        return ' '.join(part for part in parts if part)
+
+    SearchEntry.objects.using(db).bulk_create(
+        SearchEntry(
+            kind='class', title=c.name, dojo_class_id=c.pk,
+            body=join(c.description, c.instructor.first_name, c.instructor.last_name, c.instructor.username),
+        )
+        for c in DojoClass.objects.using(db).select_related('instructor').iterator()
+    )
+    SearchEntry.objects.using(db).bulk_create(
+        SearchEntry(
+            kind=u.role, title=u.username, user_id=u.pk,
+            body=join(u.first_name, u.last_name, '' if u.role == 'instructor' else u.email),
+        )
+        for u in User.objects.using(db).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_sync_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True, default='')),
+                ('dojo_class', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.dojoclass')),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'title'], name='search_kind_title_idx')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:14
+
+from django.db import migrations, models
+
+
+def drop_enrollment_counter(apps, schema_editor):
+    # the total is now the sum of DojoClass.enrolled_count
+    ReportCounter = apps.get_model('api', 'ReportCounter')
+    ReportCounter.objects.using(schema_editor.connection.alias).filter(key='enrollments').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_class_sessions'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='paymenttotal',
+            options={'ordering': ['month', 'status', 'slot']},
+        ),
+        migrations.RemoveConstraint(
+            model_name='paymenttotal',
+            name='unique_payment_total_bucket',
+        ),
+        migrations.AddField(
+            model_name='paymenttotal',
+            name='slot',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='paymenttotal',
+            name='count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='paymenttotal',
+            constraint=models.UniqueConstraint(fields=('status', 'month', 'slot'), name='unique_payment_total_shard'),
+        ),
+        migrations.RunPython(drop_enrollment_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+import warnings
+
+from django.db import migrations
+
+MINUTES_PER_WEEK = 7 * 24 * 60
+
+# a slot's range, and (for the wrap) the same range a week earlier; {t} is a table alias prefix
+PLAIN = 'int4range({t}start_minute, {t}end_minute)'
+WRAPPED = (
+    'int4multirange(int4range({t}start_minute, {t}end_minute), '
+    f'int4range({{t}}start_minute - {MINUTES_PER_WEEK}, {{t}}end_minute - {MINUTES_PER_WEEK}))'
+)
+
+
+def replace_exclusion(schema_editor, ranges):
+    """Rebuild schedule_location_no_overlap over `ranges`, or report the slots already breaking it and go without."""
+    schema_editor.execute('ALTER TABLE api_schedule DROP CONSTRAINT IF EXISTS schedule_location_no_overlap')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.id, b.id, a.location FROM api_schedule a JOIN api_schedule b "
+            "ON a.location = b.location AND a.id < b.id AND a.location <> '' "
+            f"AND {ranges.format(t='a.')} && {ranges.format(t='b.')} ORDER BY a.id, b.id"
+        )
+        clashes = cursor.fetchall()
+    if clashes:
+        # as in 0009: existing bookings are reported, never moved
+        warnings.warn(
+            f"schedule_location_no_overlap not added: {len(clashes)} pair(s) of slots already overlap "
+            f"(schedule ids, location: {clashes[:20]}). Move them apart, then run "
+            "`manage.py migrate api 0016` and `manage.py migrate api` to add it."
+        )
+        return
+    schema_editor.execute(
+        "ALTER TABLE api_schedule ADD CONSTRAINT schedule_location_no_overlap "
+        f"EXCLUDE USING gist (location WITH =, {ranges.format(t='')} WITH &&) WHERE (location <> '')"
+    )
+
+
+def add_wrapping_exclusion(apps, schema_editor):
+    # 0009's constraint compares plain ranges, so a Sunday slot running past
+    # midnight never met Monday-morning slots. Each slot now also covers its
+    # range a week earlier; multiranges need Postgres 14.
+    if schema_editor.connection.vendor != 'postgresql' or schema_editor.connection.pg_version < 140000:
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    replace_exclusion(schema_editor, WRAPPED)
+
+
+def restore_plain_exclusion(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql' or schema_editor.connection.pg_version < 140000:
+        return
+    replace_exclusion(schema_editor, PLAIN)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_sharded_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_wrapping_exclusion, restore_plain_exclusion),
+    ]
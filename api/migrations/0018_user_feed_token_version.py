@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_schedule_wrapping_exclusion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_token_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
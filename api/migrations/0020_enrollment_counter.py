@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def count_enrollments(apps, schema_editor):
+    # the sharded counter replaces summing DojoClass.enrolled_count (0016 dropped the old one)
+    ReportCounter = apps.get_model('api', 'ReportCounter')
+    Enrollment = apps.get_model('api', 'Enrollment')
+    db = schema_editor.connection.alias
+    ReportCounter.objects.using(db).filter(key__startswith='enrollments').delete()
+    ReportCounter.objects.using(db).create(key='enrollments', value=Enrollment.objects.using(db).count())
+
+
+def drop_enrollment_counter(apps, schema_editor):
+    ReportCounter = apps.get_model('api', 'ReportCounter')
+    ReportCounter.objects.using(schema_editor.connection.alias).filter(key__startswith='enrollments').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_enrollments, drop_enrollment_counter),
+    ]
@@ -0,0 +1,36 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+OLD_INDEX = """CREATE INDEX search_document_idx ON api_searchentry
+    USING GIN (to_tsvector('simple', api_searchentry.title || ' ' || api_searchentry.body))"""
+
+
+def document_index():
+    # the expression api.search.DOCUMENT compiles to, so its @@ filter can use the index
+    return GinIndex(SearchVector('title', 'body', config='simple'), name='search_document_idx')
+
+
+def use_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS search_document_idx')
+    schema_editor.add_index(apps.get_model('api', 'SearchEntry'), document_index())
+
+
+def use_raw_expression(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS search_document_idx')
+    schema_editor.execute(OLD_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_enrollment_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(use_search_vector, use_raw_expression),
+    ]
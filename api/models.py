@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -9,6 +11,18 @@ class User(AbstractUser):
     ]
     
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='student')
+    # signed into the .ics feed URLs (api/ical.py); bumping it revokes the old ones
+    feed_token_version = models.PositiveIntegerField(default=0, editable=False)
+    # like the other models: ETags (api/cache.py) and sync see edits through it
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # ?role= lists and per-role counts, in pk order
+            models.Index(fields=['role', 'id'], name='user_role_id_idx'),
+            # instructor lists and the limit_choices_to querysets; instructors are a small slice
+            models.Index(fields=['id'], name='user_instructor_idx', condition=models.Q(role='instructor')),
+        ]
 
     def __str__(self):
         return f"{self.username} ({self.role})"
@@ -20,6 +34,10 @@ class DojoClass(models.Model):
     instructor = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'instructor'})
     schedule = models.CharField(max_length=100)
     capacity = models.PositiveIntegerField(default=20)
+    # seats taken; only changed through conditional UPDATEs in api/services.py
+    enrolled_count = models.PositiveIntegerField(default=0, editable=False)
+    # change tracking for /api/sync/ (api/sync.py); the enrolled_count UPDATEs leave it alone
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -35,33 +53,266 @@ class Schedule(models.Model):
         ('sun', 'Sunday'),
     ]
 
-    dojo_class = models.ForeignKey(DojoClass, on_delete=models.CASCADE, related_name='schedules')
-    weekday = models.CharField(max_length=3, choices=WEEKDAY_CHOICES, default="Monday")
+    # indexed by schedule_class_order_idx below
+    dojo_class = models.ForeignKey(DojoClass, on_delete=models.CASCADE, related_name='schedules', db_index=False)
+    weekday = models.CharField(max_length=3, choices=WEEKDAY_CHOICES, default='mon')
     start_time = models.TimeField()
     end_time = models.TimeField()
     location = models.CharField(max_length=200, blank=True, default='Main Dojo')
+    # derived in save(): the slot as [start_minute, end_minute) counted from Monday 00:00
+    weekday_index = models.PositiveSmallIntegerField(default=0, editable=False)
+    start_minute = models.PositiveIntegerField(default=0, editable=False)
+    end_minute = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
-        ordering = ['dojo_class', 'weekday', 'start_time']
+        ordering = ['dojo_class', 'start_minute']
+        indexes = [
+            # prefetches of a class's schedules come back already in order
+            models.Index(fields=['dojo_class', 'start_minute'], name='schedule_class_order_idx'),
+            models.Index(fields=['start_minute', 'end_minute'], name='schedule_week_range_idx'),
+            models.Index(fields=['location', 'start_minute', 'end_minute'], name='schedule_location_range_idx'),
+        ]
 
     def _str_(self):
         return f"{self.dojo_class.name} — {self.get_weekday_display()} {self.start_time.strftime('%H:%M')}–{self.end_time.strftime('%H:%M')}"
 
+    def sync_timetable(self):
+        """Recompute the minute-of-week fields; bulk_create callers must call this themselves."""
+        day = 24 * 60
+        self.weekday_index = [code for code, _ in self.WEEKDAY_CHOICES].index(self.weekday)
+        self.start_minute = self.weekday_index * day + self.start_time.hour * 60 + self.start_time.minute
+        self.end_minute = self.weekday_index * day + self.end_time.hour * 60 + self.end_time.minute
+        if self.end_minute <= self.start_minute:
+            # runs past midnight
+            self.end_minute += day
+
+    def save(self, *args, **kwargs):
+        self.sync_timetable()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'weekday_index', 'start_minute', 'end_minute', 'updated_at'}
+        super().save(*args, **kwargs)
+
 class Enrollment(models.Model):
-    student = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'student'})
+    # unique_student_class leads with student, so the FK needs no index of its own
+    student = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'student'}, db_index=False)
     martial_class = models.ForeignKey(DojoClass, on_delete=models.CASCADE, related_name='enrollments')
     date_enrolled = models.DateField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'martial_class'], name='unique_student_class'),
+        ]
+        indexes = [
+            # keyset pagination order (see api/pagination.py)
+            models.Index(fields=['date_enrolled', 'id'], name='enrollment_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.username} enrolled in {self.martial_class.name}"
 
 
+class WaitlistEntry(models.Model):
+    # covered by unique_waitlist_student_class
+    student = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'student'}, db_index=False)
+    martial_class = models.ForeignKey(DojoClass, on_delete=models.CASCADE, related_name='waitlist')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'martial_class'], name='unique_waitlist_student_class'),
+        ]
+        indexes = [
+            models.Index(fields=['martial_class', 'created_at', 'id'], name='waitlist_class_order_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student.username} waiting for {self.martial_class.name}"
+
+
 class Payment(models.Model):
     enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name='payments')
     amount = models.DecimalField(max_digits=8, decimal_places=2)
     date = models.DateField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=[('paid', 'Paid'), ('pending', 'Pending')])
+    description = models.CharField(max_length=255, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # keyset pagination order (see api/pagination.py)
+            models.Index(fields=['date', 'id'], name='payment_date_id_idx'),
+            # covers the per-status/month totals recomputed by api/aggregates.py
+            models.Index(fields=['status', 'date', 'amount'], name='payment_status_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.enrollment.student.username} - {self.status} - {self.amount}"
 
+
+
+# Maintained aggregates (see api/aggregates.py); rebuilt with `manage.py rebuild_aggregates`
+class ReportCounter(models.Model):
+    key = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class PaymentTotal(models.Model):
+    status = models.CharField(max_length=20)
+    month = models.DateField()
+    # one of aggregates SHARDS rows per bucket; a shard's count can dip below zero, their sum cannot
+    slot = models.PositiveSmallIntegerField(default=0)
+    count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['month', 'status', 'slot']
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'month', 'slot'], name='unique_payment_total_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.status}: {self.count} / {self.amount}"
+
+
+# Background jobs (see api/jobs.py); run by `manage.py runworker`
+class Job(models.Model):
+    QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # workers poll for the oldest due job
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+# Stored responses for retried writes (see api/idempotency.py); expired rows are
+# removed by `manage.py sweep_idempotency`
+class IdempotencyRecord(models.Model):
+    # sha256 of the caller, path and Idempotency-Key header
+    key = models.CharField(max_length=64, unique=True)
+    # sha256 of the method, path and body, to refuse a key reused for another request
+    fingerprint = models.CharField(max_length=64)
+    # null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    headers = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.status_code or 'in progress'})"
+
+
+# Deleted rows, so /api/sync/ can tell clients what to drop (see api/sync.py)
+class Tombstone(models.Model):
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    # the student an enrollment or payment belonged to; null for public rows
+    owner_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # changes-since reads and the sweep both range over deleted_at
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+# Search index rows (see api/search.py): one per class and per user, kept current by api/signals.py
+class SearchEntry(models.Model):
+    # 'class', or the user's role
+    kind = models.CharField(max_length=20)
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True, default='')
+    dojo_class = models.OneToOneField(DojoClass, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+    user = models.OneToOneField(User, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [
+            # facet counts and the role filter; the full-text index is created in 0014_search_index
+            models.Index(fields=['kind', 'title'], name='search_kind_title_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.title}"
+
+
+# Dated occurrences of Schedule slots (see api/class_sessions.py), generated ahead by `manage.py generate_sessions`
+class ClassSession(models.Model):
+    # null once the slot is deleted; sessions with attendance are kept as history
+    schedule = models.ForeignKey(Schedule, null=True, blank=True, on_delete=models.SET_NULL, related_name='sessions', db_index=False)
+    dojo_class = models.ForeignKey(DojoClass, on_delete=models.CASCADE, related_name='sessions', db_index=False)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    # copied from the slot and the class when generated, so listings need no joins
+    location = models.CharField(max_length=200, blank=True, default='')
+    capacity = models.PositiveIntegerField()
+    # students checked in; only changed through conditional UPDATEs in api/class_sessions.py
+    checked_in_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            # makes generation idempotent: regenerating a window only adds what is missing
+            models.UniqueConstraint(fields=['schedule', 'starts_at'], name='unique_session_schedule_start'),
+        ]
+        indexes = [
+            # date-range listings and "in class now"
+            models.Index(fields=['starts_at', 'ends_at'], name='session_time_range_idx'),
+            models.Index(fields=['dojo_class', 'starts_at'], name='session_class_start_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dojo_class.name} at {self.starts_at:%Y-%m-%d %H:%M}"
+
+
+class Attendance(models.Model):
+    # covered by unique_session_student
+    session = models.ForeignKey(ClassSession, on_delete=models.CASCADE, related_name='attendance', db_index=False)
+    student = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'student'}, db_index=False)
+    checked_in_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'student'], name='unique_session_student'),
+        ]
+        indexes = [
+            # a student's attendance history, newest first
+            models.Index(fields=['student', 'checked_in_at'], name='attendance_student_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student.username} at {self.session}"
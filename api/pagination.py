@@ -0,0 +1,134 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in keyset (seek) pagination.
+
+    Clients that send neither ?cursor= nor ?page_size= keep getting the plain list.
+    Pages are fetched with `WHERE (ordering) > (last row)` on an indexed ordering,
+    so page N costs the same as page 1.
+    """
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_paginating(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_paginating(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        model = queryset.model
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request, model)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.row_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size or 50
+        if size <= 0:
+            return self.page_size or 50
+        return min(size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    # --- cursor helpers -------------------------------------------------
+
+    def fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def row_position(self, obj):
+        return [getattr(obj, name) for name, _ in self.fields()]
+
+    def seek_filter(self, position):
+        # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y)
+        clauses = []
+        for i, (name, descending) in enumerate(self.fields()):
+            lookup = 'lt' if descending else 'gt'
+            equal = {field: position[j] for j, (field, _) in enumerate(self.fields()[:i])}
+            clauses.append(Q(**equal, **{f'{name}__{lookup}': position[i]}))
+        # the redundant a >= x lets the planner start the index range at the cursor
+        # instead of walking the index from the beginning and filtering
+        first, descending = self.fields()[0]
+        bound = Q(**{f"{first}__{'lte' if descending else 'gte'}": position[0]})
+        return bound & reduce(or_, clauses)
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            fields = self.fields()
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            return [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class PaymentPagination(KeysetPagination):
+    ordering = ('date', 'id')
+
+
+class EnrollmentPagination(KeysetPagination):
+    ordering = ('date_enrolled', 'id')
@@ -0,0 +1,64 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _nested_serializer(field):
+    # returns (child serializer, many) for read-side nested serializers, else (None, False)
+    if field.write_only:
+        return None, False
+    if isinstance(field, serializers.ListSerializer):
+        return field.child, True
+    if isinstance(field, serializers.BaseSerializer):
+        return field, False
+    return None, False
+
+
+def build_prefetch_plan(serializer, prefix=''):
+    """
+    Walk the serializer tree and return (select_related, prefetch_related) lookups.
+    Forward FKs are joined, reverse/many relations get a Prefetch with their own plan.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+
+    model = serializer.Meta.model
+    select, prefetch = [], []
+
+    for field in serializer.fields.values():
+        child, many = _nested_serializer(field)
+        if child is None or field.source == '*' or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+
+        path = prefix + field.source
+        if many or model_field.one_to_many or model_field.many_to_many:
+            child_select, child_prefetch = build_prefetch_plan(child)
+            queryset = child.Meta.model._default_manager.all()
+            if child_select:
+                queryset = queryset.select_related(*child_select)
+            if child_prefetch:
+                queryset = queryset.prefetch_related(*child_prefetch)
+            prefetch.append(Prefetch(path, queryset=queryset))
+        else:
+            child_select, child_prefetch = build_prefetch_plan(child, path + '__')
+            select.append(path)
+            select.extend(child_select)
+            prefetch.extend(child_prefetch)
+
+    return select, prefetch
+
+
+def optimize_queryset(queryset, serializer):
+    """Apply the serializer's prefetch plan so listing N rows costs a constant number of queries."""
+    select, prefetch = build_prefetch_plan(serializer)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
@@ -0,0 +1,101 @@
+"""
+Process warm-up and the readiness probe.
+
+A fresh worker pays for its first requests: the URLconf and every view module
+are imported on the first resolve, fast-path row mappers are compiled on the
+first list, and the database connection (or psycopg pool) opens on the first
+query. warm() does all of that up front. gunicorn.conf.py runs it in each
+worker before it accepts connections (and, with preload_app, the import half
+once in the master so workers inherit it), and GET /api/ready/ runs it before
+answering, so an orchestrator only sends traffic to a warm process.
+
+/api/ready/ answers 503 until every database the process reads from responds
+and no migrations are pending; migrations run as a release step
+(`manage.py migrate`), not at image build or boot.
+
+release_connections() is for forking servers: a master that touched the
+database must not hand its sockets or pool threads to the workers.
+"""
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.urls import get_resolver
+
+from . import cache, throttling
+from .fastpath import FastListMixin, mapper_for
+from .routers import _config as routing_config
+
+_lock = threading.Lock()
+_imported = False
+_migrated = False
+
+
+def _views():
+    resolver = get_resolver()
+    stack = list(resolver.url_patterns)
+    while stack:
+        pattern = stack.pop()
+        if hasattr(pattern, "url_patterns"):
+            stack.extend(pattern.url_patterns)
+        else:
+            yield getattr(pattern.callback, "view_class", None)
+
+
+def aliases():
+    """The databases this process serves requests from."""
+    return [DEFAULT_DB_ALIAS, *routing_config()["REPLICAS"]]
+
+
+def warm(connect=True):
+    """Import and compile everything requests need; with `connect`, also open the database connections."""
+    global _imported
+    with _lock:
+        if not _imported:
+            # imports every view module and fills the reverse() tables
+            get_resolver().reverse_dict
+            for view in _views():
+                if view is not None and issubclass(view, FastListMixin):
+                    mapper_for(view.serializer_class())
+            cache.get_backend()
+            throttling.get_store()
+            _imported = True
+    if connect:
+        for alias in aliases():
+            connections[alias].ensure_connection()
+
+
+def pending_migrations():
+    """Names of unapplied migrations on the primary; once there are none, not checked again."""
+    global _migrated
+    if _migrated:
+        return []
+    executor = MigrationExecutor(connections[DEFAULT_DB_ALIAS])
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    _migrated = not plan
+    return [f"{migration.app_label}.{migration.name}" for migration, _ in plan]
+
+
+def problems():
+    """{check: what is wrong}; empty when the process can take traffic."""
+    found = {}
+    for alias in aliases():
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except DatabaseError as exc:
+            found[f"database:{alias}"] = str(exc)
+    if f"database:{DEFAULT_DB_ALIAS}" not in found:
+        pending = pending_migrations()
+        if pending:
+            found["migrations"] = f"{len(pending)} unapplied, first {pending[0]}"
+    return found
+
+
+def release_connections():
+    """Close this process's connections and pools; for a preloading master before it forks."""
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        # Postgres with OPTIONS['pool'] (Django 5.1+): the pool's worker threads don't survive fork()
+        if hasattr(connection, "close_pool"):
+            connection.close_pool()
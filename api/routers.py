@@ -0,0 +1,130 @@
+"""
+Read-replica routing.
+
+ReplicaRouter sends reads made while serving a safe request (GET, HEAD,
+OPTIONS) to one of the aliases in REPLICA_ROUTING['REPLICAS'] and everything
+else to `default`. ReplicaRoutingMiddleware sets up the per-request state in a
+contextvar, so the routing also holds inside the sync_to_async threads of the
+async views; outside a request (management commands, workers, shell) every
+query goes to the primary.
+
+A request stays on the primary once it has written (or is inside a
+transaction on it), and a request that wrote sets a short-lived cookie so the
+same client's next reads see its own writes instead of a lagging replica -
+the enrolling student loads their schedule right after POSTing the enrollment.
+The cookie is only a hint, and clients can set it themselves: all it can do
+is send that client's reads to the primary, which is always correct, just
+not spread over the replicas.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_current = contextvars.ContextVar("replica_routing", default=None)
+
+
+def _config():
+    return {
+        "REPLICAS": [],
+        "STICKY_SECONDS": 5,
+        "COOKIE_NAME": "primary_reads",
+        **getattr(settings, "REPLICA_ROUTING", {}),
+    }
+
+
+class RoutingState:
+    __slots__ = ("replica", "pinned", "wrote")
+
+    def __init__(self, replica, pinned):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+
+
+def pin_to_primary():
+    """Send the rest of the current request's reads to the primary."""
+    state = _current.get()
+    if state is not None:
+        state.pinned = True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or state.pinned or state.replica is None:
+            return DEFAULT_DB_ALIAS
+        # reads inside a transaction on the primary must see its writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        pool = {DEFAULT_DB_ALIAS, *_config()["REPLICAS"]}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        state, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, state)
+
+    def _start(self, request):
+        config = _config()
+        replicas = config["REPLICAS"]
+        pinned = (
+            not replicas
+            or request.method not in SAFE_METHODS
+            or config["COOKIE_NAME"] in request.COOKIES
+        )
+        state = RoutingState(random.choice(replicas) if replicas else None, pinned)
+        return state, _current.set(state)
+
+    def _finish(self, request, response, state):
+        config = _config()
+        if state.wrote and config["REPLICAS"] and config["STICKY_SECONDS"]:
+            response.set_cookie(
+                config["COOKIE_NAME"], "1",
+                max_age=config["STICKY_SECONDS"],
+                secure=request.is_secure(),
+                httponly=True,
+                # the frontend calls the API cross-site; browsers only send SameSite=None cookies over https
+                samesite="None" if request.is_secure() else "Lax",
+            )
+        return response
@@ -0,0 +1,244 @@
+"""
+Full-text and faceted search over classes and users.
+
+Every class and user has a SearchEntry row (title plus body text) kept current
+by api/signals.py and rebuilt with `manage.py rebuild_search_index`. The
+full-text index over it depends on the database (see 0014_search_index):
+
+- Postgres: a GIN index on DOCUMENT, the SearchVector the queries filter on
+  (0021_search_vector_index builds it from the same expression), ranked with
+  ts_rank, title words weighted higher
+- SQLite: an FTS5 table kept in step by triggers, ranked with bm25()
+- anything else: icontains, title matches first
+
+Each query term matches as a prefix, and all terms must match. Facets are
+counted over the whole match set, after the filters:
+
+    GET /api/search/?q=karate&type=class&weekday=mon&location=Annex&seats=open&page=2
+
+    {"count": 31, "next": "...", "results": [...],
+     "facets": {"type": {...}, "role": {...}, "weekday": {...}, "location": {...}, "seats": {...}}}
+
+Anonymous callers and students only find classes and instructors.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Q, Value, When
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
+
+from .models import DojoClass, Schedule, SearchEntry, User
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_TERMS = 8
+# seats left -> facet bucket
+SEATS = {
+    'full': Q(dojo_class__capacity__lte=F('dojo_class__enrolled_count')),
+    'few': Q(dojo_class__capacity__gt=F('dojo_class__enrolled_count'),
+             dojo_class__capacity__lte=F('dojo_class__enrolled_count') + 5),
+    'open': Q(dojo_class__capacity__gt=F('dojo_class__enrolled_count') + 5),
+}
+PUBLIC_KINDS = ('class', 'instructor')
+WEEKDAYS = [code for code, _ in Schedule.WEEKDAY_CHOICES]
+# Postgres only; must stay identical to the indexed expression or the planner won't use the index
+DOCUMENT = SearchVector('title', 'body', config='simple')
+WEIGHTED = SearchVector('title', config='simple', weight='A') + SearchVector('body', config='simple', weight='B')
+
+
+# --- index maintenance ------------------------------------------------------
+
+def _join(*parts):
+    return ' '.join(part for part in parts if part)
+
+
+def class_entry(dojo_class, instructor):
+    return SearchEntry(
+        kind='class', title=dojo_class.name, dojo_class_id=dojo_class.pk,
+        body=_join(dojo_class.description, instructor.first_name, instructor.last_name, instructor.username),
+    )
+
+
+def user_entry(user):
+    # instructors are publicly searchable, so their email stays out of the index
+    email = '' if user.role == 'instructor' else user.email
+    return SearchEntry(
+        kind=user.role, title=user.username, user_id=user.pk,
+        body=_join(user.first_name, user.last_name, email),
+    )
+
+
+def _save(entry, using, **lookup):
+    SearchEntry.objects.using(using).update_or_create(
+        **lookup, defaults={'kind': entry.kind, 'title': entry.title, 'body': entry.body},
+    )
+
+
+def index_class(dojo_class, instructor=None, using='default'):
+    _save(class_entry(dojo_class, instructor or dojo_class.instructor), using, dojo_class_id=dojo_class.pk)
+
+
+def index_user(user, using='default'):
+    _save(user_entry(user), using, user_id=user.pk)
+    # a class's entry carries its instructor's names
+    classes = DojoClass.objects.using(using).filter(instructor_id=user.pk).only('pk', 'name', 'description')
+    for dojo_class in classes:
+        index_class(dojo_class, instructor=user, using=using)
+
+
+@transaction.atomic
+def rebuild(batch_size=2000):
+    """Recreate every entry from the base tables; for after bulk loads."""
+    SearchEntry.objects.all().delete()
+    classes = DojoClass.objects.select_related('instructor').iterator(chunk_size=batch_size)
+    SearchEntry.objects.bulk_create((class_entry(c, c.instructor) for c in classes), batch_size=batch_size)
+    users = User.objects.iterator(chunk_size=batch_size)
+    SearchEntry.objects.bulk_create((user_entry(u) for u in users), batch_size=batch_size)
+
+
+# --- matching ---------------------------------------------------------------
+
+def terms_of(q):
+    return re.findall(r'\w+', (q or '').lower())[:MAX_TERMS]
+
+
+def match(queryset, terms, ranked=True):
+    """
+    Filter `queryset` to entries containing every term (as a prefix); with
+    `ranked`, also annotate `rank` (higher is better) for ordering a page.
+    """
+    if not terms:
+        return queryset.annotate(rank=Value(0, output_field=IntegerField())) if ranked else queryset
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        # terms are \w+ only, so they are safe in a raw tsquery
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), config='simple', search_type='raw')
+        queryset = queryset.alias(document=DOCUMENT).filter(document=query)
+        return queryset.annotate(rank=SearchRank(WEIGHTED, query)) if ranked else queryset
+    if vendor == 'sqlite':
+        query = ' '.join(f'"{term}"*' for term in terms)
+        if not ranked:
+            # a subquery, so SQLite runs the MATCH once whatever else the query joins
+            return queryset.extra(
+                where=['api_searchentry.id IN (SELECT rowid FROM api_searchentry_fts WHERE api_searchentry_fts MATCH %s)'],
+                params=[query],
+            )
+        return queryset.extra(
+            # bm25 is lower for better matches; title weighs ten times the body
+            select={'rank': '-bm25(api_searchentry_fts, 10.0, 1.0)'},
+            tables=['api_searchentry_fts'],
+            where=['api_searchentry_fts.rowid = api_searchentry.id', 'api_searchentry_fts MATCH %s'],
+            params=[query],
+        )
+    for term in terms:
+        queryset = queryset.filter(Q(title__icontains=term) | Q(body__icontains=term))
+    if not ranked:
+        return queryset
+    return queryset.annotate(rank=Case(
+        When(title__istartswith=terms[0], then=Value(1)), default=Value(0), output_field=IntegerField(),
+    ))
+
+
+# --- the endpoint -------------------------------------------------------------
+
+def _choice(params, name, choices):
+    value = params.get(name)
+    if value and value not in choices:
+        raise ValidationError({name: f"Use one of {', '.join(choices)}."})
+    return value
+
+
+def _positive(params, name, default, maximum=None):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise ValidationError({name: "Must be a positive integer."})
+    if value < 1:
+        raise ValidationError({name: "Must be a positive integer."})
+    return min(value, maximum) if maximum else value
+
+
+def filtered(user, params):
+    staff = getattr(user, 'role', None) in ('admin', 'instructor') or getattr(user, 'is_staff', False)
+    kinds = ('class', 'admin', 'instructor', 'student') if staff else PUBLIC_KINDS
+
+    entries = SearchEntry.objects.filter(kind__in=kinds)
+    kind = _choice(params, 'type', ('class', 'user'))
+    if kind == 'class':
+        entries = entries.filter(kind='class')
+    elif kind == 'user':
+        entries = entries.exclude(kind='class')
+    role = _choice(params, 'role', kinds[1:])
+    if role:
+        entries = entries.filter(kind=role)
+
+    # class-only facets also narrow the results to classes
+    weekday = _choice(params, 'weekday', WEEKDAYS)
+    location = params.get('location')
+    if weekday or location:
+        slots = Schedule.objects.filter(dojo_class=OuterRef('dojo_class'))
+        if weekday:
+            slots = slots.filter(weekday=weekday)
+        if location:
+            slots = slots.filter(location=location)
+        entries = entries.filter(Exists(slots))
+    seats = _choice(params, 'seats', tuple(SEATS))
+    if seats:
+        entries = entries.filter(SEATS[seats])
+    return entries
+
+
+def facets(matches):
+    by_kind = dict(matches.values_list('kind').annotate(n=Count('id')).order_by())
+    classes = matches.filter(kind='class')
+
+    def distinct_classes(column):
+        rows = classes.values_list(column).annotate(n=Count('dojo_class', distinct=True)).order_by()
+        return {value: n for value, n in rows if value is not None}  # None: classes without schedules
+
+    return {
+        'type': {'class': by_kind.get('class', 0), 'user': sum(n for k, n in by_kind.items() if k != 'class')},
+        'role': {k: n for k, n in sorted(by_kind.items()) if k != 'class'},
+        'weekday': dict(sorted(
+            distinct_classes('dojo_class__schedules__weekday').items(), key=lambda item: WEEKDAYS.index(item[0]),
+        )),
+        'location': dict(sorted(distinct_classes('dojo_class__schedules__location').items())),
+        'seats': classes.aggregate(**{name: Count('id', filter=q) for name, q in SEATS.items()}),
+    }
+
+
+def _result(row):
+    if row['kind'] == 'class':
+        return {
+            'type': 'class', 'id': row['dojo_class_id'], 'title': row['title'],
+            'seats_left': max(row['dojo_class__capacity'] - row['dojo_class__enrolled_count'], 0),
+        }
+    return {'type': 'user', 'id': row['user_id'], 'title': row['title'], 'role': row['kind']}
+
+
+def search(request):
+    """The /api/search/ response body for `request`."""
+    params = request.query_params
+    page = _positive(params, 'page', 1)
+    page_size = _positive(params, 'page_size', PAGE_SIZE, MAX_PAGE_SIZE)
+
+    entries, terms = filtered(request.user, params), terms_of(params.get('q'))
+    matches = match(entries, terms, ranked=False)
+    offset = (page - 1) * page_size
+    rows = list(
+        match(entries, terms).order_by('-rank', 'title', 'id')
+        .values('rank', 'kind', 'title', 'user_id', 'dojo_class_id',
+                'dojo_class__capacity', 'dojo_class__enrolled_count')[offset:offset + page_size + 1]
+    )
+    has_next = len(rows) > page_size
+    count = matches.count() if has_next or page > 1 else len(rows)
+
+    url = request.build_absolute_uri()
+    return {
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if has_next else None,
+        'results': [_result(row) for row in rows[:page_size]],
+        'facets': facets(matches),
+    }
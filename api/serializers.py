@@ -1,6 +1,13 @@
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
-from .models import DojoClass, Enrollment, Payment, Schedule
+from .models import ClassSession, DojoClass, Enrollment, Job, Payment, Schedule, WaitlistEntry
+from . import aggregates, class_sessions
+from .cache import bump_version
+from .metrics import rendering
+from .services import enroll_many, existing_enrollment_pairs, waitlist_position
+from .timetable import find_conflicts
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 User = get_user_model()
@@ -16,7 +23,161 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['user_id'] = user.id
         return token
 
-class UserSerializer(serializers.ModelSerializer):
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that, inside a BulkListSerializer, resolves against the objects
+    the list serializer fetched with one IN query instead of one get() per item.
+    """
+    def to_internal_value(self, data):
+        lookup = self.context.get('bulk_lookup', {}).get(self.field_name)
+        if lookup is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = lookup.get(pk)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    many=True serializer that validates a whole batch together and writes it with bulk_create.
+    Errors come back as a list aligned with the submitted items.
+    """
+    max_length = 1000
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', self.max_length)
+        super().__init__(*args, **kwargs)
+
+    def bulk_fields(self):
+        return [
+            field for field in self.child.fields.values()
+            if isinstance(field, BulkPrimaryKeyRelatedField) and not field.read_only
+        ]
+
+    def to_internal_value(self, data):
+        lookups = {}
+        if isinstance(data, list):
+            for field in self.bulk_fields():
+                pks = set()
+                for item in data:
+                    if isinstance(item, dict) and field.field_name in item:
+                        try:
+                            pks.add(field.get_queryset().model._meta.pk.to_python(item[field.field_name]))
+                        except (TypeError, ValueError, DjangoValidationError):
+                            pass  # reported per item by the field
+                lookups[field.field_name] = field.get_queryset().in_bulk(pks)
+        self._context['bulk_lookup'] = lookups
+        try:
+            items = super().to_internal_value(data)
+        finally:
+            self._context.pop('bulk_lookup', None)
+        # raised from here (not validate()) so the errors stay aligned with the items
+        errors = self.validate_items(items)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def validate_items(self, items):
+        """Checks that need the whole batch; returns one dict of errors per item."""
+        return [{} for _ in items]
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            objs = model._default_manager.bulk_create([self.build(attrs) for attrs in validated_data])
+            self.after_bulk_create(objs)
+        return objs
+
+    def build(self, attrs):
+        # bulk_create skips Model.save(); subclasses fill in what save() would derive
+        return self.child.Meta.model(**attrs)
+
+    def after_bulk_create(self, objs):
+        # bulk_create sends no signals; subclasses do the bookkeeping the signals would
+        pass
+
+
+def _param_paths(request, name):
+    raw = request.query_params.get(name) if request is not None else None
+    if raw is None:
+        return None
+    return {path.strip() for path in raw.split(',') if path.strip()}
+
+
+def _covers(paths, path):
+    # `path` itself, something inside it, or an enclosing path was asked for
+    return any(p == path or p.startswith(path + '.') or path.startswith(p + '.') for p in paths)
+
+
+class SparseFieldsMixin:
+    """
+    Read-side `?fields=` and `?expand=` for GET requests.
+
+    `fields` keeps only the listed fields; dotted paths reach into nested serializers
+    (`?fields=id,amount,enrollment.student.username`). Once `expand` is given, only
+    the nested serializers it names (or that `fields` reaches into) are embedded: the
+    other to-one relations collapse to their primary key and to-many ones are left
+    out. Dropped serializers also drop out of the prefetch plan (api/prefetch.py).
+    Without either parameter the output is unchanged.
+
+    Serializing an instance counts as render time in the request metrics (api/metrics.py).
+    """
+
+    def to_representation(self, instance):
+        with rendering():
+            return super().to_representation(instance)
+
+    def _sparse_params(self):
+        context = self.context
+        if '_sparse' not in context:
+            request = context.get('request')
+            if request is None or request.method not in ('GET', 'HEAD'):
+                context['_sparse'] = (None, None)
+            else:
+                context['_sparse'] = (_param_paths(request, 'fields'), _param_paths(request, 'expand'))
+        return context['_sparse']
+
+    def _sparse_path(self):
+        names, node = [], self
+        while node is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return '.'.join(reversed(names))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand = self._sparse_params()
+        if only is None and expand is None:
+            return fields
+
+        base = self._sparse_path()
+        keep_all = only is None or (base and any(base == p or base.startswith(p + '.') for p in only))
+        for name, field in list(fields.items()):
+            path = f"{base}.{name}" if base else name
+            if not keep_all and not _covers(only, path):
+                del fields[name]
+                continue
+            if expand is None or not isinstance(field, serializers.BaseSerializer) or field.write_only:
+                continue
+            reached = only is not None and any(p.startswith(path + '.') for p in only)
+            if not reached and not any(p == path or p.startswith(path + '.') for p in expand):
+                if isinstance(field, serializers.ListSerializer):
+                    del fields[name]
+                else:
+                    source = {} if field.source in (None, name) else {'source': field.source}
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **source)
+        return fields
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
 
     class Meta:
@@ -39,14 +200,46 @@ class UserSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-class ScheduleSerializer(serializers.ModelSerializer):
+class BulkScheduleListSerializer(BulkListSerializer):
+    def validate_items(self, items):
+        # the whole batch is checked for double-booking with one range query
+        return find_conflicts([Schedule(**item) for item in items])
+
+    def build(self, attrs):
+        schedule = Schedule(**attrs)
+        schedule.sync_timetable()
+        return schedule
+
+    def after_bulk_create(self, objs):
+        bump_version(Schedule)
+        # bulk_create skips the post_save that creates a slot's sessions
+        class_sessions.generate(schedules=objs)
+
+
+class ScheduleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+
     class Meta:
         model = Schedule
         fields = ("id", "dojo_class", "weekday", "start_time", "end_time", "location")
         read_only_fields = ("id",)
+        list_serializer_class = BulkScheduleListSerializer
 
+    def validate(self, attrs):
+        values = {name: getattr(self.instance, name) for name in self.Meta.fields if self.instance}
+        values.update(attrs)
+        slot = Schedule(**values)
+        if slot.start_time == slot.end_time:
+            raise serializers.ValidationError({"end_time": ["End time must differ from start time."]})
+        if 'bulk_lookup' not in self.context:
+            # inside a bulk request BulkScheduleListSerializer checks all items together
+            errors = find_conflicts([slot])[0]
+            if errors:
+                raise serializers.ValidationError(errors)
+        return attrs
 
-class DojoClassSerializer(serializers.ModelSerializer):
+
+class DojoClassSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     instructor = UserSerializer(read_only=True)
     instructor_id = serializers.PrimaryKeyRelatedField(
         write_only=True,
@@ -60,20 +253,85 @@ class DojoClassSerializer(serializers.ModelSerializer):
         model = DojoClass
         fields = ("id", "name", "description", "instructor", "instructor_id", "schedule", "capacity", "schedules")
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class BulkEnrollmentListSerializer(BulkListSerializer):
+    def validate_items(self, items):
+        # one query for pairs already enrolled, plus duplicates inside the batch
+        pairs = [(item['student'].pk, item['martial_class'].pk) for item in items]
+        taken = existing_enrollment_pairs(pairs)
+        seen, errors = set(), []
+        for pair in pairs:
+            if pair in taken or pair in seen:
+                errors.append({'non_field_errors': ["Student is already enrolled in this class."]})
+            else:
+                errors.append({})
+            seen.add(pair)
+        return errors
+
+    def create(self, validated_data):
+        # capacity still applies: enroll_many fills free seats and waitlists the rest
+        return enroll_many([(item['student'].pk, item['martial_class'].pk) for item in validated_data])
+
+
+class EnrollmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     student = UserSerializer(read_only=True)
-    student_id = serializers.PrimaryKeyRelatedField(write_only=True, queryset=User.objects.filter(role='student'), source='student')
+    student_id = BulkPrimaryKeyRelatedField(write_only=True, queryset=User.objects.filter(role='student'), source='student')
     martial_class = DojoClassSerializer(read_only=True)
-    martial_class_id = serializers.PrimaryKeyRelatedField(write_only=True, queryset=DojoClass.objects.all(), source='martial_class')
+    martial_class_id = BulkPrimaryKeyRelatedField(write_only=True, queryset=DojoClass.objects.all(), source='martial_class')
 
     class Meta:
         model = Enrollment
         fields = ("id", "student", "student_id", "martial_class", "martial_class_id", "date_enrolled")
+        # uniqueness is enforced by api/services.py and the unique_student_class constraint,
+        # not by a per-item UniqueTogetherValidator query
+        validators = []
+        list_serializer_class = BulkEnrollmentListSerializer
+
+class WaitlistEntrySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    position = serializers.SerializerMethodField()
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ("id", "student", "martial_class", "created_at", "position")
+        read_only_fields = fields
+
+    def get_position(self, obj):
+        return waitlist_position(obj)
 
-class PaymentSerializer(serializers.ModelSerializer):
+class BulkPaymentListSerializer(BulkListSerializer):
+    def after_bulk_create(self, objs):
+        aggregates.add_payments(objs)
+
+
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     enrollment = EnrollmentSerializer(read_only=True)
-    enrollment_id = serializers.PrimaryKeyRelatedField(write_only=True, queryset=Enrollment.objects.all(), source='enrollment')
+    enrollment_id = BulkPrimaryKeyRelatedField(write_only=True, queryset=Enrollment.objects.all(), source='enrollment')
 
     class Meta:
         model = Payment
         fields = ("id", "enrollment", "enrollment_id", "amount", "date", "status", "description")
+        list_serializer_class = BulkPaymentListSerializer
+
+
+class ClassSessionSerializer(serializers.ModelSerializer):
+    class_name = serializers.CharField(source='dojo_class.name', read_only=True)
+
+    class Meta:
+        model = ClassSession
+        fields = ("id", "schedule", "dojo_class", "class_name", "starts_at", "ends_at", "location",
+                  "capacity", "checked_in_count")
+        read_only_fields = fields
+
+
+class CheckInSerializer(serializers.Serializer):
+    # a student checking themselves in may leave it out
+    students = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500, required=False,
+    )
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ("id", "task", "status", "attempts", "max_attempts", "run_at", "result", "error",
+                  "created_at", "finished_at")
+        read_only_fields = fields
@@ -0,0 +1,166 @@
+import operator
+from functools import reduce
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from rest_framework.exceptions import ValidationError
+
+from . import aggregates
+from .cache import bump_version, enrollments_of
+from .models import DojoClass, Enrollment, WaitlistEntry
+
+ALREADY_ENROLLED = "Student is already enrolled in this class."
+
+
+def _take_seat(dojo_class_id):
+    # Conditional UPDATE: the row lock it takes is held only for this class until commit,
+    # so concurrent enrollments in other classes never wait on each other.
+    taken = DojoClass.objects.filter(
+        pk=dojo_class_id, enrolled_count__lt=F('capacity')
+    ).update(enrolled_count=F('enrolled_count') + 1) == 1
+    if taken:
+        aggregates.bump(aggregates.ENROLLMENTS)
+    return taken
+
+
+def _take_seat_unchecked(dojo_class_id):
+    DojoClass.objects.filter(pk=dojo_class_id).update(enrolled_count=F('enrolled_count') + 1)
+    aggregates.bump(aggregates.ENROLLMENTS)
+
+
+def _release_seat(dojo_class_id):
+    if DojoClass.objects.filter(
+        pk=dojo_class_id, enrolled_count__gt=0
+    ).update(enrolled_count=F('enrolled_count') - 1):
+        aggregates.bump(aggregates.ENROLLMENTS, -1)
+
+
+def _create_enrollment(student_id, dojo_class_id):
+    enrollment = Enrollment(student_id=student_id, martial_class_id=dojo_class_id)
+    enrollment._seat_taken = True  # tells the post_save signal not to count it twice
+    enrollment.save(force_insert=True)
+    return enrollment
+
+
+def enroll(student, dojo_class):
+    """
+    Enroll `student` in `dojo_class` if a seat is free, otherwise put them on the waitlist.
+    Returns (enrollment, None) or (None, waitlist_entry).
+    """
+    with transaction.atomic():
+        if Enrollment.objects.filter(student=student, martial_class=dojo_class).exists():
+            raise ValidationError(ALREADY_ENROLLED)
+
+        if not _take_seat(dojo_class.pk):
+            entry, _ = WaitlistEntry.objects.get_or_create(student=student, martial_class=dojo_class)
+            return None, entry
+
+        try:
+            with transaction.atomic():
+                enrollment = _create_enrollment(student.pk, dojo_class.pk)
+        except IntegrityError:
+            # lost a race against a duplicate request; the outer rollback frees the seat
+            raise ValidationError(ALREADY_ENROLLED)
+
+        WaitlistEntry.objects.filter(student=student, martial_class=dojo_class).delete()
+        return enrollment, None
+
+
+def existing_enrollment_pairs(pairs):
+    """Which (student_id, dojo_class_id) pairs are already enrolled, in one query."""
+    if not pairs:
+        return set()
+    students = {student_id for student_id, _ in pairs}
+    classes = {class_id for _, class_id in pairs}
+    return set(
+        Enrollment.objects.filter(student_id__in=students, martial_class_id__in=classes)
+        .values_list('student_id', 'martial_class_id')
+    ) & set(pairs)
+
+
+def enroll_many(pairs):
+    """
+    Bulk version of enroll() for (student_id, dojo_class_id) pairs already checked for duplicates.
+    Seats are handed out in request order; the rest go on the waitlist.
+    Returns (enrollments, waitlist_entries).
+
+    A pair enrolled since that check fails the whole batch with one error per
+    item, as the check itself would have.
+    """
+    by_class = {}
+    for student_id, class_id in pairs:
+        by_class.setdefault(class_id, []).append(student_id)
+
+    with transaction.atomic():
+        # lock just the classes involved, in id order so concurrent batches cannot deadlock
+        seats = dict(
+            DojoClass.objects.select_for_update()
+            .filter(pk__in=by_class).order_by('pk')
+            .values_list('pk', F('capacity') - F('enrolled_count'))
+        )
+        # enroll() takes the same class rows, so what it committed since validation is visible now
+        taken = existing_enrollment_pairs(pairs)
+        if taken:
+            raise ValidationError([{'non_field_errors': [ALREADY_ENROLLED]} if pair in taken else {} for pair in pairs])
+
+        to_enroll, to_waitlist = [], []
+        for class_id, students in by_class.items():
+            free = max(seats.get(class_id, 0), 0)
+            to_enroll += [Enrollment(student_id=s, martial_class_id=class_id) for s in students[:free]]
+            to_waitlist += [WaitlistEntry(student_id=s, martial_class_id=class_id) for s in students[free:]]
+            taken = min(free, len(students))
+            if taken:
+                DojoClass.objects.filter(pk=class_id).update(enrolled_count=F('enrolled_count') + taken)
+                aggregates.bump(aggregates.ENROLLMENTS, taken)
+
+        try:
+            with transaction.atomic():
+                enrollments = Enrollment.objects.bulk_create(to_enroll)
+        except IntegrityError:
+            # enrolled without the class lock (admin, shell); the outer rollback gives the seats back
+            raise ValidationError(ALREADY_ENROLLED)
+        if enrollments:
+            WaitlistEntry.objects.filter(
+                reduce(operator.or_, (Q(student_id=e.student_id, martial_class_id=e.martial_class_id) for e in enrollments))
+            ).delete()
+        for student_id in {e.student_id for e in enrollments}:
+            bump_version(enrollments_of(student_id))
+        waitlisted = WaitlistEntry.objects.bulk_create(to_waitlist, ignore_conflicts=True)
+    return enrollments, waitlisted
+
+
+def promote_waitlist(dojo_class_id):
+    """Move waitlisted students into free seats, oldest first. Returns the new enrollments."""
+    promoted = []
+    with transaction.atomic():
+        while True:
+            entry = (
+                WaitlistEntry.objects.select_for_update(skip_locked=True)
+                .filter(martial_class_id=dojo_class_id)
+                .order_by('created_at', 'id')
+                .first()
+            )
+            if entry is None:
+                break
+            if Enrollment.objects.filter(student_id=entry.student_id, martial_class_id=dojo_class_id).exists():
+                entry.delete()
+                continue
+            if not _take_seat(dojo_class_id):
+                break
+            promoted.append(_create_enrollment(entry.student_id, dojo_class_id))
+            entry.delete()
+    return promoted
+
+
+def withdraw(enrollment):
+    """Delete an enrollment and hand its seat to the next student on the waitlist."""
+    with transaction.atomic():
+        dojo_class_id = enrollment.martial_class_id
+        enrollment.delete()  # the post_delete signal releases the seat
+        promote_waitlist(dojo_class_id)
+
+
+def waitlist_position(entry):
+    return WaitlistEntry.objects.filter(
+        martial_class_id=entry.martial_class_id, created_at__lte=entry.created_at, id__lte=entry.id,
+    ).count()
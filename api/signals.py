@@ -0,0 +1,187 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import aggregates, class_sessions, search, sync
+from .authentication import active_status
+from .cache import bump_version, enrollments_of
+from .models import Attendance, DojoClass, Enrollment, Payment, Schedule
+from .services import _release_seat, _take_seat_unchecked
+
+User = get_user_model()
+
+
+def _touches(update_fields, *names):
+    return update_fields is None or any(name in update_fields for name in names)
+
+
+@receiver(post_save, sender=Enrollment)
+def count_enrollment(sender, instance, created, **kwargs):
+    if not created:
+        return
+    # enrollments made outside api/services.py (admin, shell) still occupy a seat
+    if not getattr(instance, '_seat_taken', False):
+        _take_seat_unchecked(instance.martial_class_id)
+
+
+@receiver(post_delete, sender=Enrollment)
+def free_seat(sender, instance, **kwargs):
+    _release_seat(instance.martial_class_id)
+
+
+@receiver(post_save, sender=DojoClass)
+def count_class(sender, instance, created, **kwargs):
+    if created:
+        aggregates.bump(aggregates.CLASSES)
+
+
+@receiver(post_delete, sender=DojoClass)
+def uncount_class(sender, instance, **kwargs):
+    aggregates.bump(aggregates.CLASSES, -1)
+
+
+@receiver(pre_save, sender=User)
+def remember_role(sender, instance, update_fields=None, **kwargs):
+    # last_login updates pass update_fields and skip the lookup
+    if instance._state.adding or not _touches(update_fields, 'role'):
+        return
+    instance._previous_role = User.objects.filter(pk=instance.pk).values_list('role', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def count_user(sender, instance, created, update_fields=None, **kwargs):
+    if not _touches(update_fields, 'role'):
+        return
+    previous = None if created else getattr(instance, '_previous_role', instance.role)
+    if previous != instance.role:
+        if previous:
+            aggregates.bump(aggregates.role_key(previous), -1)
+        aggregates.bump(aggregates.role_key(instance.role))
+    instance._previous_role = instance.role
+
+
+@receiver(post_delete, sender=User)
+def uncount_user(sender, instance, **kwargs):
+    aggregates.bump(aggregates.role_key(instance.role), -1)
+
+
+@receiver(pre_save, sender=Payment)
+def remember_payment(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or not _touches(update_fields, 'status', 'date', 'amount'):
+        return
+    instance._previous_payment = (
+        Payment.objects.filter(pk=instance.pk).values_list('status', 'date', 'amount').first()
+    )
+
+
+@receiver(post_save, sender=Payment)
+def total_payment(sender, instance, created, update_fields=None, **kwargs):
+    if not _touches(update_fields, 'status', 'date', 'amount'):
+        return
+    previous = None if created else getattr(instance, '_previous_payment', None)
+    current = (instance.status, instance.date, instance.amount)
+    if not created and (previous is None or previous == current):
+        return
+    if previous:
+        aggregates.add_payment(*previous, sign=-1)
+    aggregates.add_payment(*current)
+    instance._previous_payment = current
+
+
+@receiver(post_delete, sender=Payment)
+def untotal_payment(sender, instance, **kwargs):
+    aggregates.add_payment(instance.status, instance.date, instance.amount, sign=-1)
+
+
+# Response cache versions (api/cache.py) for models the public read endpoints depend on
+@receiver(post_save, sender=DojoClass)
+@receiver(post_save, sender=Schedule)
+@receiver(post_save, sender=User)
+def invalidate_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_version(sender)
+
+
+# also Enrollment and Payment: their ETags (ConditionalGetMixin) see saves through updated_at, deletes through this
+@receiver(post_delete, sender=DojoClass)
+@receiver(post_delete, sender=Schedule)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_delete, sender=Payment)
+def invalidate_on_delete(sender, instance, **kwargs):
+    bump_version(sender)
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_student_schedule(sender, instance, **kwargs):
+    bump_version(enrollments_of(instance.student_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_active_status(sender, instance, **kwargs):
+    # only clears this process; other workers pick the change up within the TTL
+    active_status.forget(instance.pk)
+
+
+# Tombstones for /api/sync/ (api/sync.py)
+@receiver(post_delete, sender=DojoClass)
+@receiver(post_delete, sender=Schedule)
+def tombstone_public(sender, instance, **kwargs):
+    sync.record_deletion(instance)
+
+
+@receiver(post_delete, sender=Enrollment)
+def tombstone_enrollment(sender, instance, **kwargs):
+    sync.record_deletion(instance, owner_id=instance.student_id)
+
+
+@receiver(post_delete, sender=Payment)
+def tombstone_payment(sender, instance, **kwargs):
+    # cascades delete payments before their enrollment, so the row is still there
+    owner_id = Enrollment.objects.filter(pk=instance.enrollment_id).values_list('student_id', flat=True).first()
+    sync.record_deletion(instance, owner_id=owner_id)
+
+
+# Search index (api/search.py); deletes cascade to the entries
+@receiver(post_save, sender=DojoClass)
+def index_class(sender, instance, using='default', **kwargs):
+    search.index_class(instance, using=using)
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, update_fields=None, using='default', **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login', 'password', 'is_active'}:
+        return
+    search.index_user(instance, using=using)
+
+
+# Class sessions (api/class_sessions.py): future sessions follow their slot and class
+@receiver(post_save, sender=Schedule)
+def reschedule_sessions(sender, instance, using='default', **kwargs):
+    class_sessions.reschedule(instance, using=using)
+
+
+@receiver(pre_delete, sender=Schedule)
+def drop_sessions(sender, instance, using='default', **kwargs):
+    class_sessions.unschedule(instance, using=using)
+
+
+@receiver(post_save, sender=DojoClass)
+def resize_sessions(sender, instance, created, update_fields=None, using='default', **kwargs):
+    if not created and _touches(update_fields, 'capacity'):
+        class_sessions.resize(instance, using=using)
+
+
+@receiver(post_save, sender=Attendance)
+def count_check_in(sender, instance, created, using='default', **kwargs):
+    # check_in() uses bulk_create, which skips this; admin and shell saves land here
+    if created:
+        class_sessions.count_attendance(instance.session_id, 1, using=using)
+
+
+@receiver(post_delete, sender=Attendance)
+def count_check_out(sender, instance, using='default', **kwargs):
+    class_sessions.count_attendance(instance.session_id, -1, using=using)
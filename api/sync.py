@@ -0,0 +1,114 @@
+"""
+Incremental sync for offline-capable clients.
+
+GET /api/sync/ returns every row the caller can see, as flat rows per model,
+plus a `next` token. GET /api/sync/?since=<token> returns only the rows saved
+since that token (via the indexed updated_at columns) and the ids deleted since
+then (via Tombstone rows written by api/signals.py):
+
+    {"since": "...", "next": "...", "reset": false,
+     "changes": {"schedules": {"updated": [{...}], "deleted": [12]}}}
+
+Models with nothing to report are left out, so an unchanged client gets an
+almost empty body. Students only see their own enrollments and payments.
+
+The next token is taken SYNC['LAG_SECONDS'] before the read, so rows written
+by transactions that were still open at the time are picked up next round;
+clients must treat `updated` as upserts and `deleted` as idempotent. Tokens
+older than SYNC['TOMBSTONE_DAYS'] answer with a full snapshot and
+"reset": true, because the tombstones they would need have been swept
+(`manage.py sweep_tombstones`).
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DojoClass, Enrollment, Payment, Schedule, Tombstone
+
+# name in the response -> (model, columns sent per row, owner lookup or None for public rows)
+SYNCED = {
+    "classes": (DojoClass, ("id", "name", "description", "instructor_id", "schedule", "capacity"), None),
+    "schedules": (Schedule, ("id", "dojo_class_id", "weekday", "start_time", "end_time", "location"), None),
+    "enrollments": (Enrollment, ("id", "student_id", "martial_class_id", "date_enrolled"), "student_id"),
+    "payments": (
+        Payment, ("id", "enrollment_id", "amount", "date", "status", "description"), "enrollment__student_id",
+    ),
+}
+MODEL_NAMES = {model: name for name, (model, _, _) in SYNCED.items()}
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def _config():
+    return {"LAG_SECONDS": 5, "TOMBSTONE_DAYS": 30, **getattr(settings, "SYNC", {})}
+
+
+def encode_token(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def decode_token(token):
+    try:
+        return datetime.fromtimestamp(int(token) / 1_000_000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise InvalidToken("Not a sync token; use the `next` value of a previous response.")
+
+
+def sees_everything(user):
+    return getattr(user, "role", None) in ("admin", "instructor") or getattr(user, "is_staff", False)
+
+
+def record_deletion(instance, owner_id=None):
+    """Called from post_delete for the synced models."""
+    Tombstone.objects.create(model=MODEL_NAMES[type(instance)], object_id=instance.pk, owner_id=owner_id)
+
+
+def changes(user, since=None):
+    """The sync response body for `user`; `since` is a token from an earlier response or None."""
+    config = _config()
+    now = timezone.now()
+    moment = decode_token(since) if since else None
+    reset = moment is None or moment < now - timedelta(days=config["TOMBSTONE_DAYS"])
+    private = not sees_everything(user)
+
+    delta = {}
+    for name, (model, columns, owner) in SYNCED.items():
+        queryset = model._default_manager.order_by("pk")
+        if owner and private:
+            queryset = queryset.filter(**{owner: user.id})
+        if not reset:
+            queryset = queryset.filter(updated_at__gt=moment)
+        rows = list(queryset.values(*columns))
+        if rows:
+            delta[name] = {"updated": rows, "deleted": []}
+
+    if not reset:
+        # one indexed read for every model's deletions
+        tombstones = Tombstone.objects.filter(deleted_at__gt=moment)
+        if private:
+            tombstones = tombstones.filter(Q(owner_id__isnull=True) | Q(owner_id=user.id))
+        for name, object_id in tombstones.order_by("deleted_at", "pk").values_list("model", "object_id"):
+            delta.setdefault(name, {"updated": [], "deleted": []})["deleted"].append(object_id)
+
+    return {
+        "since": None if reset else since,
+        "next": encode_token(now - timedelta(seconds=config["LAG_SECONDS"])),
+        "reset": reset,
+        "changes": delta,
+    }
+
+
+def sweep(batch_size=5000):
+    """Delete tombstones older than TOMBSTONE_DAYS in batches; returns how many went."""
+    removed = 0
+    cutoff = timezone.now() - timedelta(days=_config()["TOMBSTONE_DAYS"])
+    old = Tombstone.objects.filter(deleted_at__lt=cutoff)
+    while True:
+        ids = list(old.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += Tombstone.objects.filter(pk__in=ids).delete()[0]
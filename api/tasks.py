@@ -0,0 +1,21 @@
+"""Background tasks run by `manage.py runworker` (see api/jobs.py)."""
+from django.db import transaction
+
+from . import aggregates
+from .jobs import task
+from .serializers import PaymentSerializer
+
+
+@task("payments.create")
+def create_payment(payload):
+    # validated again here: the enrollment may have gone since the request was accepted
+    serializer = PaymentSerializer(data=payload)
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        serializer.save()
+    return serializer.data
+
+
+@task("reports.enrollments", max_attempts=3)
+def enrollment_report(payload):
+    return aggregates.enrollment_report()
@@ -1,3 +1,1502 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections
+from django.db.migrations import Migration
+from django.db.migrations.executor import MigrationExecutor
+from django.http import Http404
+from django.test import AsyncRequestFactory, RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+
+from . import aggregates, async_views, class_sessions, compression, jobs, readiness, search, throttling
+from .authentication import active_status
+from .cache import LocalLRUBackend, get_backend
+from .metrics import fingerprint, registry as metrics_registry
+from .routers import RoutingState, _current as routing_state
+from .models import Attendance, ClassSession, DojoClass, Enrollment, IdempotencyRecord, Job, Payment, ReportCounter, Schedule, Tombstone, WaitlistEntry
+from .fastpath import _mappers as fastpath_mappers, mapper_for, render_json
+from .serializers import CustomTokenObtainPairSerializer, PaymentSerializer, UserSerializer, WaitlistEntrySerializer
+from .services import enroll, withdraw
+
+User = get_user_model()
+
+# hashing a password takes about as long as SLOW_REQUEST_MS, so token and register
+# requests would be logged as slow all through the suite
+_quiet_slow_requests = override_settings(REQUEST_METRICS={**settings.REQUEST_METRICS, "SLOW_REQUEST_MS": 5000})
+
+
+def setUpModule():
+    _quiet_slow_requests.enable()
+
+
+def tearDownModule():
+    _quiet_slow_requests.disable()
+
+
+def make_dataset(size, offset=0):
+    """Create `size` classes, each with an instructor, two schedules, a student enrollment and a payment."""
+    for i in range(offset, offset + size):
+        instructor = User.objects.create_user(username=f"sensei{i}", role="instructor")
+        student = User.objects.create_user(username=f"student{i}", role="student")
+        dojo_class = DojoClass.objects.create(
+            name=f"Class {i}", description="", instructor=instructor, schedule="", capacity=20
+        )
+        for weekday in ("mon", "thu"):
+            Schedule.objects.create(
+                dojo_class=dojo_class, weekday=weekday,
+                start_time=datetime.time(18, 0), end_time=datetime.time(19, 0),
+            )
+        enrollment = Enrollment.objects.create(student=student, martial_class=dojo_class)
+        Payment.objects.create(enrollment=enrollment, amount="50.00", status="paid")
+
+
+class QueryCountTests(APITestCase):
+    """
+    Every list endpoint must run a constant number of queries regardless of row count.
+    If a serializer change adds a nested relation, update the prefetch plan, not these numbers.
+    Uncached views (ConditionalGetMixin) spend one more on the aggregate behind their ETag.
+    """
+
+    EXPECTED_QUERIES = {
+        "/api/payments/": 3,      # ETag, payments + joins, schedules prefetch
+        "/api/enrollments/": 3,   # ETag, enrollments + joins, schedules prefetch
+        "/api/classes/": 2,       # classes + instructor, schedules prefetch
+        "/api/schedules/": 1,
+        "/api/users/": 2,         # ETag, users
+    }
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", role="admin")
+        self.client.force_authenticate(self.admin)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries)
+
+    def test_list_endpoints_run_constant_queries(self):
+        make_dataset(2)
+        small = {url: self.count_queries(url) for url in self.EXPECTED_QUERIES}
+        make_dataset(10, offset=2)
+        large = {url: self.count_queries(url) for url in self.EXPECTED_QUERIES}
+
+        self.assertEqual(small, self.EXPECTED_QUERIES)
+        self.assertEqual(large, self.EXPECTED_QUERIES)
+
+    def test_detail_endpoints_run_constant_queries(self):
+        make_dataset(1)
+        payment = Payment.objects.get()
+        enrollment = Enrollment.objects.get()
+        dojo_class = DojoClass.objects.get()
+        self.assertEqual(self.count_queries(f"/api/payments/{payment.pk}/"), 3)
+        self.assertEqual(self.count_queries(f"/api/enrollments/{enrollment.pk}/"), 3)
+        self.assertEqual(self.count_queries(f"/api/classes/{dojo_class.pk}/"), 3)
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        make_dataset(3)
+        self.client.force_authenticate(User.objects.create_user(username="admin", role="admin"))
+
+    def test_fields_trim_payload_and_queries(self):
+        with self.assertNumQueries(2):  # ETag, payments
+            rows = self.client.get("/api/payments/", {"fields": "id,amount"}).json()
+        self.assertEqual(set(rows[0]), {"id", "amount"})
+
+    def test_dotted_fields_reach_into_nested_serializers(self):
+        rows = self.client.get("/api/payments/", {"fields": "id,enrollment.student.username"}).json()
+        self.assertEqual(rows[0], {"id": rows[0]["id"], "enrollment": {"student": {"username": "student0"}}})
+
+    def test_unexpanded_relations_collapse(self):
+        with self.assertNumQueries(2):  # ETag, payments + enrollment
+            rows = self.client.get("/api/payments/", {"expand": "enrollment"}).json()
+        enrollment = Enrollment.objects.get(pk=rows[0]["enrollment"]["id"])
+        self.assertEqual(rows[0]["enrollment"]["student"], enrollment.student_id)
+        self.assertEqual(rows[0]["enrollment"]["martial_class"], enrollment.martial_class_id)
+
+        with self.assertNumQueries(1):
+            classes = self.client.get("/api/classes/", {"expand": ""}).json()
+        self.assertNotIn("schedules", classes[0])
+        self.assertIsInstance(classes[0]["instructor"], int)
+
+    def test_without_parameters_output_is_unchanged(self):
+        row = self.client.get("/api/payments/").json()[0]
+        self.assertEqual(set(row["enrollment"]["martial_class"]["instructor"]), set(UserSerializer.Meta.fields) - {"password"})
+
+
+class FastReadParityTests(APITestCase):
+    """The fast read path (api/fastpath.py) must render exactly what the serializers do."""
+
+    def setUp(self):
+        make_dataset(4)
+        instructor = User.objects.create_user(
+            username="sensei-ü", role="instructor", first_name='Jo "the\\ rock"', last_name="line\u2028sep\x1f\n",
+        )
+        DojoClass.objects.create(name="Käfig 道場 \u2029", description="no schedules yet", instructor=instructor, capacity=5)
+        Payment.objects.create(enrollment=Enrollment.objects.first(), amount="7", status="pending", description="Ω")
+        self.client.force_authenticate(User.objects.create_user(username="admin", role="admin"))
+
+    def fetch(self, url, params, fast):
+        get_backend().clear()
+        with override_settings(FAST_READS=fast):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_byte_identical_output(self):
+        for url in ("/api/classes/", "/api/enrollments/", "/api/payments/", "/api/schedules/", "/api/users/"):
+            for params in ({}, {"fields": "id,enrollment.student.username"}, {"expand": "martial_class"}):
+                with self.subTest(url=url, params=params):
+                    fast, slow = self.fetch(url, params, True), self.fetch(url, params, False)
+                    self.assertEqual(fast.content, slow.content)
+                    self.assertEqual(fast["Content-Type"], slow["Content-Type"])
+
+    def test_fast_path_is_used(self):
+        with mock.patch("api.serializers.PaymentSerializer.to_representation") as to_representation:
+            self.fetch("/api/payments/", {}, True)
+        to_representation.assert_not_called()
+
+    def test_pagination_uses_the_serializers(self):
+        self.assertIn("results", self.fetch("/api/payments/", {"page_size": 2}, True).json())
+
+    def test_unsupported_serializers_fall_back(self):
+        self.assertIsNone(mapper_for(WaitlistEntrySerializer()))  # `position` is a method field
+        self.assertIsNotNone(mapper_for(PaymentSerializer()))
+
+    def test_render_json_matches_json_renderer(self):
+        data = [{"s": "\u2028\u2029\x00\x7f\t\"\\/é😀", "n": None, "b": True, "i": -2**63}]
+        self.assertEqual(render_json(data), JSONRenderer().render(data))
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", role="admin")
+        self.client.force_authenticate(self.admin)
+        make_dataset(7)
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get("/api/payments/")
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual(len(response.json()), 7)
+
+    def test_walks_every_row_once(self):
+        seen, url = [], "/api/payments/?page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row["id"] for row in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, list(Payment.objects.order_by("date", "id").values_list("id", flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/enrollments/?cursor=garbage")
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", role="admin", is_staff=True)
+        self.client.force_authenticate(self.admin)
+        make_dataset(3)
+
+    def test_payment_ndjson(self):
+        response = self.client.get("/api/payments/export/")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])["amount"], "50.00")
+
+    def test_enrollment_csv_with_date_filter(self):
+        response = self.client.get("/api/enrollments/export/?output=csv&start=2000-01-01")
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0].split(",")[0], "id")
+        self.assertEqual(len(rows), 4)
+        response = self.client.get("/api/enrollments/export/?output=csv&end=2000-01-01")
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 1)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get("/api/payments/export/?start=yesterday").status_code, 400)
+        self.assertEqual(self.client.get("/api/payments/export/?output=xml").status_code, 400)
+
+
+class EnrollmentCapacityTests(TransactionTestCase):
+    """Hammer one class from many threads and check it never overbooks."""
+
+    THREADS = 40
+
+    def setUp(self):
+        instructor = User.objects.create_user(username="sensei", role="instructor")
+        self.dojo_class = DojoClass.objects.create(
+            name="Launch", description="", instructor=instructor, schedule="", capacity=5
+        )
+        self.students = [
+            User.objects.create_user(username=f"s{i}", role="student") for i in range(self.THREADS)
+        ]
+
+    def run_concurrently(self, students):
+        barrier = threading.Barrier(len(students))
+        errors = []
+
+        def worker(student):
+            try:
+                barrier.wait()
+                enroll(student, self.dojo_class)
+            except ValidationError:
+                pass
+            except Exception as exc:  # pragma: no cover - surfaced by the assertion below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(s,)) for s in students]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_no_overbooking(self):
+        self.run_concurrently(self.students)
+        self.dojo_class.refresh_from_db()
+        self.assertEqual(Enrollment.objects.filter(martial_class=self.dojo_class).count(), 5)
+        self.assertEqual(self.dojo_class.enrolled_count, 5)
+        self.assertEqual(WaitlistEntry.objects.filter(martial_class=self.dojo_class).count(), self.THREADS - 5)
+
+    def test_duplicate_requests_enroll_once(self):
+        self.run_concurrently([self.students[0]] * 10)
+        self.assertEqual(Enrollment.objects.filter(student=self.students[0]).count(), 1)
+
+    def test_withdraw_promotes_waitlist(self):
+        self.run_concurrently(self.students[:6])
+        waiting = WaitlistEntry.objects.get()
+        withdraw(Enrollment.objects.first())
+        self.assertTrue(Enrollment.objects.filter(student_id=waiting.student_id).exists())
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.dojo_class.refresh_from_db()
+        self.assertEqual(self.dojo_class.enrolled_count, 5)
+
+
+class EnrollmentEndpointTests(APITestCase):
+    def setUp(self):
+        instructor = User.objects.create_user(username="sensei", role="instructor")
+        self.dojo_class = DojoClass.objects.create(
+            name="Tiny", description="", instructor=instructor, schedule="", capacity=1
+        )
+
+    def post_as(self, username):
+        student = User.objects.create_user(username=username, role="student")
+        self.client.force_authenticate(student)
+        return self.client.post(
+            "/api/enrollments/", {"student_id": student.pk, "martial_class_id": self.dojo_class.pk}
+        )
+
+    def test_full_class_waitlists(self):
+        self.assertEqual(self.post_as("first").status_code, 201)
+        response = self.post_as("second")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["position"], 1)
+
+    def test_only_admins_enroll_someone_else(self):
+        other = User.objects.create_user(username="other", role="student")
+        self.client.force_authenticate(User.objects.create_user(username="sensei2", role="instructor"))
+        self.client.post("/api/enrollments/", {"student_id": other.pk, "martial_class_id": self.dojo_class.pk})
+        self.assertFalse(Enrollment.objects.filter(student=other).exists())
+
+        self.client.force_authenticate(User.objects.create_user(username="admin", role="admin"))
+        response = self.client.post("/api/enrollments/", {"student_id": other.pk, "martial_class_id": self.dojo_class.pk})
+        self.assertEqual(response.status_code, 202)  # the instructor took the only seat
+        self.assertEqual(response.data["student"], other.pk)
+
+
+class AggregateTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", role="admin", is_staff=True)
+        self.client.force_authenticate(self.admin)
+        make_dataset(3)
+
+    def test_reports_read_maintained_counters(self):
+        Payment.objects.first().delete()
+        student = User.objects.get(username="student0")
+        student.role = "instructor"
+        student.save()
+
+        with self.assertNumQueries(1):  # the counter shards
+            stats = self.client.get("/api/admin/stats/").data
+        self.assertEqual(stats, {
+            "totalStudents": 2, "totalClasses": 3, "totalEnrollments": 3, "activeInstructors": 4,
+        })
+
+        report = self.client.get("/api/reports/enrollments/").data
+        self.assertEqual(report["total_enrollments"], 3)
+        self.assertEqual([row["count"] for row in report["class_summary"]], [1, 1, 1])
+        self.assertEqual(report["payment_summary"][0]["count"], 2)
+        self.assertEqual(report["payment_summary"][0]["amount"], "100.00")
+
+    def test_enrollment_counter_follows_seats(self):
+        student = User.objects.get(username="student0")
+        enroll(student, DojoClass.objects.exclude(enrollments__student=student).first())
+        DojoClass.objects.filter(enrollments__student=student).first().delete()  # cascades to the enrollment
+        counters = aggregates.read_counters(aggregates.ENROLLMENTS)
+        self.assertEqual(counters[aggregates.ENROLLMENTS], Enrollment.objects.count())
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_verify_and_rebuild(self):
+        self.assertEqual(aggregates.verify(), [])
+        aggregates.bump(aggregates.role_key("student"), 99)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_aggregates", "--verify", stderr=io.StringIO(), stdout=io.StringIO())
+        call_command("rebuild_aggregates", stdout=io.StringIO())
+        self.assertEqual(aggregates.verify(), [])
+
+    @override_settings(AGGREGATES={"SHARDS": 4})
+    def test_counters_are_summed_over_their_shards(self):
+        aggregates.rebuild()  # the dataset's own changes may sit on shards beyond the first 4
+        for slot in (0, 1, 2, 3, 1):
+            with mock.patch("api.aggregates.random.randrange", return_value=slot):
+                aggregates.bump(aggregates.CLASSES)
+                aggregates.add_payment("paid", datetime.date(2030, 1, 5), "10.00")
+        with mock.patch("api.aggregates.random.randrange", return_value=2):
+            aggregates.add_payment("paid", datetime.date(2030, 1, 9), "10.00", sign=-1)
+        self.assertEqual(aggregates.read_counters(aggregates.CLASSES)[aggregates.CLASSES], 3 + 5)
+        january = [row for row in aggregates.enrollment_report()["payment_summary"] if row["month"] == "2030-01"]
+        self.assertEqual(january, [{"month": "2030-01", "status": "paid", "count": 4, "amount": "40.00"}])
+        self.assertEqual(len(aggregates.verify()), 2)  # the made-up classes and payments
+
+
+class JobQueueTests(APITestCase):
+    def setUp(self):
+        make_dataset(1)
+        self.admin = User.objects.create_user(username="admin", role="admin", is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.enrollment = Enrollment.objects.get()
+
+    def post_payment(self, **headers):
+        return self.client.post(
+            "/api/payments/", {"enrollment_id": self.enrollment.pk, "amount": "20.00", "status": "paid"},
+            format="json", HTTP_PREFER="respond-async", **headers,
+        )
+
+    def test_payment_is_saved_by_the_worker(self):
+        response = self.post_payment()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], "queued")
+        self.assertEqual(Payment.objects.count(), 1)
+
+        self.assertEqual(jobs.work_once().status, Job.SUCCEEDED)
+        self.assertIsNone(jobs.work_once())
+        self.assertEqual(Payment.objects.count(), 2)
+        job = self.client.get(response["Location"]).data
+        self.assertEqual((job["status"], job["result"]["amount"]), ("succeeded", "20.00"))
+
+    def test_invalid_payment_is_rejected_before_queueing(self):
+        response = self.client.post(
+            "/api/payments/", {"enrollment_id": 0, "amount": "x"}, format="json", HTTP_PREFER="respond-async",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+    def test_idempotency_key_queues_once(self):
+        first = self.post_payment(HTTP_IDEMPOTENCY_KEY="abc")
+        second = self.post_payment(HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(first.data["id"], second.data["id"])
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_report_job_matches_the_report(self):
+        response = self.client.get("/api/reports/enrollments/", HTTP_PREFER="respond-async")
+        self.assertEqual(response.status_code, 202)
+        jobs.work_once()
+        result = self.client.get(f"/api/jobs/{response.data['id']}/").data["result"]
+        self.assertEqual(result, self.client.get("/api/reports/enrollments/").json())
+
+    def test_jobs_are_private_to_whoever_queued_them(self):
+        url = self.post_payment()["Location"]
+        self.client.force_authenticate(User.objects.get(username="student0"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        jobs.task("tests.flaky", max_attempts=2)(mock.Mock(side_effect=RuntimeError("downstream is down")))
+        self.addCleanup(jobs._tasks.pop, "tests.flaky")
+        job = jobs.enqueue("tests.flaky", {})
+
+        with self.assertLogs("api.jobs", "WARNING"):
+            jobs.work_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIsNone(jobs.work_once())  # not due until the backoff has passed
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs("api.jobs", "ERROR"):
+            self.assertEqual(jobs.work_once().status, Job.FAILED)
+        self.assertIn("downstream is down", Job.objects.get(pk=job.pk).error)
+
+
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        make_dataset(1)
+        self.admin = User.objects.create_user(username="admin", role="admin", is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.body = {"enrollment_id": Enrollment.objects.get().pk, "amount": "20.00", "status": "paid"}
+
+    def post(self, body, key="k-1"):
+        return self.client.post("/api/payments/", body, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.post(self.body)
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            retry = self.post(self.body)
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_enrollment_retry_is_not_a_duplicate(self):
+        student = User.objects.create_user(username="new", role="student")
+        self.client.force_authenticate(student)
+        body = {"martial_class_id": DojoClass.objects.get().pk, "student_id": student.pk}
+        for _ in range(3):
+            response = self.client.post("/api/enrollments/", body, format="json", HTTP_IDEMPOTENCY_KEY="e-1")
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Enrollment.objects.filter(student=student).count(), 1)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self.post(self.body)
+        self.assertEqual(self.post({**self.body, "amount": "99.00"}).status_code, 422)
+
+    def test_retry_while_the_first_request_runs_gets_409(self):
+        self.post(self.body)
+        IdempotencyRecord.objects.update(status_code=None)
+        response = self.post(self.body)
+        self.assertEqual((response.status_code, response["Retry-After"]), (409, "1"))
+
+    def test_errors_release_the_key(self):
+        self.assertEqual(self.post({**self.body, "amount": "x"}).status_code, 400)
+        self.assertEqual(self.post(self.body).status_code, 201)
+
+    def test_keys_are_per_caller(self):
+        self.post(self.body)
+        self.client.force_authenticate(User.objects.create_user(username="admin2", role="admin"))
+        self.assertNotIn("Idempotent-Replayed", self.post(self.body))
+        self.assertEqual(Payment.objects.count(), 3)
+
+    def test_sweep_removes_expired_records(self):
+        self.post(self.body)
+        self.post(self.body, key="k-2")
+        IdempotencyRecord.objects.filter(pk=IdempotencyRecord.objects.first().pk).update(expires_at=timezone.now())
+        call_command("sweep_idempotency", stdout=io.StringIO())
+        self.assertEqual(IdempotencyRecord.objects.count(), 1)
+
+
+@override_settings(SYNC={"LAG_SECONDS": 0, "TOMBSTONE_DAYS": 30})
+class SyncTests(APITestCase):
+    def setUp(self):
+        make_dataset(2)
+        self.student = User.objects.get(username="student0")
+        self.client.force_authenticate(self.student)
+
+    def sync(self, since=None):
+        response = self.client.get("/api/sync/", {"since": since} if since else {})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_first_sync_is_a_snapshot_of_what_the_user_sees(self):
+        body = self.sync()
+        self.assertTrue(body["reset"])
+        self.assertEqual(len(body["changes"]["classes"]["updated"]), 2)
+        self.assertEqual(len(body["changes"]["schedules"]["updated"]), 4)
+        self.assertEqual([row["student_id"] for row in body["changes"]["enrollments"]["updated"]], [self.student.pk])
+        self.assertEqual(len(body["changes"]["payments"]["updated"]), 1)
+
+    def test_unchanged_client_gets_an_empty_delta(self):
+        token = self.sync()["next"]
+        with self.assertNumQueries(5):
+            body = self.sync(token)
+        self.assertEqual((body["reset"], body["changes"]), (False, {}))
+
+    def test_delta_has_only_changed_and_deleted_rows(self):
+        token = self.sync()["next"]
+        dojo_class = DojoClass.objects.get(name="Class 1")
+        dojo_class.capacity = 30
+        dojo_class.save()
+        schedule_id = Schedule.objects.filter(dojo_class=dojo_class).first().pk
+        Schedule.objects.filter(pk=schedule_id).delete()
+        Payment.objects.get(enrollment__student__username="student1").delete()
+
+        changes = self.sync(token)["changes"]
+        self.assertEqual(set(changes), {"classes", "schedules"})
+        self.assertEqual([row["capacity"] for row in changes["classes"]["updated"]], [30])
+        self.assertEqual(changes["schedules"], {"updated": [], "deleted": [schedule_id]})
+
+    def test_stale_or_bad_tokens(self):
+        token = self.sync()["next"]
+        with override_settings(SYNC={"LAG_SECONDS": 0, "TOMBSTONE_DAYS": 0}):
+            self.assertTrue(self.sync(token)["reset"])
+        self.assertEqual(self.client.get("/api/sync/", {"since": "yesterday"}).status_code, 400)
+
+    def test_sweep_removes_old_tombstones(self):
+        Schedule.objects.first().delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - datetime.timedelta(days=31))
+        Schedule.objects.first().delete()
+        call_command("sweep_tombstones", stdout=io.StringIO())
+        self.assertEqual(Tombstone.objects.count(), 1)
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        make_dataset(3)
+        self.karate = DojoClass.objects.get(name="Class 0")
+        self.karate.name, self.karate.description = "Karate basics", "Kicks and kata"
+        self.karate.save()
+        Schedule.objects.filter(dojo_class=self.karate).update(location="Annex")
+        User.objects.filter(username="sensei1").update(first_name="Kara")
+        search.rebuild()
+
+    def search(self, **params):
+        response = self.client.get("/api/search/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_prefix_terms_are_ranked_title_first(self):
+        body = self.search(q="kar")
+        self.assertEqual([(r["type"], r["title"]) for r in body["results"]], [
+            ("class", "Karate basics"), ("user", "sensei1"), ("class", "Class 1"),  # taught by Kara
+        ])
+        self.assertEqual(body["results"][0]["seats_left"], 19)
+        self.assertEqual(self.search(q="karate kata")["count"], 1)
+
+    def test_facets_and_filters(self):
+        facets = self.search(type="class")["facets"]
+        self.assertEqual(facets["weekday"], {"mon": 3, "thu": 3})
+        self.assertEqual(facets["location"], {"Annex": 1, "Main Dojo": 2})
+        self.assertEqual(facets["seats"], {"full": 0, "few": 0, "open": 3})
+        self.assertEqual([r["id"] for r in self.search(location="Annex")["results"]], [self.karate.pk])
+        self.assertEqual(self.search(weekday="sun")["count"], 0)
+        self.assertEqual(self.client.get("/api/search/", {"seats": "lots"}).status_code, 400)
+
+    def test_students_are_only_found_by_staff(self):
+        self.assertEqual(self.search(q="student")["count"], 0)
+        self.client.force_authenticate(User.objects.get(username="sensei0"))
+        body = self.search(q="student", page_size=2)
+        self.assertEqual((body["count"], len(body["results"])), (3, 2))
+        self.assertEqual(body["facets"]["role"], {"student": 3})
+        self.assertEqual(len(self.client.get(body["next"]).json()["results"]), 1)
+
+    def test_saves_and_deletes_keep_the_index_current(self):
+        student = User.objects.create_user(username="judoka", email="judo@example.com", role="student")
+        self.client.force_authenticate(User.objects.get(username="sensei0"))
+        self.assertEqual(self.search(q="judo@example")["results"][0]["id"], student.pk)
+        self.karate.delete()
+        self.assertEqual(self.search(q="karate")["count"], 0)
+
+
+@override_settings(
+    THROTTLE={"BACKEND": "api.throttling.LocalBucketStore", "RATES": {"register": "2/m", "class_list_create": "3/m"}},
+    LOAD_SHEDDING={
+        "MAX_QUEUE_MS": 500, "MAX_LATENCY_MS": 1000, "MIN_SAMPLES": 3,
+        "PROTECTED": ["enrollment_list_create"], "UNTIMED": ["enrollment_export"],
+    },
+)
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        throttling.get_store().clear()
+        throttling.monitor.reset()
+
+    def test_token_bucket_refills(self):
+        store = throttling.LocalBucketStore()
+        self.assertEqual([store.take("k", 2, 1.0, 100.0) for _ in range(3)], [0, 0, 1.0])
+        self.assertEqual(store.take("k", 2, 1.0, 100.5), 0.5)
+        self.assertEqual(store.take("k", 2, 1.0, 101.0), 0)
+
+    def test_buckets_are_per_route_and_client(self):
+        for i in range(2):
+            self.assertEqual(self.client.post("/api/auth/register/", {"username": f"u{i}", "password": "pw-123456"}).status_code, 201)
+        response = self.client.post("/api/auth/register/", {"username": "u3", "password": "pw-123456"})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response["Retry-After"]), range(25, 31))
+        # other routes and other clients have their own buckets
+        self.assertEqual(self.client.get("/api/classes/").status_code, 200)
+        other = self.client.post("/api/auth/register/", {"username": "u4", "password": "pw-123456"}, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(other.status_code, 201)
+
+    def test_authenticated_clients_are_keyed_by_user(self):
+        users = [User.objects.create_user(username=f"s{i}") for i in range(2)]
+        tokens = [str(CustomTokenObtainPairSerializer.get_token(u).access_token) for u in users]
+        for _ in range(3):
+            self.client.get("/api/classes/", HTTP_AUTHORIZATION=f"Bearer {tokens[0]}")
+        self.assertEqual(self.client.get("/api/classes/", HTTP_AUTHORIZATION=f"Bearer {tokens[0]}").status_code, 429)
+        self.assertEqual(self.client.get("/api/classes/", HTTP_AUTHORIZATION=f"Bearer {tokens[1]}").status_code, 200)
+
+    def test_queued_requests_are_shed_except_protected_writes(self):
+        make_dataset(1)
+        student = User.objects.create_user(username="late", role="student")
+        self.client.force_authenticate(student)
+        queued = {"HTTP_X_REQUEST_START": f"t={int((time.time() - 2) * 1_000_000)}"}
+
+        response = self.client.get("/api/classes/", **queued)
+        self.assertEqual((response.status_code, response["Retry-After"]), (503, "5"))
+        self.assertEqual(self.client.get("/api/enrollments/", **queued).status_code, 503)
+        body = {"martial_class_id": DojoClass.objects.get().pk, "student_id": student.pk}
+        self.assertEqual(self.client.post("/api/enrollments/", body, format="json", **queued).status_code, 201)
+
+    def finish(self, *durations):
+        for duration in durations:
+            throttling.monitor.started()
+            throttling.monitor.finished(duration)
+
+    def test_slow_recent_requests_shed_until_the_window_passes(self):
+        self.finish(2.0, 2.0)
+        # too few samples to call it overload
+        self.assertEqual(self.client.get("/api/classes/").status_code, 200)
+        self.finish(2.0, 2.0)
+        self.assertEqual(self.client.get("/api/classes/").status_code, 503)
+        # the readiness probe keeps the instance in rotation
+        self.assertEqual(self.client.get("/api/ready/").status_code, 200)
+        later = time.monotonic() + 10
+        with mock.patch("api.throttling.time.monotonic", return_value=later):
+            self.assertEqual(self.client.get("/api/classes/").status_code, 200)
+
+    def test_latency_is_a_percentile_without_slow_routes(self):
+        self.finish(0.01, 0.01, 5.0)
+        self.assertEqual(self.client.get("/api/classes/").status_code, 200)
+
+        admin = User.objects.create_user(username="boss", role="admin", is_staff=True)
+        self.client.force_authenticate(admin)
+        throttling.monitor.reset()
+        self.assertEqual(self.client.get("/api/enrollments/export/").status_code, 200)
+        self.assertEqual(throttling.monitor.recent_latency(10, 50, 1), 0.0)
+
+
+class ReadinessTests(APITestCase):
+    def setUp(self):
+        readiness._migrated = False
+
+    def test_ready_when_migrated(self):
+        response = self.client.get("/api/ready/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"ready": True, "problems": {}})
+        # warmed: the list views' row mappers are compiled
+        self.assertIn(PaymentSerializer, fastpath_mappers)
+
+    def test_pending_migrations_and_database_errors(self):
+        plan = [(Migration("0099_next", "api"), False)]
+        with mock.patch("api.readiness.MigrationExecutor.migration_plan", return_value=plan):
+            response = self.client.get("/api/ready/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["problems"], {"migrations": "1 unapplied, first api.0099_next"})
+
+        with mock.patch.object(connection, "cursor", side_effect=OperationalError("connection refused")):
+            response = self.client.get("/api/ready/")
+        self.assertEqual(response.json()["problems"], {"database:default": "connection refused"})
+
+    def test_release_connections_closes_pools(self):
+        pooled = mock.Mock()
+        with mock.patch("api.readiness.connections.all", return_value=[pooled]):
+            readiness.release_connections()
+        pooled.close.assert_called_once_with()
+        pooled.close_pool.assert_called_once_with()
+
+    def test_ensure_superuser_is_idempotent(self):
+        env = {"DJANGO_SUPERUSER_USERNAME": "root", "DJANGO_SUPERUSER_PASSWORD": "s3cret-pass"}
+        with mock.patch.dict("os.environ", env):
+            call_command("ensure_superuser", stdout=io.StringIO())
+            call_command("ensure_superuser", stdout=io.StringIO())
+        self.assertTrue(User.objects.get(username="root").is_superuser)
+
+
+class JobWorkerTests(TransactionTestCase):
+    def test_runworker_drains_the_queue(self):
+        make_dataset(1)
+        enrollment = Enrollment.objects.get()
+        for amount in ("10.00", "20.00", "30.00"):
+            jobs.enqueue("payments.create", {"enrollment_id": enrollment.pk, "amount": amount, "status": "paid"})
+        # a job claimed by a worker that died long ago
+        Job.objects.filter(pk=Job.objects.first().pk).update(
+            status=Job.RUNNING, locked_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+
+        out = io.StringIO()
+        call_command("runworker", "--once", "--threads", "2", stdout=out)
+        self.assertIn("Ran 3 job(s), 0 failed.", out.getvalue())
+        self.assertEqual(Payment.objects.count(), 4)
+        self.assertEqual(aggregates.verify(), [])
+
+    @override_settings(JOBS={"LEASE_SECONDS": 0.3})
+    def test_running_jobs_keep_their_lease(self):
+        requeued = []
+
+        def slow(payload):
+            time.sleep(0.6)
+            requeued.append(jobs.requeue_stale())
+            return "done"
+
+        jobs.task("tests.slow")(slow)
+        self.addCleanup(jobs._tasks.pop, "tests.slow")
+        job = jobs.enqueue("tests.slow", {})
+        self.assertEqual(jobs.work_once("w").status, Job.SUCCEEDED)
+        self.assertEqual(requeued, [0])
+
+        # a worker that lost its lease leaves the new run alone
+        job = jobs.enqueue("tests.slow", {})
+        claimed = jobs.claim("w")
+        Job.objects.filter(pk=job.pk).update(locked_by="other")
+        with mock.patch("time.sleep"), self.assertLogs("api.jobs", "WARNING"):
+            jobs.run(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.RUNNING, "other"))
+
+
+class MigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("api", target)])
+        return executor.loader.project_state([("api", target)]).apps
+
+    def test_duplicate_enrollments_are_merged_before_the_unique_constraint(self):
+        old = self.migrate("0006_keyset_pagination_indexes")
+        self.addCleanup(call_command, "migrate", verbosity=0)
+        OldUser = old.get_model("api", "User")
+        student = OldUser.objects.create(username="twice", role="student")
+        instructor = OldUser.objects.create(username="sensei", role="instructor")
+        dojo_class = old.get_model("api", "DojoClass").objects.create(
+            name="Judo", description="", schedule="", capacity=5, instructor=instructor,
+        )
+        OldEnrollment = old.get_model("api", "Enrollment")
+        first, second = (OldEnrollment.objects.create(student=student, martial_class=dojo_class) for _ in range(2))
+        old.get_model("api", "Payment").objects.create(enrollment=second, amount="10.00", status="paid")
+
+        new = self.migrate("0007_enrollment_capacity_waitlist")
+        self.assertEqual(list(new.get_model("api", "Enrollment").objects.values_list("pk", flat=True)), [first.pk])
+        self.assertEqual(new.get_model("api", "Payment").objects.get().enrollment_id, first.pk)
+        self.assertEqual(new.get_model("api", "DojoClass").objects.get().enrolled_count, 1)
+
+
+class QueryPlanTests(APITestCase):
+    def test_access_patterns_use_indexes(self):
+        make_dataset(3)
+        out = io.StringIO()
+        call_command("explain_queries", "--repeat", "1", "--fail-on-scan", stdout=out)
+        self.assertIn("0 pattern(s) with sequential scans.", out.getvalue())
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        make_dataset(2)
+
+    def test_hit_skips_database_and_honours_etag(self):
+        first = self.client.get("/api/classes/")
+        etag = first["ETag"]
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/classes/")
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(self.client.get("/api/classes/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_writes_invalidate(self):
+        before = self.client.get("/api/schedules/").json()
+        Schedule.objects.filter(pk=before[0]["id"]).get().delete()
+        after = self.client.get("/api/schedules/").json()
+        self.assertEqual(len(after), len(before) - 1)
+
+        instructors = self.client.get("/api/instructors/").json()
+        User.objects.create_user(username="new-sensei", role="instructor")
+        self.assertEqual(len(self.client.get("/api/instructors/").json()), len(instructors) + 1)
+
+    def test_lru_backend_evicts_and_expires(self):
+        backend = LocalLRUBackend(max_entries=2, timeout=60)
+        backend.set("a", 1)
+        backend.set("b", 2)
+        backend.get("a")
+        backend.set("c", 3)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), 1)
+        backend.set("d", 4, timeout=-1)
+        self.assertIsNone(backend.get("d"))
+
+    @override_settings(
+        RESPONSE_CACHE={"BACKEND": "api.cache.DjangoCacheBackend", "OPTIONS": {"alias": "default"}},
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    )
+    def test_shared_backend(self):
+        first = self.client.get("/api/classes/")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/classes/").content, first.content)
+
+    @override_settings(WEB_CONCURRENCY=3, RESPONSE_CACHE={"BACKEND": "api.cache.LocalLRUBackend"})
+    def test_per_process_backend_refuses_several_workers(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_backend()
+
+    def test_several_workers_share_versions_by_default(self):
+        # a fresh process: the default is decided when the settings load
+        probe = (
+            "from django.conf import settings\n"
+            "print(settings.RESPONSE_CACHE['BACKEND'], settings.RESPONSE_CACHE['OPTIONS'].get('alias'))\n"
+        )
+        for workers, expected in (("1", "api.cache.LocalLRUBackend None"), ("3", "api.cache.DjangoCacheBackend shared")):
+            env = {**os.environ, "WEB_CONCURRENCY": workers, "DJANGO_SETTINGS_MODULE": "dojo_backend.settings"}
+            env.pop("RESPONSE_CACHE_BACKEND", None)
+            done = subprocess.run(
+                [sys.executable, "-c", "import django; django.setup()\n" + probe],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, env=env,
+            )
+            self.assertEqual(done.stdout.strip(), expected, done.stderr)
+
+
+class ConditionalResponseTests(APITestCase):
+    def setUp(self):
+        make_dataset(5)
+        self.client.force_authenticate(User.objects.create_user(username="admin", role="admin", is_staff=True))
+
+    def test_gzip_above_threshold_only(self):
+        response = self.client.get("/api/payments/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(response.content))[0]["amount"], "50.00")
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+
+        with override_settings(COMPRESSION={"MIN_SIZE": 10 ** 6}):
+            response = self.client.get("/api/payments/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        response = self.client.get("/api/payments/", HTTP_ACCEPT_ENCODING="identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_negotiation(self):
+        available = set(compression.COMPRESSORS)
+        self.assertEqual(compression.choose_encoding("gzip;q=0.5, br", ("br", "gzip")), "br" if "br" in available else "gzip")
+        self.assertEqual(compression.choose_encoding("gzip, br", ("gzip", "br")), "gzip")
+        self.assertEqual(compression.choose_encoding("*;q=0.1, gzip;q=0", ("gzip",)), None)
+        self.assertEqual(compression.choose_encoding("", ("br", "zstd", "gzip")), None)
+
+    def test_compressed_etag_matches_back(self):
+        response = self.client.get("/api/payments/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(response["ETag"].endswith('-gzip"'))
+        with self.assertNumQueries(1):  # the ETag's aggregate, nothing serialized
+            again = self.client.get("/api/payments/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        for url in ("/api/payments/", "/api/enrollments/", "/api/users/"):
+            etag = self.client.get(url)["ETag"]
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        etags = {url: self.client.get(url)["ETag"] for url in ("/api/payments/", "/api/enrollments/")}
+
+        Payment.objects.first().delete()
+        response = self.client.get("/api/payments/", HTTP_IF_NONE_MATCH=etags["/api/payments/"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 4)
+
+        # a nested row changing also changes the list
+        dojo_class = DojoClass.objects.first()
+        dojo_class.name = "Renamed"
+        dojo_class.save()
+        response = self.client.get("/api/enrollments/", HTTP_IF_NONE_MATCH=etags["/api/enrollments/"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail(self):
+        payment = Payment.objects.first()
+        url = f"/api/payments/{payment.pk}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # another row changing leaves this one's ETag alone
+        Payment.objects.exclude(pk=payment.pk).first().save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        payment.status = "refunded"
+        payment.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get("/api/payments/999999/", HTTP_IF_NONE_MATCH=etag).status_code, 404)
+        # `*` only matches a payment that exists
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH="*").status_code, 304)
+        self.assertEqual(self.client.get("/api/payments/999999/", HTTP_IF_NONE_MATCH="*").status_code, 404)
+
+    def test_streamed_export(self):
+        response = self.client.get("/api/payments/export/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertFalse(response.has_header("Content-Length"))
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        again = self.client.get("/api/payments/export/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        # the class name is an exported column
+        dojo_class = DojoClass.objects.first()
+        dojo_class.name = "Renamed"
+        dojo_class.save()
+        again = self.client.get("/api/payments/export/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 200)
+
+
+class ClassSessionTests(APITestCase):
+    MONDAY = datetime.date(2030, 1, 7)
+
+    def setUp(self):
+        make_dataset(2)
+        self.admin = User.objects.create_user(username="admin", role="admin")
+        self.student = User.objects.get(username="student0")
+        self.dojo_class = DojoClass.objects.get(name="Class 0")
+        now = timezone.now()
+        # one session in progress, outside the schedules
+        self.session = ClassSession.objects.create(
+            dojo_class=self.dojo_class, starts_at=now - datetime.timedelta(minutes=10),
+            ends_at=now + datetime.timedelta(minutes=50), location="Main Dojo", capacity=20,
+        )
+
+    def test_generation_is_idempotent(self):
+        self.assertEqual(class_sessions.generate(self.MONDAY, 14), 8)  # 2 classes x 2 slots x 2 weeks
+        self.assertEqual(class_sessions.generate(self.MONDAY, 14), 0)
+        sessions = class_sessions.starting_between(self.MONDAY, self.MONDAY + datetime.timedelta(days=14))
+        self.assertEqual(
+            sorted({(s.starts_at.strftime("%a %H:%M"), s.ends_at - s.starts_at) for s in sessions}),
+            [("Mon 18:00", datetime.timedelta(hours=1)), ("Thu 18:00", datetime.timedelta(hours=1))],
+        )
+        out = io.StringIO()
+        call_command("generate_sessions", "--start", "2030-01-21", "--days", "7", stdout=out)
+        self.assertIn("Created 4 session(s) for 2030-01-21 to 2030-01-27", out.getvalue())
+
+    def test_slot_edits_move_future_sessions_without_attendance(self):
+        schedule = self.dojo_class.schedules.get(weekday="mon")
+        upcoming = list(schedule.sessions.order_by("starts_at"))
+        self.assertGreaterEqual(len(upcoming), 3)  # saved slots get their window of sessions straight away
+        class_sessions.check_in(upcoming[0].pk, [self.student.pk], now=upcoming[0].starts_at)
+
+        schedule.weekday = "wed"
+        schedule.save()
+        days = {s.pk: s.starts_at.strftime("%a") for s in schedule.sessions.all()}
+        self.assertEqual(days.pop(upcoming[0].pk), "Mon")  # attended: kept as it was
+        self.assertEqual(set(days.values()), {"Wed"})
+
+        self.dojo_class.capacity = 30
+        self.dojo_class.save()
+        self.assertEqual(set(schedule.sessions.values_list("capacity", flat=True)), {30})
+
+        schedule.delete()
+        self.assertEqual(list(ClassSession.objects.filter(pk=upcoming[0].pk).values_list("schedule", flat=True)), [None])
+        self.assertFalse(ClassSession.objects.filter(schedule__isnull=True).exclude(pk__in=[upcoming[0].pk, self.session.pk]).exists())
+
+    def test_moving_a_slot_to_another_class_moves_its_sessions(self):
+        schedule = self.dojo_class.schedules.get(weekday="mon")
+        upcoming = list(schedule.sessions.order_by("starts_at"))
+        class_sessions.check_in(upcoming[0].pk, [self.student.pk], now=upcoming[0].starts_at)
+        other = DojoClass.objects.get(name="Class 1")
+        other.capacity = 12
+        other.save()
+
+        schedule.weekday = "wed"
+        schedule.dojo_class = other
+        schedule.save()
+        sessions = {s.pk: (s.dojo_class_id, s.capacity) for s in schedule.sessions.all()}
+        self.assertEqual(sessions.pop(upcoming[0].pk), (self.dojo_class.pk, upcoming[0].capacity))
+        self.assertEqual(set(sessions.values()), {(other.pk, 12)})
+
+        # same times, new class: check-in goes by the new class's enrollments
+        schedule.dojo_class = self.dojo_class
+        schedule.save()
+        sessions = {s.pk: s.dojo_class_id for s in schedule.sessions.exclude(pk=upcoming[0].pk)}
+        self.assertEqual(set(sessions.values()), {self.dojo_class.pk})
+
+    def test_batch_check_in(self):
+        self.client.force_authenticate(self.admin)
+        url = f"/api/sessions/{self.session.pk}/attendance/"
+        outsider = User.objects.get(username="student1")
+        with self.assertNumQueries(7):  # savepoint, lock, enrolled, present, insert, counter, release
+            response = self.client.post(url, {"students": [self.student.pk, self.student.pk, outsider.pk]}, format="json")
+        self.assertEqual(response.json(), {
+            "checked_in": [self.student.pk], "already_checked_in": [], "not_enrolled": [outsider.pk], "full": [],
+            "checked_in_count": 1,
+        })
+        response = self.client.post(url, {"students": [self.student.pk]}, format="json")
+        self.assertEqual(response.json()["already_checked_in"], [self.student.pk])
+        self.assertEqual(ClassSession.objects.get(pk=self.session.pk).checked_in_count, 1)
+        self.assertEqual([row["id"] for row in self.client.get(url).json()], [self.student.pk])
+
+        self.assertEqual(self.client.post(url, {"students": []}, format="json").status_code, 400)
+        self.assertEqual(self.client.post("/api/sessions/999999/attendance/", {"students": [1]}, format="json").status_code, 404)
+
+        self.assertEqual(self.client.delete(f"{url}{self.student.pk}/").status_code, 204)
+        self.assertEqual(ClassSession.objects.get(pk=self.session.pk).checked_in_count, 0)
+        self.assertEqual(self.client.delete(f"{url}{self.student.pk}/").status_code, 404)
+
+    def test_check_in_stops_at_capacity(self):
+        others = [User.objects.create_user(username=f"walk-in{i}", role="student") for i in range(3)]
+        for student in others:
+            Enrollment.objects.create(student=student, martial_class=self.dojo_class)
+        ClassSession.objects.filter(pk=self.session.pk).update(capacity=3)
+        class_sessions.check_in(self.session.pk, [self.student.pk])
+
+        result = class_sessions.check_in(self.session.pk, [s.pk for s in others])
+        self.assertEqual(result["checked_in"], [others[0].pk, others[1].pk])
+        self.assertEqual(result["full"], [others[2].pk])
+        self.assertEqual(result["checked_in_count"], 3)
+        self.assertEqual(ClassSession.objects.get(pk=self.session.pk).checked_in_count, 3)
+        self.assertEqual(Attendance.objects.filter(session=self.session).count(), 3)
+
+        self.client.force_authenticate(others[2])
+        response = self.client.post(f"/api/sessions/{self.session.pk}/attendance/")
+        self.assertEqual((response.json()["checked_in"], response.json()["full"]), ([], [others[2].pk]))
+
+    def test_check_in_opens_before_the_start(self):
+        later = ClassSession.objects.create(
+            dojo_class=self.dojo_class, starts_at=timezone.now() + datetime.timedelta(hours=3),
+            ends_at=timezone.now() + datetime.timedelta(hours=4), capacity=20,
+        )
+        with self.assertRaises(ValidationError):
+            class_sessions.check_in(later.pk, [self.student.pk])
+
+    def test_students_check_only_themselves_in(self):
+        self.client.force_authenticate(self.student)
+        url = f"/api/sessions/{self.session.pk}/attendance/"
+        self.assertEqual(self.client.post(url, {"students": [self.admin.pk]}, format="json").status_code, 403)
+        self.assertEqual(self.client.post(url).json()["checked_in"], [self.student.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get("/api/sessions/now/").status_code, 403)
+
+    def test_in_class_now(self):
+        class_sessions.check_in(self.session.pk, [self.student.pk])
+        Attendance.objects.create(session=self.session, student=User.objects.get(username="student1"))
+        self.client.force_authenticate(self.admin)
+        with self.assertNumQueries(2):  # running sessions, their attendees
+            rows = self.client.get("/api/sessions/now/").json()
+        self.assertEqual([row["id"] for row in rows], [self.session.pk])
+        self.assertEqual(rows[0]["checked_in_count"], 2)
+        self.assertEqual([a["username"] for a in rows[0]["attendees"]], ["student0", "student1"])
+
+    def test_listing(self):
+        class_sessions.generate(self.MONDAY, 14)
+        rows = self.client.get("/api/sessions/", {"start": "2030-01-07", "days": 7, "class": self.dojo_class.pk}).json()
+        self.assertEqual([(row["class_name"], row["starts_at"][:16]) for row in rows],
+                         [("Class 0", "2030-01-07T18:00"), ("Class 0", "2030-01-10T18:00")])
+        self.assertEqual(self.client.get("/api/sessions/", {"days": 40}).status_code, 400)
+        self.assertEqual(self.client.get("/api/sessions/", {"class": "abc"}).status_code, 400)
+
+
+class StudentScheduleTests(APITestCase):
+    def setUp(self):
+        get_backend().clear()
+        make_dataset(3)
+        self.student = User.objects.get(username="student0")
+        for dojo_class in DojoClass.objects.exclude(name="Class 0"):
+            Enrollment.objects.create(student=self.student, martial_class=dojo_class)
+        self.client.force_authenticate(self.student)
+
+    def test_one_query_then_cached(self):
+        with self.assertNumQueries(2):  # the schedules, and the feed token version for the Link
+            first = self.client.get("/api/student/schedule/")
+        self.assertEqual(len(first.json()), 6)
+        with self.assertNumQueries(1):  # the feed token version, never cached
+            self.assertEqual(self.client.get("/api/student/schedule/").content, first.content)
+        # the cache is per student
+        self.client.force_authenticate(User.objects.get(username="student1"))
+        self.assertEqual(len(self.client.get("/api/student/schedule/").json()), 2)
+
+    def test_enrollment_and_schedule_changes_invalidate(self):
+        self.client.get("/api/student/schedule/")
+        withdraw(Enrollment.objects.filter(student=self.student).last())
+        self.assertEqual(len(self.client.get("/api/student/schedule/").json()), 4)
+        Schedule.objects.filter(dojo_class__name="Class 0").update(location="Annex")  # no signal
+        Schedule.objects.filter(dojo_class__name="Class 0").first().save()
+        rows = self.client.get("/api/student/schedule/").json()
+        self.assertEqual({row["location"] for row in rows}, {"Main Dojo", "Annex"})
+
+    def test_ics_feed_with_conditional_get(self):
+        link = self.client.get("/api/student/schedule/")["Link"]
+        url = link[link.index("<") + 1:link.index(">")]
+        self.client.force_authenticate(None)
+
+        with self.assertNumQueries(2):  # the token's version, the schedules
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        body = response.content.decode()
+        self.assertEqual(body.count("BEGIN:VEVENT"), 6)
+        self.assertIn("RRULE:FREQ=WEEKLY", body)
+        self.assertIn("SUMMARY:Class 1", body)
+        self.assertRegex(body, r"DTSTART:\d{8}T180000Z")
+        self.assertNotIn("TZID", body)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        self.assertEqual(self.client.get("/api/student/schedule.ics?token=forged").status_code, 401)
+        self.assertEqual(self.client.get("/api/student/schedule.ics").status_code, 401)
+
+    def test_feed_urls_can_be_revoked(self):
+        link = self.client.get("/api/student/schedule/")["Link"]
+        old_url = link[link.index("<") + 1:link.index(">")]
+        new_url = self.client.post("/api/student/calendar-token/").json()["url"]
+        self.assertNotEqual(new_url, old_url)
+        self.assertIn(new_url, self.client.get("/api/student/schedule/")["Link"])
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(old_url).status_code, 401)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+
+
+class StatelessAuthTests(APITestCase):
+    def setUp(self):
+        active_status.clear()
+        self.admin = User.objects.create_user(username="boss", password="pw-123456", role="admin")
+        token = self.client.post("/api/token/", {"username": "boss", "password": "pw-123456"}).data["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_role_checks_skip_user_lookup(self):
+        self.client.get("/api/admin/stats/")  # warms the active-status cache
+        with self.assertNumQueries(1):  # just the counters
+            response = self.client.get("/api/admin/stats/")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(STATELESS_JWT={"ACTIVE_CACHE_TTL": 30})
+    def test_deactivated_user_is_rejected(self):
+        self.admin.is_active = False
+        self.admin.save()
+        self.assertEqual(self.client.get("/api/admin/stats/").status_code, 401)
+
+    def test_active_status_cache_is_bounded(self):
+        users = [User.objects.create_user(username=f"u{i}") for i in range(3)]
+        for user in users:
+            active_status.is_active(user.pk, 30, max_entries=2)
+        self.assertEqual(len(active_status), 2)
+        with self.assertNumQueries(1):  # the first one was evicted
+            active_status.is_active(users[2].pk, 30, max_entries=2)
+            active_status.is_active(users[0].pk, 30, max_entries=2)
+
+
+class BulkCreateTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", role="admin")
+        self.client.force_authenticate(self.admin)
+        make_dataset(2)
+        self.dojo_class = DojoClass.objects.first()
+
+    def test_schedule_import_is_one_round_trip(self):
+        rows = [
+            {"dojo_class": self.dojo_class.pk, "weekday": "tue", "start_time": f"{8 + i}:00", "end_time": f"{8 + i}:45"}
+            for i in range(10)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/schedules/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data), 10)
+        # the IN lookup and the INSERTs (slots, then their sessions) run once regardless of batch size
+        self.assertEqual(sum('INSERT INTO "api_schedule"' in q["sql"] for q in ctx.captured_queries), 1)
+        self.assertEqual(sum('INTO "api_classsession"' in q["sql"] for q in ctx.captured_queries), 1)
+        self.assertEqual(sum('FROM "api_dojoclass"' in q["sql"] for q in ctx.captured_queries), 1)
+
+    def test_errors_are_reported_per_item(self):
+        rows = [
+            {"enrollment_id": Enrollment.objects.first().pk, "amount": "10.00", "status": "paid"},
+            {"enrollment_id": 999999, "amount": "10.00", "status": "paid"},
+        ]
+        response = self.client.post("/api/payments/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("enrollment_id", response.data[1])
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_duplicate_enrollments_are_reported_per_item(self):
+        enrollment = Enrollment.objects.first()
+        rows = [
+            {"student_id": enrollment.student_id, "martial_class_id": DojoClass.objects.last().pk},
+            {"student_id": enrollment.student_id, "martial_class_id": enrollment.martial_class_id},
+        ]
+        response = self.client.post("/api/enrollments/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("non_field_errors", response.data[1])
+
+    def test_payments_keep_aggregates_in_sync(self):
+        enrollment = Enrollment.objects.first()
+        rows = [{"enrollment_id": enrollment.pk, "amount": "10.00", "status": "pending"}] * 5
+        self.assertEqual(self.client.post("/api/payments/bulk/", rows, format="json").status_code, 201)
+        self.assertEqual(aggregates.verify(), [])
+
+    def test_enrollments_respect_capacity(self):
+        self.dojo_class.capacity = 2
+        self.dojo_class.save()
+        students = [User.objects.create_user(username=f"bulk{i}", role="student") for i in range(3)]
+        rows = [{"student_id": s.pk, "martial_class_id": self.dojo_class.pk} for s in students]
+        response = self.client.post("/api/enrollments/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data["enrolled"]), 1)  # one seat was already taken
+        self.assertEqual(len(response.data["waitlisted"]), 2)
+        self.assertEqual(aggregates.verify(), [])
+
+        again = self.client.post("/api/enrollments/bulk/", rows[:1] * 2, format="json")
+        self.assertEqual(again.status_code, 400)
+
+    def test_enrollments_made_since_validation_fail_the_batch(self):
+        student = User.objects.create_user(username="racer", role="student")
+        rows = [{"student_id": student.pk, "martial_class_id": self.dojo_class.pk}]
+        enroll(student, self.dojo_class)
+        seats = DojoClass.objects.get(pk=self.dojo_class.pk).enrolled_count
+        # as if the single enroll had committed between validation and the insert
+        with mock.patch("api.serializers.existing_enrollment_pairs", return_value=set()):
+            response = self.client.post("/api/enrollments/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [{"non_field_errors": ["Student is already enrolled in this class."]}])
+        self.assertEqual(DojoClass.objects.get(pk=self.dojo_class.pk).enrolled_count, seats)
+
+    def test_enrolling_clears_the_waitlist_entry(self):
+        student = User.objects.create_user(username="waiting", role="student")
+        WaitlistEntry.objects.create(student=student, martial_class=self.dojo_class)
+        rows = [{"student_id": student.pk, "martial_class_id": self.dojo_class.pk}]
+        response = self.client.post("/api/enrollments/bulk/", rows, format="json")
+        self.assertEqual(len(response.data["enrolled"]), 1)
+        self.assertFalse(WaitlistEntry.objects.filter(student=student).exists())
+
+
+class TimetableTests(APITestCase):
+    def setUp(self):
+        make_dataset(2)  # mon and thu 18:00-19:00 at Main Dojo, one instructor per class
+        self.admin = User.objects.create_user(username="admin", role="admin")
+        self.client.force_authenticate(self.admin)
+        self.dojo_class = DojoClass.objects.get(name="Class 0")
+
+    def slot(self, **overrides):
+        return {"dojo_class": self.dojo_class.pk, "weekday": "tue", "start_time": "18:00",
+                "end_time": "19:00", "location": "Studio A", **overrides}
+
+    def test_minute_of_week_fields(self):
+        schedule = Schedule.objects.filter(dojo_class=self.dojo_class, weekday="thu").get()
+        self.assertEqual((schedule.weekday_index, schedule.start_minute, schedule.end_minute), (3, 5400, 5460))
+
+    def test_running_at(self):
+        response = self.client.get("/api/timetable/", {"at": "thu 18:30"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["weekday"] for row in response.json()], ["thu", "thu"])
+        self.assertEqual(self.client.get("/api/timetable/", {"at": "thu 19:00"}).json(), [])
+        self.assertEqual(self.client.get("/api/timetable/", {"at": "thu 18:30", "location": "Annex"}).json(), [])
+        self.assertEqual(self.client.get("/api/timetable/", {"at": "someday"}).status_code, 400)
+
+    def test_slot_past_midnight_on_sunday(self):
+        Schedule.objects.create(
+            dojo_class=self.dojo_class, weekday="sun", location="Annex",
+            start_time=datetime.time(23, 0), end_time=datetime.time(1, 0),
+        )
+        self.assertEqual(len(self.client.get("/api/timetable/", {"at": "mon 00:30"}).json()), 1)
+
+    def test_double_booking_across_the_week_wrap_is_rejected(self):
+        late = self.client.post("/api/schedules/", self.slot(weekday="sun", start_time="23:00", end_time="01:00"))
+        self.assertEqual(late.status_code, 201, late.data)
+        response = self.client.post("/api/schedules/", self.slot(
+            dojo_class=DojoClass.objects.get(name="Class 1").pk, weekday="mon", start_time="00:30", end_time="01:30",
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Location is already booked", response.data["location"][0])
+
+        rows = [self.slot(weekday="mon", start_time="00:00", end_time="00:45", location="Annex"),
+                self.slot(weekday="sun", start_time="23:30", end_time="00:15", location="Annex")]
+        response = self.client.post("/api/schedules/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("location", response.data[1])
+
+    def test_weekday_listing_is_in_time_order(self):
+        Schedule.objects.create(dojo_class=self.dojo_class, weekday="mon", location="Annex",
+                                start_time=datetime.time(7, 0), end_time=datetime.time(8, 0))
+        rows = self.client.get("/api/timetable/", {"weekday": "mon"}).json()
+        self.assertEqual([row["start_time"] for row in rows], ["07:00:00", "18:00:00", "18:00:00"])
+
+    def test_location_double_booking_is_rejected(self):
+        other = DojoClass.objects.get(name="Class 1")
+        response = self.client.post("/api/schedules/", self.slot(dojo_class=other.pk, weekday="mon",
+                                                                  start_time="18:30", location="Main Dojo"))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Location is already booked", response.data["location"][0])
+
+    def test_instructor_double_booking_is_rejected(self):
+        response = self.client.post("/api/schedules/", self.slot(weekday="mon", start_time="17:30", end_time="18:15"))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Instructor is already booked", response.data["dojo_class"][0])
+
+    def test_adjacent_slots_and_own_updates_are_allowed(self):
+        response = self.client.post("/api/schedules/", self.slot(weekday="mon", start_time="19:00", end_time="20:00"))
+        self.assertEqual(response.status_code, 201, response.data)
+        moved = self.client.patch(f"/api/schedules/{response.data['id']}/", {"end_time": "20:30"})
+        self.assertEqual(moved.status_code, 200, moved.data)
+
+    def test_bulk_checks_the_batch_against_itself(self):
+        rows = [self.slot(), self.slot(start_time="18:45", end_time="19:30", location="Studio B"), self.slot(weekday="wed")]
+        response = self.client.post("/api/schedules/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("dojo_class", response.data[1])
+        self.assertEqual(response.data[2], {})
+
+        response = self.client.post("/api/schedules/bulk/", [rows[0], rows[2]], format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Schedule.objects.filter(location="Studio A", start_minute=2 * 1440 + 18 * 60).count(), 1)
+
+
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        make_dataset(3)
+        self.admin = User.objects.create_user(username="boss", password="pw-123456", role="admin")
+        self.token = self.client.post(
+            "/api/token/", {"username": "boss", "password": "pw-123456"}
+        ).data["access"]
+        self.factory = AsyncRequestFactory()
+
+    async def test_async_lists_match_sync_views(self):
+        for url, view in (("/api/classes/", async_views.class_list), ("/api/schedules/", async_views.schedule_list)):
+            expected = await sync_to_async(self.client.get)(url, HTTP_ACCEPT="application/json")
+            response = await view(self.factory.get(url, headers={"Accept": "application/json"}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+    async def test_admin_stats_requires_token(self):
+        response = await async_views.admin_stats(self.factory.get("/api/admin/stats/"))
+        self.assertEqual(response.status_code, 401)
+        response = await async_views.admin_stats(
+            self.factory.get("/api/admin/stats/", headers={"Authorization": f"Bearer {self.token}"})
+        )
+        self.assertEqual(json.loads(response.content)["totalClasses"], 3)
+        # tagged like the sync view, so dashboards get their 304 under either server
+        expected = await sync_to_async(self.client.get)("/api/admin/stats/", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertEqual(response["ETag"], expected["ETag"])
+        response = await async_views.admin_stats(self.factory.get(
+            "/api/admin/stats/", headers={"Authorization": f"Bearer {self.token}", "If-None-Match": response["ETag"]},
+        ))
+        self.assertEqual(response.status_code, 304)
+
+    def test_asgi_middleware_chain_stays_async(self):
+        # a fresh process: MIDDLEWARE is decided when the settings load
+        probe = (
+            "from asgiref.sync import SyncToAsync, iscoroutinefunction\n"
+            "from dojo_backend.asgi import application\n"
+            "chain = application.application._middleware_chain\n"
+            "print(iscoroutinefunction(chain) and not isinstance(chain, SyncToAsync))\n"
+        )
+        done = subprocess.run(
+            [sys.executable, "-c", probe], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, "ASYNC_VIEWS": "1", "DJANGO_SETTINGS_MODULE": "dojo_backend.settings"},
+        )
+        self.assertEqual(done.stdout.strip(), "True", done.stderr)
+
+    def test_asgi_static_files_go_through_whitenoise(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, WHITENOISE_MAX_AGE=600):
+            with open(os.path.join(root, "site.css"), "w") as f:
+                f.write("body { margin: 0 }" * 100)
+            with mock.patch.dict("os.environ"):
+                from dojo_backend.asgi import WhiteNoiseStaticHandler
+            handler = WhiteNoiseStaticHandler(mock.Mock())
+            response = handler.serve(RequestFactory().get("/static/site.css"))
+            self.assertEqual(response["Cache-Control"], "max-age=600, public")
+            self.assertIn("Last-Modified", response)
+            with self.assertRaises(Http404):
+                handler.serve(RequestFactory().get("/static/missing.css"))
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        make_dataset(2)
+        self.admin = User.objects.create_user(username="admin", role="admin")
+        self.client.force_authenticate(self.admin)
+
+    def test_server_timing_and_prometheus_output(self):
+        response = self.client.get("/api/payments/")
+        self.assertIn('desc="3 queries"', response["Server-Timing"])
+
+        text = self.client.get("/api/metrics/").content.decode()
+        self.assertIn('api_request_duration_seconds_count{endpoint="payment_list_create"} 1', text)
+        self.assertIn('api_request_queries_total{endpoint="payment_list_create"} 3', text)
+
+    def test_render_time_covers_every_response_path(self):
+        def render_time(endpoint):
+            return metrics_registry._series[endpoint].render_time
+
+        self.client.get("/api/payments/")  # fast path
+        self.client.get(f"/api/payments/{Payment.objects.first().pk}/")  # serializer and DRF rendering
+        self.client.get("/api/instructors/")  # cached body, built on the miss
+        for endpoint in ("payment_list_create", "payment_detail", "instructor-list"):
+            self.assertGreater(render_time(endpoint), 0, endpoint)
+
+        before = render_time("instructor-list")
+        self.client.get("/api/instructors/")  # the hit serves the stored bytes
+        self.assertEqual(render_time("instructor-list"), before)
+
+    def test_server_timing_is_for_staff(self):
+        self.client.force_authenticate(User.objects.get(username="student0"))
+        self.assertFalse(self.client.get("/api/payments/").has_header("Server-Timing"))
+        self.client.force_authenticate(None)
+        self.assertFalse(self.client.get("/api/classes/").has_header("Server-Timing"))
+
+    def test_metrics_are_admin_only(self):
+        self.client.force_authenticate(User.objects.get(username="student0"))
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+
+    @override_settings(REQUEST_METRICS={"SLOW_REQUEST_MS": 0})
+    def test_slow_requests_log_fingerprints(self):
+        # the test client builds its middleware chain on first use, after the override
+        with self.assertLogs("api.slow_requests", "WARNING") as logs:
+            self.client.get("/api/payments/")
+        self.assertIn("slow request GET /api/payments/ (payment_list_create)", logs.output[0])
+        self.assertIn("1x SELECT", logs.output[0])
+
+    def test_fingerprint_collapses_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+
+
+@override_settings(REPLICA_ROUTING={"REPLICAS": ["replica"], "STICKY_SECONDS": 5})
+class ReplicaRoutingTests(TransactionTestCase):
+    """`replica` mirrors the test database; the alias a query ran on shows where a read went."""
+
+    databases = {"default", "replica"}
+    client_class = APIClient
+
+    def setUp(self):
+        get_backend().clear()
+        self.sensei = User.objects.create_user(username="sensei", role="instructor")
+        DojoClass.objects.create(name="Dojo", description="", instructor=self.sensei, schedule="", capacity=5)
+
+    def replica_reads(self, request):
+        """(response, queries the replica ran) for `request()`."""
+        get_backend().clear()
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = request()
+        return response, len(replica)
+
+    def test_safe_requests_read_from_the_replica(self):
+        response, reads = self.replica_reads(lambda: self.client.get("/api/classes/"))
+        self.assertEqual([c["name"] for c in response.json()], ["Dojo"])
+        self.assertGreater(reads, 0)
+
+    def test_writer_reads_its_own_writes(self):
+        self.client.force_authenticate(self.sensei)
+        response, reads = self.replica_reads(lambda: self.client.post("/api/classes/", {
+            "name": "New", "description": "Kata", "instructor_id": self.sensei.pk, "schedule": "Mon", "capacity": 5,
+        }, format="json"))
+        self.assertEqual((response.status_code, reads), (201, 0))
+        self.assertEqual(response.cookies["primary_reads"]["max-age"], 5)
+        # the cookie keeps the same client on the primary for a while
+        self.assertEqual(self.replica_reads(lambda: self.client.get("/api/classes/"))[1], 0)
+
+    def test_request_stays_on_the_primary_after_writing(self):
+        token = routing_state.set(RoutingState("replica", pinned=False))
+        try:
+            self.assertEqual(DojoClass.objects.all().db, "replica")
+            DojoClass.objects.filter(name="Dojo").update(capacity=6)
+            self.assertEqual(DojoClass.objects.all().db, "default")
+        finally:
+            routing_state.reset(token)
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.assertEqual(DojoClass.objects.all().db, "default")
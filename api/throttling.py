@@ -0,0 +1,325 @@
+"""
+Rate limiting and load shedding, ahead of the views.
+
+ThrottleMiddleware answers before any view code runs:
+
+- 503 with Retry-After when this process is overloaded and the request is
+  not a write to one of LOAD_SHEDDING['PROTECTED'] (the enrollment and
+  payment endpoints). Overloaded means the proxy's X-Request-Start says the
+  request queued longer than MAX_QUEUE_MS, the LATENCY_PERCENTILE of at
+  least MIN_SAMPLES recent requests is over MAX_LATENCY_MS, or more than
+  MAX_IN_FLIGHT are being served. Routes in EXEMPT (the readiness probe) are
+  never shed; those in UNTIMED (reports, exports) are slow by design and
+  left out of the latency signal.
+- 429 with Retry-After when the client's token bucket for the route is
+  empty. A bucket is keyed by the URL name and the client: the user id of a
+  valid access token, otherwise the IP. Rates come from THROTTLE['RATES'],
+  e.g. '10/m' is a burst of 10 refilled at 10 a minute.
+
+Buckets live in THROTTLE['BACKEND']: LocalBucketStore counts per process;
+CacheBucketStore keeps them in a CACHES alias (Redis) shared by all workers.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _throttle_config():
+    return {
+        "ENABLED": True,
+        "BACKEND": "api.throttling.LocalBucketStore",
+        "OPTIONS": {},
+        "PROXY_COUNT": 0,
+        "DEFAULT_RATE": None,
+        "RATES": {},
+        **getattr(settings, "THROTTLE", {}),
+    }
+
+
+def _shedding_config():
+    return {
+        "MAX_QUEUE_MS": 0,
+        "MAX_LATENCY_MS": 0,
+        "MAX_IN_FLIGHT": 0,
+        "LATENCY_WINDOW_SECONDS": 10,
+        "LATENCY_PERCENTILE": 50,
+        "MIN_SAMPLES": 20,
+        "RETRY_AFTER": 5,
+        "PROTECTED": (),
+        "EXEMPT": ("ready",),
+        "UNTIMED": (),
+        **getattr(settings, "LOAD_SHEDDING", {}),
+    }
+
+
+def parse_rate(rate):
+    """'10/m' -> (burst capacity, tokens added per second)."""
+    count, period = rate.split("/")
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+def _take(state, capacity, per_second, now):
+    """Token bucket step: (new state, seconds to wait; 0 means admitted)."""
+    tokens, stamp = state if state else (capacity, now)
+    tokens = min(capacity, tokens + (now - stamp) * per_second)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / per_second
+
+
+class LocalBucketStore:
+    """Per-process buckets, least recently used dropped beyond `max_keys`; fine for tests and one worker."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, per_second, now):
+        with self._lock:
+            state, wait = _take(self._buckets.get(key), capacity, per_second, now)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Buckets in a Django CACHES alias, shared by every worker. Read-modify-write,
+    so two workers racing on one key can each admit a request: limits hold to
+    within a request or two, which is what they are for.
+    """
+
+    def __init__(self, alias="default", prefix="throttle"):
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def take(self, key, capacity, per_second, now):
+        key = f"{self.prefix}:{key}"
+        state, wait = _take(self.cache.get(key), capacity, per_second, now)
+        # a bucket left alone this long is full again, same as a missing one
+        self.cache.set(key, state, math.ceil(capacity / per_second))
+        return wait
+
+    def clear(self):
+        self.cache.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = _throttle_config()
+                _store = import_string(config["BACKEND"])(**config["OPTIONS"])
+    return _store
+
+
+class LoadMonitor:
+    """This process's in-flight count and the durations of its recent requests."""
+
+    def __init__(self, max_samples=1000):
+        self.in_flight = 0
+        self._samples = deque(maxlen=max_samples)  # (finished at, seconds)
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, duration=None):
+        """Count a request as done; `duration` None leaves it out of the latency signal."""
+        with self._lock:
+            self.in_flight -= 1
+            if duration is not None:
+                self._samples.append((time.monotonic(), duration))
+
+    def recent_latency(self, window, percentile=50, min_samples=1):
+        """
+        The `percentile`th of the durations finished in the last `window`
+        seconds, or 0.0 with fewer than `min_samples` of them: one slow request
+        after a quiet spell is not overload, and with nothing finished lately
+        (everything shed) old numbers don't keep the process shedding.
+        """
+        cutoff = time.monotonic() - window
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            durations = sorted(duration for _, duration in self._samples)
+        if not durations or len(durations) < min_samples:
+            return 0.0
+        return durations[max(math.ceil(len(durations) * percentile / 100) - 1, 0)]
+
+    def reset(self):
+        with self._lock:
+            self.in_flight = 0
+            self._samples.clear()
+
+
+monitor = LoadMonitor()
+
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs):
+    global _store
+    if setting == "THROTTLE":
+        _store = None
+    elif setting == "LOAD_SHEDDING":
+        monitor.reset()
+
+
+def queue_seconds(request, now):
+    """Time since the proxy received the request, from X-Request-Start; None without the header."""
+    raw = request.META.get("HTTP_X_REQUEST_START", "").removeprefix("t=")
+    try:
+        started = float(raw)
+    except ValueError:
+        return None
+    # Heroku sends milliseconds, nginx seconds ($msec) or microseconds
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(now - started, 0.0)
+
+
+def client_ip(request, proxy_count):
+    if proxy_count:
+        hops = [hop.strip() for hop in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if hop.strip()]
+        if len(hops) >= proxy_count:
+            return hops[-proxy_count]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+_jwt = JWTStatelessUserAuthentication()
+
+
+def client_key(request, proxy_count):
+    header = _jwt.get_header(request)
+    raw = _jwt.get_raw_token(header) if header else None
+    if raw:
+        try:
+            return f"user:{_jwt.get_validated_token(raw)[jwt_settings.USER_ID_CLAIM]}"
+        except (InvalidToken, TokenError, KeyError):
+            pass  # counted by IP; the view rejects the token itself
+    return f"ip:{client_ip(request, proxy_count)}"
+
+
+def _reject(status, detail, wait):
+    response = JsonResponse({"detail": detail}, status=status)
+    response["Retry-After"] = str(max(1, math.ceil(wait)))
+    return response
+
+
+class ThrottleMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        route = self.route(request)
+        rejected = self.admit(request, route)
+        if rejected is not None:
+            return rejected
+        monitor.started()
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            monitor.finished(self.timed(route, time.perf_counter() - start))
+
+    async def __acall__(self, request):
+        route = self.route(request)
+        # the shared store may be a network round trip
+        rejected = await sync_to_async(self.admit)(request, route)
+        if rejected is not None:
+            return rejected
+        monitor.started()
+        start = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            monitor.finished(self.timed(route, time.perf_counter() - start))
+
+    @staticmethod
+    def route(request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return "unmatched"
+        # so the metrics middleware files rejected requests under the route too
+        request.resolver_match = match
+        return match.url_name or match.route
+
+    @staticmethod
+    def timed(route, duration):
+        """`duration`, or None for routes left out of the latency signal."""
+        config = _shedding_config()
+        return None if route in config["EXEMPT"] or route in config["UNTIMED"] else duration
+
+    def admit(self, request, route):
+        """None to let the request through, or the 503/429 to answer with."""
+        wait = self.shed(request, route)
+        if wait:
+            return _reject(503, "The server is busy; try again shortly.", wait)
+        wait = self.throttle(request, route)
+        if wait:
+            return _reject(429, f"Request was throttled. Expected available in {math.ceil(wait)} seconds.", wait)
+        return None
+
+    def shed(self, request, route):
+        config = _shedding_config()
+        if route in config["EXEMPT"] or (request.method not in SAFE_METHODS and route in config["PROTECTED"]):
+            return 0
+        now = time.time()
+        queued = queue_seconds(request, now)
+        overloaded = (
+            (config["MAX_QUEUE_MS"] and queued is not None and queued * 1000 > config["MAX_QUEUE_MS"])
+            or (config["MAX_IN_FLIGHT"] and monitor.in_flight >= config["MAX_IN_FLIGHT"])
+            or (config["MAX_LATENCY_MS"] and monitor.recent_latency(
+                config["LATENCY_WINDOW_SECONDS"], config["LATENCY_PERCENTILE"], config["MIN_SAMPLES"],
+            ) * 1000 > config["MAX_LATENCY_MS"])
+        )
+        return config["RETRY_AFTER"] if overloaded else 0
+
+    def throttle(self, request, route):
+        config = _throttle_config()
+        rate = config["RATES"].get(route, config["DEFAULT_RATE"])
+        if not config["ENABLED"] or not rate or request.method == "OPTIONS":
+            return 0
+        capacity, per_second = parse_rate(rate)
+        key = f"{route}:{client_key(request, config['PROXY_COUNT'])}"
+        return get_store().take(key, capacity, per_second, time.time())
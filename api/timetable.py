@@ -0,0 +1,143 @@
+"""
+Weekly timetable queries and double-booking checks.
+
+Schedule.save() stores every slot as the integer range [start_minute, end_minute),
+minutes counted from Monday 00:00 (see Schedule.sync_timetable), so "what runs at
+Tue 18:30" and "what overlaps this slot" are range lookups on the
+schedule_week_range_idx / schedule_location_range_idx indexes rather than string
+comparisons over every schedule in Python.
+
+A slot conflicts with another when the ranges overlap and they share a location
+or an instructor.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_time
+
+from .models import Schedule
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+WEEKDAYS = [code for code, _ in Schedule.WEEKDAY_CHOICES]
+
+
+def minute_of_week(weekday_index, time):
+    return weekday_index * MINUTES_PER_DAY + time.hour * 60 + time.minute
+
+
+def parse_at(value):
+    """
+    Minute of the week for `?at=`: either "<weekday> HH:MM" ("tue 18:30", "tue-18:30")
+    or an ISO datetime, read in the project time zone. Raises ValueError.
+    """
+    value = value.strip()
+    day, _, rest = value.replace('-', ' ', 1).partition(' ')
+    if day[:3].lower() in WEEKDAYS and day.isalpha():
+        time = parse_time(rest.strip())
+        if time is None:
+            raise ValueError(f"Invalid time in {value!r}.")
+        return minute_of_week(WEEKDAYS.index(day[:3].lower()), time)
+
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(f"Expected '<weekday> HH:MM' or an ISO datetime, got {value!r}.")
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return minute_of_week(moment.weekday(), moment.time())
+
+
+def running_at(minute, queryset=None):
+    """Schedules in progress at `minute`, including a Sunday slot that runs past midnight."""
+    queryset = Schedule.objects.all() if queryset is None else queryset
+    # no slot is longer than a day, which bounds both branches to a start_minute range
+    return queryset.filter(
+        Q(start_minute__gt=minute - MINUTES_PER_DAY, start_minute__lte=minute, end_minute__gt=minute)
+        | Q(start_minute__gt=minute + MINUTES_PER_WEEK - MINUTES_PER_DAY,
+            start_minute__lte=minute + MINUTES_PER_WEEK, end_minute__gt=minute + MINUTES_PER_WEEK)
+    )
+
+
+def _week_shifts(start_minute, end_minute):
+    """Offsets at which [start_minute, end_minute) can meet another slot: as is, and across the Sunday/Monday wrap."""
+    yield 0
+    if end_minute > MINUTES_PER_WEEK:
+        # runs past Sunday midnight: its tail is Monday morning
+        yield -MINUTES_PER_WEEK
+    if start_minute < MINUTES_PER_DAY:
+        # Monday: a Sunday slot running past midnight may reach into it
+        yield MINUTES_PER_WEEK
+
+
+def overlapping(start_minute, end_minute, queryset=None):
+    """Schedules whose range overlaps [start_minute, end_minute), around the end of the week too."""
+    queryset = Schedule.objects.all() if queryset is None else queryset
+    # slots are at most a day long, so the lower bound keeps each branch an index range
+    match = Q()
+    for shift in _week_shifts(start_minute, end_minute):
+        start, end = start_minute + shift, end_minute + shift
+        match |= Q(start_minute__gt=start - MINUTES_PER_DAY, start_minute__lt=end, end_minute__gt=start)
+    return queryset.filter(match)
+
+
+def overlaps(slot, other):
+    return any(
+        other.start_minute < slot.end_minute + shift and slot.start_minute + shift < other.end_minute
+        for shift in _week_shifts(slot.start_minute, slot.end_minute)
+    )
+
+
+def describe(slot):
+    start = datetime.time(*divmod(slot.start_minute % MINUTES_PER_DAY, 60))
+    end = datetime.time(*divmod(slot.end_minute % MINUTES_PER_DAY, 60))
+    return (
+        f"{slot.dojo_class.name} ({slot.get_weekday_display()} "
+        f"{start.strftime('%H:%M')}–{end.strftime('%H:%M')} at {slot.location or 'no location'})"
+    )
+
+
+def _keys(slot):
+    if slot.location:
+        yield 'location', ('location', slot.location)
+    if slot.dojo_class.instructor_id:
+        yield 'dojo_class', ('instructor', slot.dojo_class.instructor_id)
+
+
+def find_conflicts(slots):
+    """
+    Check unsaved or edited Schedule objects against the table and against each other.
+
+    One range query fetches every saved slot that could clash with the batch; the
+    rest is done in memory. Returns a dict of field errors per slot, empty if it fits.
+    """
+    errors = [{} for _ in slots]
+    if not slots:
+        return errors
+    for slot in slots:
+        slot.sync_timetable()
+
+    locations = {slot.location for slot in slots if slot.location}
+    instructors = {slot.dojo_class.instructor_id for slot in slots if slot.dojo_class.instructor_id}
+    existing = overlapping(
+        min(slot.start_minute for slot in slots),
+        max(slot.end_minute for slot in slots),
+        Schedule.objects.filter(Q(location__in=locations) | Q(dojo_class__instructor_id__in=instructors)),
+    ).exclude(pk__in=[slot.pk for slot in slots if slot.pk]).select_related('dojo_class')
+
+    booked = defaultdict(list)
+    for other in existing:
+        for _, key in _keys(other):
+            booked[key].append(other)
+
+    for i, slot in enumerate(slots):
+        for field, key in _keys(slot):
+            for other in booked[key]:
+                if overlaps(slot, other):
+                    what = 'Location' if key[0] == 'location' else 'Instructor'
+                    errors[i].setdefault(field, []).append(f"{what} is already booked: {describe(other)}.")
+                    break
+            # later slots in the batch must not clash with this one either
+            booked[key].append(slot)
+    return errors
@@ -1,4 +1,7 @@
+from django.conf import settings
 from django.urls import path
+
+from . import async_views
 from .views import (
     RegisterView,
     DojoClassListCreateView,
@@ -11,11 +14,28 @@ from .views import (
     ScheduleListCreateView,
     ScheduleDetailView,
     UserListView,
+    ScheduleBulkCreateView,
+    EnrollmentBulkCreateView,
+    PaymentBulkCreateView,
     UserDetailView,
     enrollment_reports,
+    job_detail,
     list_instructors,
     student_schedule,
-    admin_stats
+    student_calendar,
+    rotate_calendar_token,
+    search_index,
+    sync_changes,
+    timetable,
+    admin_stats,
+    export_payments,
+    export_enrollments,
+    metrics,
+    ready,
+    ClassSessionListView,
+    sessions_now,
+    session_attendance,
+    session_attendance_detail,
 )
 
 urlpatterns = [
@@ -23,7 +43,15 @@ urlpatterns = [
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
 
     path('admin/stats/', admin_stats, name='admin-stats'),
+    path('metrics/', metrics, name='metrics'),
+    path('ready/', ready, name='ready'),
+    path('jobs/<int:pk>/', job_detail, name='job-detail'),
     path('student/schedule/', student_schedule, name='student-schedule'),
+    path('student/schedule.ics', student_calendar, name='student-calendar'),
+    path('student/calendar-token/', rotate_calendar_token, name='student-calendar-token'),
+    path('instructors/', list_instructors, name='instructor-list'),
+    path('search/', search_index, name='search'),
+    path('sync/', sync_changes, name='sync'),
     
     #  User endpoints
     path('users/', UserListView.as_view(), name='user_list'),
@@ -37,18 +65,44 @@ urlpatterns = [
     path('classes/<int:pk>/', DojoClassDetailView.as_view(), name='class_detail'),
 
     # Enrollments endpoint 
+    path('enrollments/bulk/', EnrollmentBulkCreateView.as_view(), name='enrollment_bulk_create'),
+    path('enrollments/export/', export_enrollments, name='enrollment_export'),
     path('enrollments/', EnrollmentListCreateView.as_view(), name='enrollment_list_create'),
     path('enrollments/<int:pk>/', EnrollmentDetailView.as_view(), name='enrollment_detail'),
 
     # Payment endpoints 
+    path('payments/bulk/', PaymentBulkCreateView.as_view(), name='payment_bulk_create'),
+    path('payments/export/', export_payments, name='payment_export'),
     path('payments/', PaymentListCreateView.as_view(), name='payment_list_create'),
     path('payments/<int:pk>/', PaymentDetailView.as_view(), name='payment_detail'),
 
     # Schedule endpoints
+    path('schedules/bulk/', ScheduleBulkCreateView.as_view(), name='schedule_bulk_create'),
     path('schedules/', ScheduleListCreateView.as_view(), name='schedule_list_create'),
     path('schedules/<int:pk>/', ScheduleDetailView.as_view(), name='schedule_detail'),
+    path('timetable/', timetable, name='timetable'),
+
+    # Class sessions and attendance
+    path('sessions/', ClassSessionListView.as_view(), name='session-list'),
+    path('sessions/now/', sessions_now, name='sessions-now'),
+    path('sessions/<int:pk>/attendance/', session_attendance, name='session-attendance'),
+    path('sessions/<int:pk>/attendance/<int:student_id>/', session_attendance_detail, name='session-attendance-detail'),
 
     # User Management
     path("users/", UserListView.as_view(), name="user-list"),
     path("users/<int:pk>/", UserDetailView.as_view()),
 ]
+
+if settings.ASYNC_VIEWS:
+    # ASGI deployments serve the read-heavy endpoints from api/async_views.py
+    _async_routes = {
+        'admin-stats': async_views.admin_stats,
+        'student-schedule': async_views.student_schedule,
+        'instructor-list': async_views.list_instructors,
+        'class_list_create': async_views.class_list,
+        'schedule_list_create': async_views.schedule_list,
+    }
+    urlpatterns = [
+        path(str(p.pattern), _async_routes[p.name], name=p.name) if p.name in _async_routes else p
+        for p in urlpatterns
+    ]
@@ -1,13 +1,37 @@
+import csv
+import datetime
+import json
+from collections import defaultdict
+
 from rest_framework import generics, permissions, exceptions
 from django.contrib.auth import get_user_model
-from django.db import models
-from .models import DojoClass, Enrollment, Payment, Schedule
-from .serializers import UserSerializer, DojoClassSerializer, EnrollmentSerializer, PaymentSerializer, ScheduleSerializer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.db import transaction
+from .models import Attendance, ClassSession, DojoClass, Enrollment, Job, Payment, Schedule
+from . import aggregates, class_sessions, ical, jobs, readiness, search, sync
+from . import timetable as timetable_index
+from .fastpath import FastListMixin
+from .idempotency import IdempotentCreateMixin
+from .cache import CachedListMixin, ConditionalGetMixin, cached_content, cached_response, conditional_response, enrollments_of, row_version, version_of
+from .authentication import StatelessJWTAuthentication
+from .metrics import registry as metrics_registry
+from .serializers import UserSerializer, DojoClassSerializer, EnrollmentSerializer, PaymentSerializer, ScheduleSerializer, WaitlistEntrySerializer
+from .services import enroll, promote_waitlist, withdraw
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .serializers import CustomTokenObtainPairSerializer
-from rest_framework.decorators import api_view, permission_classes
+from .serializers import CheckInSerializer, ClassSessionSerializer, CustomTokenObtainPairSerializer, JobSerializer
+from .prefetch import optimize_queryset
+from .pagination import EnrollmentPagination, PaymentPagination
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
-from rest_framework import permissions
+from rest_framework import permissions, status
 from rest_framework.permissions import IsAdminUser
 
 User = get_user_model()
@@ -15,16 +39,29 @@ User = get_user_model()
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
+class PrefetchPlanMixin:
+    """Builds the queryset from the serializer's prefetch plan (see api/prefetch.py)."""
+    def get_queryset(self):
+        return optimize_queryset(super().get_queryset(), self.get_serializer())
+
 # Public: register new user
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
 
+    def perform_create(self, serializer):
+        # atomic with the per-role user counter
+        with transaction.atomic():
+            serializer.save()
+
 # Classes: list & create (admin/instructor create)
-class DojoClassListCreateView(generics.ListCreateAPIView):
+class DojoClassListCreateView(IdempotentCreateMixin, CachedListMixin, FastListMixin, PrefetchPlanMixin, generics.ListCreateAPIView):
     queryset = DojoClass.objects.all()
     serializer_class = DojoClassSerializer
+    cache_models = (DojoClass, Schedule, User)
+    # role check below reads the token claims, no user row needed
+    authentication_classes = [StatelessJWTAuthentication]
 
     def get_permissions(self):
         if self.request.method == "POST":
@@ -36,47 +73,89 @@ class DojoClassListCreateView(generics.ListCreateAPIView):
         user = self.request.user
         if getattr(user, 'role', None) not in ['admin', 'instructor']:
             raise exceptions.PermissionDenied("Only admins or instructors can create classes.")
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
 
-class DojoClassDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DojoClassDetailView(ConditionalGetMixin, PrefetchPlanMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = DojoClass.objects.all()
     serializer_class = DojoClassSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    etag_models = (Schedule, User)
+
+    def perform_update(self, serializer):
+        dojo_class = serializer.save()
+        # a capacity increase frees seats for the waitlist
+        promote_waitlist(dojo_class.pk)
 
 # Enrollment endpoints - user must be authenticated to enroll
-class EnrollmentListCreateView(generics.ListCreateAPIView):
+class EnrollmentListCreateView(IdempotentCreateMixin, ConditionalGetMixin, FastListMixin, PrefetchPlanMixin, generics.ListCreateAPIView):
     queryset = Enrollment.objects.all()
     serializer_class = EnrollmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_models = (DojoClass, Schedule, User)
+    pagination_class = EnrollmentPagination
 
-    def perform_create(self, serializer):
-        # automatically set the student to the request user if they are a student
-        serializer.save(student=self.request.user)
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-class EnrollmentDetailView(generics.RetrieveDestroyAPIView):
+        # admins enroll the student they name; everyone else enrolls themselves
+        student = serializer.validated_data['student'] if getattr(request.user, 'role', None) == 'admin' else request.user
+        enrollment, waitlisted = enroll(student, serializer.validated_data['martial_class'])
+
+        if waitlisted is not None:
+            # class is full: 202 with the waitlist position instead of an enrollment
+            return Response(WaitlistEntrySerializer(waitlisted).data, status=status.HTTP_202_ACCEPTED)
+        data = self.get_serializer(enrollment).data
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+class EnrollmentDetailView(ConditionalGetMixin, PrefetchPlanMixin, generics.RetrieveDestroyAPIView):
     queryset = Enrollment.objects.all()
     serializer_class = EnrollmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_models = (DojoClass, Schedule, User)
+
+    def perform_destroy(self, instance):
+        withdraw(instance)
 
 # Payment endpoints
-class PaymentListCreateView(generics.ListCreateAPIView):
+class PaymentListCreateView(IdempotentCreateMixin, ConditionalGetMixin, FastListMixin, PrefetchPlanMixin, generics.ListCreateAPIView):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_models = (DojoClass, Schedule, User)
+    pagination_class = PaymentPagination
+
+    def create(self, request, *args, **kwargs):
+        if not jobs.prefers_async(request):
+            return super().create(request, *args, **kwargs)
+        # reject bad input now; the worker saves the payment
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payload = request.data.dict() if hasattr(request.data, "dict") else request.data
+        job = jobs.enqueue(
+            "payments.create", payload, key=request.headers.get("Idempotency-Key"), user=request.user
+        )
+        return jobs.accepted(request, job)
 
     def perform_create(self, serializer):
         # saving payment, leave validation to front/back (can be extended)
-        serializer.save()
+        # atomic so the payment and its monthly total commit together
+        with transaction.atomic():
+            serializer.save()
 
-class PaymentDetailView(generics.RetrieveAPIView):
+class PaymentDetailView(ConditionalGetMixin, PrefetchPlanMixin, generics.RetrieveAPIView):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_models = (DojoClass, Schedule, User)
 
 # Schedule Endpoints
-class ScheduleListCreateView(generics.ListCreateAPIView):
+class ScheduleListCreateView(IdempotentCreateMixin, CachedListMixin, FastListMixin, PrefetchPlanMixin, generics.ListCreateAPIView):
     queryset = Schedule.objects.all()
     serializer_class = ScheduleSerializer
+    cache_models = (Schedule,)
+    authentication_classes = [StatelessJWTAuthentication]
 
     def get_permissions(self):
         # allow anyone to list; only authenticated instructors/admins can create (adjust as needed)
@@ -88,7 +167,7 @@ class ScheduleListCreateView(generics.ListCreateAPIView):
         # optional: restrict creation to instructors/admins
         serializer.save()
 
-class ScheduleDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ScheduleDetailView(ConditionalGetMixin, PrefetchPlanMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Schedule.objects.all()
     serializer_class = ScheduleSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -99,7 +178,55 @@ class IsAdmin(permissions.BasePermission):
         return request.user.is_authenticated and request.user.role == "admin"
 
 
-class UserListView(generics.ListAPIView):
+class IsAdminOrInstructor(permissions.BasePermission):
+    """Allow admins and instructors (staff roles)."""
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and getattr(request.user, 'role', None) in ('admin', 'instructor')
+
+
+# Bulk endpoints: POST a JSON list, validated together and written with bulk_create
+class BulkCreateView(generics.GenericAPIView):
+    permission_classes = [IsAdminOrInstructor]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        created = serializer.save()
+        return self.bulk_response(created)
+
+    def bulk_response(self, objs):
+        # re-read through the prefetch plan so nesting doesn't cost a query per row
+        queryset = self.get_queryset().filter(pk__in=[obj.pk for obj in objs])
+        return Response(self.get_serializer(queryset, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class ScheduleBulkCreateView(IdempotentCreateMixin, PrefetchPlanMixin, BulkCreateView):
+    queryset = Schedule.objects.all()
+    serializer_class = ScheduleSerializer
+
+
+class PaymentBulkCreateView(IdempotentCreateMixin, PrefetchPlanMixin, BulkCreateView):
+    queryset = Payment.objects.all()
+    serializer_class = PaymentSerializer
+
+
+class EnrollmentBulkCreateView(IdempotentCreateMixin, PrefetchPlanMixin, BulkCreateView):
+    queryset = Enrollment.objects.all()
+    serializer_class = EnrollmentSerializer
+
+    def bulk_response(self, created):
+        enrollments, waitlisted = created
+        queryset = self.get_queryset().filter(pk__in=[e.pk for e in enrollments])
+        return Response({
+            "enrolled": self.get_serializer(queryset, many=True).data,
+            "waitlisted": [
+                {"student": entry.student_id, "martial_class": entry.martial_class_id}
+                for entry in waitlisted
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+
+class UserListView(ConditionalGetMixin, FastListMixin, PrefetchPlanMixin, generics.ListAPIView):
     """
     List users. Optional filter: ?role=instructor (or admin/student)
     Requires authentication.
@@ -107,6 +234,7 @@ class UserListView(generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_models = (User,)
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -116,56 +244,382 @@ class UserListView(generics.ListAPIView):
         return qs
 
 
-class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
+class UserDetailView(ConditionalGetMixin, PrefetchPlanMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve / update / delete a user (admin only for destructive actions in real app).
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_models = (User,)
 
 @api_view(['GET'])
+@authentication_classes([StatelessJWTAuthentication])
 @permission_classes([permissions.IsAuthenticated])
 def admin_stats(request):
     user = request.user
     if getattr(user, 'role', None) != 'admin':
         return Response({"detail": "Not authorized"}, status=403)
+    # maintained aggregates (api/aggregates.py): one primary-key read instead of four COUNT(*)s
+    counters = aggregates.read_counters(
+        aggregates.role_key('student'), aggregates.CLASSES, aggregates.ENROLLMENTS, aggregates.role_key('instructor'),
+    )
     data = {
-        "totalStudents": User.objects.filter(role='student').count(),
-        "totalClasses": DojoClass.objects.count(),
-        "totalEnrollments": Enrollment.objects.count(),
-        "activeInstructors": User.objects.filter(role='instructor').count()
+        "totalStudents": counters[aggregates.role_key('student')],
+        "totalClasses": counters[aggregates.CLASSES],
+        "totalEnrollments": counters[aggregates.ENROLLMENTS],
+        "activeInstructors": counters[aggregates.role_key('instructor')]
     }
-    return Response(data)
+    # dashboards poll this; unchanged counters cost them a 304
+    return conditional_response(request, data.values(), lambda: Response(data))
+
+def student_schedules(student_id):
+    # one join through the student's enrollments instead of a query per enrolled class
+    return Schedule.objects.filter(dojo_class__enrollments__student_id=student_id)
+
+
+def calendar_url(request, token):
+    return f'{request.build_absolute_uri(reverse("student-calendar"))}?token={token}'
+
+
+def calendar_link(request, student_id):
+    return f'<{calendar_url(request, ical.feed_token(student_id))}>; rel="alternate"; type="text/calendar"'
+
 
 @api_view(['GET'])
+@authentication_classes([StatelessJWTAuthentication])
 @permission_classes([permissions.IsAuthenticated])
 def student_schedule(request):
-    enrollments = Enrollment.objects.filter(student=request.user)
-    schedules = Schedule.objects.filter(dojo_class__in=[e.martial_class for e in enrollments])
-    serializer = ScheduleSerializer(schedules, many=True)
-    return Response(serializer.data)
+    student_id = request.user.id
+
+    def build():
+        return Response(ScheduleSerializer(student_schedules(student_id), many=True).data)
+    response = cached_response(request, (Schedule, enrollments_of(student_id)), build, extra=f"student={student_id}")
+    response["Link"] = calendar_link(request, student_id)
+    return response
+
+
+@api_view(['POST'])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def rotate_calendar_token(request):
+    """Revoke the caller's .ics feed URLs and hand out a new one."""
+    return Response({"url": calendar_url(request, ical.rotate(request.user.id))})
+
+
+@require_safe
+def student_calendar(request):
+    """The student's weekly classes as an iCalendar feed; see api/ical.py."""
+    if "token" in request.GET:
+        student_id = ical.student_for_token(request.GET["token"])
+    else:
+        try:
+            result = StatelessJWTAuthentication().authenticate(request)
+        except (exceptions.AuthenticationFailed, InvalidToken):
+            result = None
+        student_id = result[0].id if result else None
+    if student_id is None:
+        return HttpResponse("Invalid or missing feed token.", status=401, content_type="text/plain")
+
+    def build_body():
+        schedules = (
+            student_schedules(student_id)
+            .select_related("dojo_class")
+            .annotate(enrolled_on=F("dojo_class__enrollments__date_enrolled"))
+        )
+        return ical.render(schedules)
+    return cached_content(
+        request, (Schedule, DojoClass, enrollments_of(student_id)), build_body,
+        "text/calendar; charset=utf-8", extra=f"student={student_id}",
+    )
+
+@api_view(['GET'])
+@authentication_classes([StatelessJWTAuthentication])
+def search_index(request):
+    """Ranked, faceted search over classes and users; see api/search.py."""
+    return Response(search.search(request))
 
 @api_view(['GET'])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def sync_changes(request):
+    """Rows changed since `?since=<token>`, one delta per model; see api/sync.py."""
+    try:
+        return Response(sync.changes(request.user, request.query_params.get("since")))
+    except sync.InvalidToken as exc:
+        raise exceptions.ValidationError({"since": str(exc)})
+
+@api_view(['GET'])
+@authentication_classes([StatelessJWTAuthentication])
 def list_instructors(request):
-    instructors = User.objects.filter(role='instructor')
-    data = UserSerializer(instructors, many=True).data
-    return Response(data)
+    def build():
+        instructors = User.objects.filter(role='instructor')
+        return Response(UserSerializer(instructors, many=True).data)
+    return cached_response(request, (User,), build)
+
+@api_view(['GET'])
+@authentication_classes([StatelessJWTAuthentication])
+def timetable(request):
+    """
+    Schedules running at `?at=` ("tue 18:30" or an ISO datetime); without it, the
+    week (or one `?weekday=`) in time order. `?location=` narrows either form.
+    """
+    queryset = Schedule.objects.all()
+    at = request.query_params.get("at")
+    weekday = request.query_params.get("weekday")
+    location = request.query_params.get("location")
+    if at:
+        try:
+            queryset = timetable_index.running_at(timetable_index.parse_at(at), queryset)
+        except ValueError as exc:
+            raise exceptions.ValidationError({"at": str(exc)})
+    elif weekday:
+        if weekday not in timetable_index.WEEKDAYS:
+            raise exceptions.ValidationError({"weekday": f"Use one of {', '.join(timetable_index.WEEKDAYS)}."})
+        day = timetable_index.WEEKDAYS.index(weekday) * timetable_index.MINUTES_PER_DAY
+        queryset = queryset.filter(start_minute__gte=day, start_minute__lt=day + timetable_index.MINUTES_PER_DAY)
+    if location:
+        queryset = queryset.filter(location=location)
+
+    def build():
+        return Response(ScheduleSerializer(queryset.order_by("start_minute", "location", "id"), many=True).data)
+    return cached_response(request, (Schedule,), build)
 
 @api_view(["GET"])
 @permission_classes([IsAdminUser])
 def enrollment_reports(request):
-    total_enrollments = Enrollment.objects.count()
-
-    # Count enrollments grouped by class name
-    class_stats = (
-        Enrollment.objects
-        .values("martial_class__name")
-        .annotate(count=models.Count("id"))
-        .order_by("-count")
+    if jobs.prefers_async(request):
+        job = jobs.enqueue(
+            "reports.enrollments", {}, key=request.headers.get("Idempotency-Key"), user=request.user
+        )
+        return jobs.accepted(request, job)
+    return Response(aggregates.enrollment_report())
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def job_detail(request, pk):
+    """Status and result of a background job; visible to whoever queued it and to admins."""
+    visible = Job.objects.all()
+    if not (request.user.is_staff or getattr(request.user, "role", None) == "admin"):
+        visible = visible.filter(created_by=request.user)
+    job = get_object_or_404(visible, pk=pk)
+    return Response(JobSerializer(job).data)
+
+# Streaming exports: flat rows read through a server-side cursor so memory stays flat
+EXPORT_CHUNK_SIZE = 2000
+
+PAYMENT_EXPORT_FIELDS = (
+    "id", "date", "amount", "status", "description", "enrollment_id",
+    "enrollment__student_id", "enrollment__student__username",
+    "enrollment__martial_class_id", "enrollment__martial_class__name",
+)
+
+ENROLLMENT_EXPORT_FIELDS = (
+    "id", "date_enrolled", "student_id", "student__username", "student__email",
+    "martial_class_id", "martial_class__name",
+)
+
+
+class _Echo:
+    """File-like object that hands csv.writer's output straight back."""
+    def write(self, value):
+        return value
+
+
+def _date_param(request, name):
+    raw = request.query_params.get(name)
+    if not raw:
+        return None
+    value = parse_date(raw)
+    if value is None:
+        raise exceptions.ValidationError({name: "Use YYYY-MM-DD."})
+    return value
+
+
+def _stream_export(request, queryset, date_field, fields, filename):
+    start = _date_param(request, "start")
+    end = _date_param(request, "end")
+    if start:
+        queryset = queryset.filter(**{f"{date_field}__gte": start})
+    if end:
+        queryset = queryset.filter(**{f"{date_field}__lte": end})
+
+    # its own rows, plus the rows the joined columns come from (class names, usernames)
+    models = [queryset.model, *sorted(_joined_models(queryset.model, fields), key=lambda m: m._meta.label)]
+    return conditional_response(
+        request, [row_version(queryset), *(version_of(model) for model in models)],
+        lambda: _export_response(request, queryset, fields, filename),
     )
 
-    return Response({
-        "total_enrollments": total_enrollments,
-        "class_summary": class_stats
-    })
\ No newline at end of file
+
+def _joined_models(model, fields):
+    """Models other than `model` that the `fields` lookups read columns from."""
+    joined = set()
+    for field in fields:
+        current = model
+        for name in field.split("__")[:-1]:
+            current = current._meta.get_field(name).related_model
+            joined.add(current)
+    return joined
+
+
+def _export_response(request, queryset, fields, filename):
+    # ordered by pk so consecutive exports are stable and diffable
+    rows = queryset.order_by("pk").values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    output = request.query_params.get("output", "ndjson")
+
+    if output == "csv":
+        writer = csv.writer(_Echo())
+        def lines():
+            yield writer.writerow(fields)
+            for row in rows:
+                yield writer.writerow(row)
+        content_type, extension = "text/csv", "csv"
+    elif output == "ndjson":
+        encoder = DjangoJSONEncoder(separators=(",", ":"))
+        def lines():
+            for row in rows:
+                yield encoder.encode(dict(zip(fields, row))) + "\n"
+        content_type, extension = "application/x-ndjson", "ndjson"
+    else:
+        raise exceptions.ValidationError({"output": "Use 'ndjson' or 'csv'."})
+
+    response = StreamingHttpResponse(lines(), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def export_payments(request):
+    """Stream the payment ledger. ?output=ndjson|csv&start=YYYY-MM-DD&end=YYYY-MM-DD"""
+    return _stream_export(request, Payment.objects.all(), "date", PAYMENT_EXPORT_FIELDS, "payments")
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def export_enrollments(request):
+    """Stream enrollments. ?output=ndjson|csv&start=YYYY-MM-DD&end=YYYY-MM-DD"""
+    return _stream_export(
+        request, Enrollment.objects.all(), "date_enrolled", ENROLLMENT_EXPORT_FIELDS, "enrollments"
+    )
+
+
+@api_view(["GET"])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([IsAdmin])
+def metrics(request):
+    """Per-endpoint request metrics in Prometheus text format (see api/metrics.py)."""
+    return HttpResponse(metrics_registry.render(), content_type="text/plain; version=0.0.4")
+
+
+@require_safe
+def ready(request):
+    """Readiness probe: warms this process, then 200 once its databases answer and are migrated, else 503."""
+    readiness.warm(connect=False)
+    # connects to each database as it checks it
+    problems = readiness.problems()
+    return JsonResponse({"ready": not problems, "problems": problems}, status=503 if problems else 200)
+
+
+# Class sessions and attendance (api/class_sessions.py)
+class ClassSessionListView(generics.ListAPIView):
+    """
+    Dated sessions in start order: ?start=YYYY-MM-DD (today) for ?days= (7, at most
+    31), optionally narrowed by ?class=<id> and ?location=.
+    """
+    serializer_class = ClassSessionSerializer
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [permissions.AllowAny]
+    # the date range bounds the rows; keyset pagination expects another order
+    pagination_class = None
+    MAX_DAYS = 31
+
+    def get_queryset(self):
+        params = self.request.query_params
+        start = _date_param(self.request, "start") or timezone.localdate()
+        try:
+            days = int(params.get("days", 7))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= self.MAX_DAYS:
+            raise exceptions.ValidationError({"days": f"Use 1 to {self.MAX_DAYS}."})
+        queryset = class_sessions.starting_between(start, start + datetime.timedelta(days=days))
+        if params.get("class"):
+            try:
+                class_id = int(params["class"])
+            except ValueError:
+                raise exceptions.ValidationError({"class": "Expected a class id."})
+            queryset = queryset.filter(dojo_class_id=class_id)
+        if params.get("location"):
+            queryset = queryset.filter(location=params["location"])
+        return queryset.select_related("dojo_class").order_by("starts_at", "id")
+
+
+def _attendees(session_ids):
+    """session id -> [{id, username, checked_in_at}], in check-in order; one query on unique_session_student."""
+    rows = (
+        Attendance.objects.filter(session_id__in=session_ids).order_by("checked_in_at", "id")
+        .values_list("session_id", "student_id", "student__username", "checked_in_at")
+    )
+    attendees = defaultdict(list)
+    for session_id, student_id, username, checked_in_at in rows:
+        attendees[session_id].append({"id": student_id, "username": username, "checked_in_at": checked_in_at})
+    return attendees
+
+
+@api_view(["GET"])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([IsAdminOrInstructor])
+def sessions_now(request):
+    """Sessions in progress with their occupancy and who is checked in; ?location= narrows it."""
+    sessions = class_sessions.running_at()
+    location = request.query_params.get("location")
+    if location:
+        sessions = sessions.filter(location=location)
+    data = ClassSessionSerializer(sessions.select_related("dojo_class").order_by("starts_at", "id"), many=True).data
+    attendees = _attendees([session["id"] for session in data])
+    for session in data:
+        session["attendees"] = attendees[session["id"]]
+    return Response(data)
+
+
+@api_view(["GET", "POST"])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def session_attendance(request, pk):
+    """
+    GET: who is checked in (staff). POST {"students": [ids]}: batch check-in by
+    staff; a student may only check themselves in, with or without a body.
+    """
+    staff = getattr(request.user, "role", None) in ("admin", "instructor")
+    if request.method == "GET":
+        if not staff:
+            raise exceptions.PermissionDenied("Only staff can see attendance.")
+        get_object_or_404(ClassSession.objects.only("pk"), pk=pk)
+        return Response(_attendees([pk])[pk])
+
+    serializer = CheckInSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    students = serializer.validated_data.get("students")
+    if staff:
+        if not students:
+            raise exceptions.ValidationError({"students": "This field is required."})
+    elif students not in (None, [request.user.id]):
+        raise exceptions.PermissionDenied("Students can only check themselves in.")
+    try:
+        result = class_sessions.check_in(pk, students or [request.user.id])
+    except ClassSession.DoesNotExist:
+        raise exceptions.NotFound()
+    return Response(result)
+
+
+@api_view(["DELETE"])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([IsAdminOrInstructor])
+def session_attendance_detail(request, pk, student_id):
+    """Undo a check-in; the post_delete signal gives the seat back to the counter."""
+    deleted, _ = Attendance.objects.filter(session_id=pk, student_id=student_id).delete()
+    if not deleted:
+        raise exceptions.NotFound()
+    return Response(status=status.HTTP_204_NO_CONTENT)
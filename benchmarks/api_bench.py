@@ -0,0 +1,218 @@
+"""
+Per-endpoint latency and query-count benchmark for every route in api/urls.py.
+
+Runs in-process through Django's test client with real JWT auth against
+whatever database the settings point at (SQLite by default, or DATABASE_URL),
+so it works offline. Seed data first:
+
+    python manage.py seed_data --students 10000 --classes 2000 --enrollments 200000 --payments 200000
+    python benchmarks/api_bench.py --iterations 50 --out bench.json
+    python benchmarks/api_bench.py --iterations 50 --out after.json --compare bench.json
+
+Write endpoints run only with --include-writes, each inside a transaction that
+is rolled back so the dataset is unchanged between runs.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dojo_backend.settings")
+# measure the handlers, not the rate limiter
+os.environ.setdefault("THROTTLE", "0")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from api import ical, urls as api_urls  # noqa: E402
+from api.models import DojoClass, Enrollment, Payment, Schedule  # noqa: E402
+from api.serializers import CustomTokenObtainPairSerializer  # noqa: E402
+from benchmarks.stats import summarize, write_report  # noqa: E402
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+def build_requests(admin, student):
+    """URL name -> (method, path, payload, as_user). Routes missing here are reported as skipped."""
+    dojo_class = DojoClass.objects.order_by("pk").first()
+    schedule = Schedule.objects.order_by("pk").first()
+    enrollment = Enrollment.objects.order_by("pk").first()
+    payment = Payment.objects.order_by("pk").first()
+    instructor = User.objects.filter(role="instructor").order_by("pk").first()
+    open_class = DojoClass.objects.exclude(enrollments__student=student).order_by("pk").first() or dojo_class
+    if not all([dojo_class, schedule, enrollment, payment, instructor]):
+        raise SystemExit("Database is empty; run `python manage.py seed_data` first.")
+
+    reads = {
+        "admin-stats": ("get", "/api/admin/stats/", None, admin),
+        "student-schedule": ("get", "/api/student/schedule/", None, student),
+        "student-calendar": ("get", f"/api/student/schedule.ics?token={ical.feed_token(student.pk)}", None, None),
+        "instructor-list": ("get", "/api/instructors/", None, None),
+        "user_list": ("get", "/api/users/", None, admin),
+        "user-list": ("get", "/api/users/?role=instructor", None, admin),
+        "user_detail": ("get", f"/api/users/{instructor.pk}/", None, admin),
+        "enrollment-reports": ("get", "/api/reports/enrollments/", None, admin),
+        "class_list_create": ("get", "/api/classes/", None, None),
+        "class_detail": ("get", f"/api/classes/{dojo_class.pk}/", None, None),
+        "enrollment_list_create": ("get", "/api/enrollments/?page_size=100", None, admin),
+        "enrollment_detail": ("get", f"/api/enrollments/{enrollment.pk}/", None, admin),
+        "enrollment_export": ("get", "/api/enrollments/export/", None, admin),
+        "payment_list_create": ("get", "/api/payments/?page_size=100", None, admin),
+        "payment_detail": ("get", f"/api/payments/{payment.pk}/", None, admin),
+        "payment_export": ("get", "/api/payments/export/", None, admin),
+        "schedule_list_create": ("get", "/api/schedules/", None, None),
+        "schedule_detail": ("get", f"/api/schedules/{schedule.pk}/", None, admin),
+        "timetable": ("get", "/api/timetable/?at=tue+18:30", None, None),
+        "search": ("get", "/api/search/?q=stud", None, admin),
+    }
+    writes = {
+        "register": ("post", "/api/auth/register/", {"username": "bench-new", "password": "x"}, None),
+        "token_obtain_pair": ("post", "/api/token/", {"username": "bench-admin", "password": None}, None),
+        "enrollment_bulk_create": ("post", "/api/enrollments/bulk/", [
+            {"student_id": student.pk, "martial_class_id": open_class.pk},
+        ], admin),
+        "payment_bulk_create": ("post", "/api/payments/bulk/", [
+            {"enrollment_id": enrollment.pk, "amount": "10.00", "status": "paid"},
+        ] * 50, admin),
+        "schedule_bulk_create": ("post", "/api/schedules/bulk/", [
+            # before 06:00 in a fresh room: seed_data books neither rooms nor instructors then
+            {"dojo_class": dojo_class.pk, "weekday": weekday, "start_time": f"{hour}:{minute}",
+             "end_time": f"{hour}:{minute[0]}9", "location": "Bench Hall"}
+            for weekday in ("mon", "tue", "wed", "thu", "fri") for hour in range(1, 6) for minute in ("00", "30")
+        ], admin),
+    }
+    return reads, writes
+
+
+def make_clients(password):
+    """One client per identity, each holding a real access token."""
+    anonymous = Client(HTTP_HOST="localhost")
+    admin = User.objects.get(username="bench-admin")
+    student = (
+        User.objects.filter(role="student", enrollment__isnull=False).order_by("pk").first()
+        or User.objects.filter(role="student").first()
+    )
+    clients = {None: anonymous}
+
+    response = anonymous.post("/api/token/", {"username": admin.username, "password": password})
+    if response.status_code != 200:
+        raise SystemExit("Could not log in as bench-admin; pass the password used with seed_data.")
+    clients[admin] = Client(HTTP_HOST="localhost", HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+
+    # the student has no known password; mint a token the same way the token view does
+    token = CustomTokenObtainPairSerializer.get_token(student).access_token
+    clients[student] = Client(HTTP_HOST="localhost", HTTP_AUTHORIZATION=f"Bearer {token}")
+    return admin, student, clients
+
+
+def call(client, method, path, payload):
+    if method == "get":
+        response = client.get(path)
+    else:
+        response = client.post(path, data=json.dumps(payload), content_type="application/json")
+    if getattr(response, "streaming", False):
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def run_one(client, method, path, payload, iterations, warmup, rollback):
+    def once():
+        if not rollback:
+            return call(client, method, path, payload)
+        try:
+            with transaction.atomic():
+                response = call(client, method, path, payload)
+                raise _Rollback(response)
+        except _Rollback as done:
+            return done.args[0]
+
+    for _ in range(warmup):
+        once()
+
+    with CaptureQueriesContext(connection) as ctx:
+        status = once().status_code
+    queries = len(ctx.captured_queries)
+
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        if once().status_code >= 400:
+            errors += 1
+        latencies.append((time.perf_counter() - t0) * 1000)
+    row = summarize(latencies, time.perf_counter() - started, errors)
+    row.update({"method": method.upper(), "path": path, "status": status, "queries": queries})
+    return row
+
+
+def compare(results, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    print(f"\n{'endpoint':28} {'p50 ms':>16} {'p99 ms':>16} {'queries':>10}")
+    for name, row in results.items():
+        old = baseline.get(name)
+        if not old or "p50_ms" not in row or "p50_ms" not in old:
+            continue
+        print(
+            f"{name:28} {old['p50_ms']:>7} -> {row['p50_ms']:<7} {old['p99_ms']:>7} -> {row['p99_ms']:<7}"
+            f" {old['queries']:>4} -> {row['queries']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--password", default="bench-pass", help="bench-admin password given to seed_data")
+    parser.add_argument("--include-writes", action="store_true")
+    parser.add_argument("--only", action="append", help="URL name to run (repeatable)")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--compare", help="earlier report to diff against")
+    args = parser.parse_args()
+
+    admin, student, clients = make_clients(args.password)
+    reads, writes = build_requests(admin, student)
+    writes["token_obtain_pair"][2]["password"] = args.password
+    plan = dict(reads)
+    if args.include_writes:
+        plan.update(writes)
+
+    results = {}
+    for pattern in api_urls.urlpatterns:
+        name = pattern.name or str(pattern.pattern)
+        if args.only and name not in args.only:
+            continue
+        if name not in plan:
+            results[name] = {"skipped": "writes not enabled" if name in writes else "no request defined"}
+            continue
+        method, path, payload, user = plan[name]
+        row = run_one(clients[user], method, path, payload, args.iterations, args.warmup, rollback=method != "get")
+        results[name] = row
+        print(f"{name:28} {row['status']} q={row['queries']:<3} p50 {row['p50_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  {row['throughput_rps']} rps")
+
+    config = {**vars(args), "database": connection.vendor, "rows": {
+        "users": User.objects.count(), "classes": DojoClass.objects.count(),
+        "enrollments": Enrollment.objects.count(), "payments": Payment.objects.count(),
+    }}
+    config.pop("password")
+    write_report(args.out, "api", config, results)
+    print(f"wrote {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
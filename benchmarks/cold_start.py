@@ -0,0 +1,180 @@
+"""
+Cold-start profile: what a new process spends before it can serve.
+
+Two measurements:
+
+- imports: `python -X importtime` on what a worker does before its first
+  response (django.setup(), the WSGI handler, the URLconf and views), run
+  --runs times. Reports the median wall time and the import time by top-level
+  package and by module, once with the project's bytecode compiled and once
+  without (the image before it ran compileall: PYTHONDONTWRITEBYTECODE=1 and no
+  .pyc for the project).
+- boot: gunicorn started with and without GUNICORN_PRELOAD, timed until
+  /api/ready/ answers 200 and then until the first /api/classes/ response.
+
+    python benchmarks/cold_start.py --runs 10 --workers 3 --out cold_start.json
+
+Run it against a migrated database, or /api/ready/ never answers 200.
+"""
+import argparse
+import http.client
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stats import write_report  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+PROJECT = ("api", "dojo_backend", "manage.py")
+
+BOOT = """
+import os, time
+start = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dojo_backend.settings")
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print((time.perf_counter() - start) * 1000)
+"""
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            rows.append((match[4], int(match[1]), int(match[2]), len(match[3]) // 2))
+    return rows
+
+
+def profile_imports(runs, cwd, bytecode):
+    env = {**os.environ, "THROTTLE": "0"}
+    if not bytecode:
+        env["PYTHONDONTWRITEBYTECODE"] = "1"
+    walls, by_package, by_module = [], defaultdict(list), defaultdict(list)
+    for _ in range(runs):
+        done = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", BOOT], cwd=cwd, env=env, capture_output=True, text=True,
+        )
+        if done.returncode:
+            raise RuntimeError(done.stderr[-2000:])
+        walls.append(float(done.stdout.split()[-1]))
+        packages = defaultdict(int)
+        for module, self_us, _, _ in parse_importtime(done.stderr):
+            packages[module.split(".")[0]] += self_us
+            by_module[module].append(self_us)
+        for package, us in packages.items():
+            by_package[package].append(us)
+
+    def median_ms(values):
+        return round(statistics.median(values) / 1000, 2)
+
+    return {
+        "wall_ms": round(statistics.median(walls), 1),
+        "packages_ms": dict(sorted(
+            ((p, median_ms(v)) for p, v in by_package.items()), key=lambda item: -item[1],
+        )[:15]),
+        "modules_self_ms": dict(sorted(
+            ((m, median_ms(v)) for m, v in by_module.items()), key=lambda item: -item[1],
+        )[:20]),
+    }
+
+
+def uncompiled_copy():
+    """The project without its __pycache__ directories, as COPY puts it in the image."""
+    target = Path(tempfile.mkdtemp(prefix="cold-start-"))
+    for name in PROJECT:
+        source = ROOT / name
+        if source.is_dir():
+            shutil.copytree(source, target / name, ignore=shutil.ignore_patterns("__pycache__"))
+        else:
+            shutil.copy2(source, target / name)
+    return target
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", path)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def time_boot(preload, workers, port, timeout=60):
+    env = {
+        **os.environ, "THROTTLE": "0", "PORT": str(port), "WEB_CONCURRENCY": str(workers),
+        "GUNICORN_PRELOAD": "1" if preload else "0",
+    }
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"not ready after {timeout}s (is the database migrated?)")
+            try:
+                if get(port, "/api/ready/") == 200:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.05)
+        ready = time.perf_counter()
+        get(port, "/api/classes/")
+        first = time.perf_counter()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return {"ready_ms": round((ready - started) * 1000, 1), "first_response_ms": round((first - started) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--skip-boot", action="store_true", help="only profile imports")
+    parser.add_argument("--out", default="cold_start.json")
+    args = parser.parse_args()
+
+    subprocess.run([sys.executable, "-m", "compileall", "-q", *PROJECT], cwd=ROOT, check=True)
+    copy = uncompiled_copy()
+    try:
+        results = {
+            "imports": {
+                "compiled": profile_imports(args.runs, ROOT, bytecode=True),
+                "no_bytecode": profile_imports(args.runs, copy, bytecode=False),
+            },
+        }
+    finally:
+        shutil.rmtree(copy)
+    for name, row in results["imports"].items():
+        top = ", ".join(f"{p} {ms}" for p, ms in list(row["packages_ms"].items())[:5])
+        print(f"imports {name:12} {row['wall_ms']:>7} ms   {top}")
+
+    if not args.skip_boot:
+        results["boot"] = {
+            mode: time_boot(mode == "preload", args.workers, args.port) for mode in ("preload", "no_preload")
+        }
+        for mode, row in results["boot"].items():
+            print(f"boot    {mode:12} ready {row['ready_ms']:>7} ms   first response {row['first_response_ms']} ms")
+
+    write_report(args.out, "cold_start", vars(args), results)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Serializer vs fast read path (api/fastpath.py) for the big list endpoints.
+
+Times query + serialization + JSON rendering for each list queryset, once
+through the DRF serializer and JSONRenderer and once through the compiled
+RowMapper and render_json(), and checks the two bodies are identical. No
+HTTP, auth or response cache is involved. Seed data first:
+
+    python manage.py seed_data --classes 2000 --enrollments 200000
+    python benchmarks/fastpath_bench.py --iterations 10 --limit 20000 --out fastpath.json
+
+For the end-to-end effect, run api_bench.py with FAST_READS=0 and then with
+FAST_READS=1 and pass the first report to --compare.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dojo_backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api import fastpath  # noqa: E402
+from api.models import DojoClass, Enrollment, Payment, Schedule  # noqa: E402
+from api.prefetch import optimize_queryset  # noqa: E402
+from api.serializers import (  # noqa: E402
+    DojoClassSerializer, EnrollmentSerializer, PaymentSerializer, ScheduleSerializer, UserSerializer,
+)
+from benchmarks.stats import summarize, write_report  # noqa: E402
+
+User = get_user_model()
+
+TARGETS = {
+    "classes": (DojoClass, DojoClassSerializer),
+    "enrollments": (Enrollment, EnrollmentSerializer),
+    "payments": (Payment, PaymentSerializer),
+    "schedules": (Schedule, ScheduleSerializer),
+    "users": (User, UserSerializer),
+}
+
+
+def queryset_for(model, serializer_class, limit):
+    queryset = model._default_manager.all()
+    if not queryset.ordered:
+        queryset = queryset.order_by("pk")
+    # slice the ids first: prefetches can't follow a sliced queryset
+    ids = list(queryset.values_list("pk", flat=True)[:limit])
+    return optimize_queryset(queryset.filter(pk__in=ids), serializer_class())
+
+
+def with_serializer(queryset, serializer_class):
+    return JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+
+def with_fastpath(queryset, serializer_class):
+    return fastpath.render_json(fastpath.mapper_for(serializer_class()).run(queryset))
+
+
+def time_it(fn, iterations):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        body = fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return summarize(latencies, time.perf_counter() - started), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=10000, help="rows per list")
+    parser.add_argument("--only", action="append", choices=sorted(TARGETS))
+    parser.add_argument("--out", default="fastpath.json")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (model, serializer_class) in TARGETS.items():
+        if args.only and name not in args.only:
+            continue
+        if fastpath.mapper_for(serializer_class()) is None:
+            results[name] = {"skipped": "serializer not supported by the fast path"}
+            continue
+        queryset = queryset_for(model, serializer_class, args.limit)
+        slow, slow_body = time_it(lambda: with_serializer(queryset.all(), serializer_class), args.iterations)
+        fast, fast_body = time_it(lambda: with_fastpath(queryset.all(), serializer_class), args.iterations)
+        speedup = round(slow["p50_ms"] / fast["p50_ms"], 2) if fast["p50_ms"] else None
+        results[name] = {
+            "rows": queryset.count(), "bytes": len(fast_body), "identical": fast_body == slow_body,
+            "serializer": slow, "fastpath": fast, "speedup_p50": speedup,
+        }
+        print(
+            f"{name:12} rows={results[name]['rows']:<7} serializer p50 {slow['p50_ms']:>9} ms  "
+            f"fast p50 {fast['p50_ms']:>9} ms  x{speedup}  identical={fast_body == slow_body}"
+        )
+
+    config = {**vars(args), "orjson": fastpath.orjson is not None}
+    write_report(args.out, "fastpath", config, results)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Compare the sync WSGI deployment with the ASGI/uvicorn one at the same worker count.
+
+Starts gunicorn once per mode (see gunicorn.conf.py), drives the read-heavy
+endpoints with concurrent keep-alive clients and records throughput and
+p50/p95/p99 latency per endpoint.
+
+    python benchmarks/server_modes.py --workers 3 --concurrency 64 --duration 20 \
+        --token "$ACCESS_TOKEN" --out server_modes.json
+
+Run it against a seeded database (`manage.py seed_data`); the token must belong
+to an admin so /api/admin/stats/ is exercised too.
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stats import summarize, write_report  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_PATHS = [
+    "/api/classes/",
+    "/api/schedules/",
+    "/api/instructors/",
+    "/api/student/schedule/",
+    "/api/admin/stats/",
+]
+
+
+def start_server(mode, workers, port):
+    env = {**os.environ, "THROTTLE": "0", "SERVER_MODE": mode, "WEB_CONCURRENCY": str(workers), "PORT": str(port)}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/instructors/")
+            conn.getresponse().read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{mode} server did not come up on port {port}")
+
+
+def drive(port, path, token, concurrency, duration):
+    latencies, errors, lock = [], [0], threading.Lock()
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        local, local_errors = [], 0
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                continue
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, time.perf_counter() - started, errors[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", default=os.environ.get("BENCH_TOKEN", ""))
+    parser.add_argument("--path", action="append", dest="paths", help="endpoint to hit (repeatable)")
+    parser.add_argument("--modes", default="wsgi,asgi")
+    parser.add_argument("--out", default="server_modes.json")
+    args = parser.parse_args()
+
+    paths = args.paths or DEFAULT_PATHS
+    results = {}
+    for mode in args.modes.split(","):
+        proc = start_server(mode, args.workers, args.port)
+        try:
+            results[mode] = {
+                path: drive(args.port, path, args.token, args.concurrency, args.duration) for path in paths
+            }
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        for path, row in results[mode].items():
+            print(f"{mode:5} {path:28} {row['throughput_rps']:>8} rps  p50 {row['p50_ms']} ms  p99 {row['p99_ms']} ms")
+
+    config = {k: v for k, v in vars(args).items() if k != "token"}
+    write_report(args.out, "server_modes", config, results)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
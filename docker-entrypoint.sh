@@ -0,0 +1,15 @@
+#!/bin/sh
+# Release step, then the container's command (gunicorn by default).
+#
+# Migrations and the superuser need the real database, so they run here at
+# start-up rather than in the image build. With several replicas, or a
+# platform that runs the Procfile's `release` line (or another pre-deploy job)
+# first, set RUN_RELEASE=0 so only that step migrates.
+set -e
+
+if [ "${RUN_RELEASE:-1}" = "1" ]; then
+    python manage.py migrate --noinput
+    python manage.py ensure_superuser
+fi
+
+exec "$@"
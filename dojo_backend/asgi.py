@@ -9,8 +9,38 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
+from django.http import Http404
+from whitenoise.middleware import WhiteNoiseMiddleware
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dojo_backend.settings')
+# serve the read-heavy endpoints from api/async_views.py under ASGI
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+
+class WhiteNoiseStaticHandler(ASGIStaticFilesHandler):
+    """
+    Serves STATIC_URL through WhiteNoise (far-future caching of hashed names,
+    the pre-compressed variants, conditional GETs) in front of Django's fully
+    async handler. WhiteNoise only comes as sync middleware, which would put the
+    whole chain in a worker thread, so in ASGI mode it is left out of MIDDLEWARE
+    and its file index is used here instead.
+    """
+
+    def __init__(self, application):
+        super().__init__(application)
+        self.whitenoise = WhiteNoiseMiddleware()
+
+    def serve(self, request):
+        whitenoise = self.whitenoise
+        if whitenoise.autorefresh:
+            static_file = whitenoise.find_file(request.path_info)
+        else:
+            static_file = whitenoise.files.get(request.path_info)
+        if static_file is None:
+            raise Http404(f"{request.path_info} is not a static file.")
+        return whitenoise.serve(static_file, request)
+
+
+application = WhiteNoiseStaticHandler(get_asgi_application())
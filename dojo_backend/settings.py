@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import dj_database_url
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -70,6 +71,79 @@ REST_FRAMEWORK = {
     # 'DEFAULT_PERMISSION_CLASSES': (
     #     'rest_framework.permissions.IsAuthenticated',
     # ),
+    # opt-in: only applies when the client sends ?cursor= or ?page_size=
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+}
+
+# api.fastpath: serve plain JSON list GETs from values() rows instead of the
+# serializers (same bytes; orjson is used when installed)
+FAST_READS = os.environ.get('FAST_READS', '1') == '1'
+
+# Worker processes serving the app; gunicorn.conf.py exports how many it starts
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# 'shared' is seen by every worker: files on this host, or Redis (REDIS_URL,
+# needs the redis package) when the workers are spread over several hosts
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    } if os.environ.get('REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SHARED_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'dojo-backend-cache')),
+    },
+}
+
+# Response cache for the public read endpoints (api/cache.py). Its model
+# versions decide ETags and 304s, so they must be the same in every worker:
+# the per-process LRU is only the default for a single one.
+RESPONSE_CACHE = {
+    'BACKEND': os.environ.get(
+        'RESPONSE_CACHE_BACKEND',
+        'api.cache.DjangoCacheBackend' if WEB_CONCURRENCY > 1 else 'api.cache.LocalLRUBackend',
+    ),
+    'OPTIONS': {'timeout': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300))},
+}
+if RESPONSE_CACHE['BACKEND'] == 'api.cache.DjangoCacheBackend':
+    RESPONSE_CACHE['OPTIONS']['alias'] = os.environ.get('RESPONSE_CACHE_ALIAS', 'shared')
+
+# api.jobs: retry backoff for failed background jobs, and how long a job may
+# stay claimed before another worker takes it over
+JOBS = {
+    'BACKOFF_SECONDS': int(os.environ.get('JOBS_BACKOFF_SECONDS', 5)),
+    'MAX_BACKOFF_SECONDS': int(os.environ.get('JOBS_MAX_BACKOFF_SECONDS', 600)),
+    'LEASE_SECONDS': int(os.environ.get('JOBS_LEASE_SECONDS', 300)),
+}
+
+# api.idempotency: how long a stored response answers retries of the same
+# Idempotency-Key, and after how long an unfinished first attempt is abandoned
+IDEMPOTENCY = {
+    'TTL_SECONDS': int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 3600)),
+    'LOCK_SECONDS': int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60)),
+}
+
+# api.class_sessions: how far ahead `manage.py generate_sessions` creates dated
+# sessions, and how long before a session starts check-in opens
+SESSIONS = {
+    'WINDOW_DAYS': int(os.environ.get('SESSIONS_WINDOW_DAYS', 28)),
+    'CHECK_IN_OPENS_MINUTES': int(os.environ.get('SESSIONS_CHECK_IN_OPENS_MINUTES', 60)),
+}
+
+# api.sync: how far back each next token reaches to catch transactions that were
+# still open, and how long deletions are remembered before clients must resync
+SYNC = {
+    'LAG_SECONDS': int(os.environ.get('SYNC_LAG_SECONDS', 5)),
+    'TOMBSTONE_DAYS': int(os.environ.get('SYNC_TOMBSTONE_DAYS', 30)),
+}
+
+# api.authentication.StatelessJWTAuthentication: seconds a user's active flag is
+# trusted before it is re-read (0 = never re-read, fully query-free auth), and
+# how many users' flags each process keeps
+STATELESS_JWT = {
+    'ACTIVE_CACHE_TTL': int(os.environ.get('JWT_ACTIVE_CACHE_TTL', 30)),
+    'ACTIVE_CACHE_SIZE': int(os.environ.get('JWT_ACTIVE_CACHE_SIZE', 10000)),
 }
 
 CORS_ALLOW_ALL_ORIGINS = True  # allows frontend to access backend in dev mode
@@ -83,6 +157,10 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_EXPOSE_HEADERS = [
+    "etag", "idempotent-replayed", "link", "location", "preference-applied", "retry-after", "server-timing",
+]
+
 CORS_ALLOW_METHODS = [
     "DELETE",
     "GET", 
@@ -96,9 +174,12 @@ CORS_ALLOW_HEADERS = [
     "accept",
     "accept-encoding",
     "authorization",
+    "if-none-match",
     "content-type",
     "dnt",
+    "idempotency-key",
     "origin",
+    "prefer",
     "user-agent",
     "x-csrftoken",
     "x-requested-with",
@@ -106,8 +187,12 @@ CORS_ALLOW_HEADERS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.compression.CompressionMiddleware',
+    'api.metrics.RequestMetricsMiddleware',
+    'api.routers.ReplicaRoutingMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'api.throttling.ThrottleMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -116,8 +201,83 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# api.compression.CompressionMiddleware: br/zstd/gzip for JSON, NDJSON and text bodies
+COMPRESSION = {
+    # below this many bytes the encoding overhead isn't worth it
+    'MIN_SIZE': int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    'ENCODINGS': ('br', 'zstd', 'gzip'),
+    'LEVELS': {'br': 4, 'zstd': 3, 'gzip': 6},
+}
+
+# api.metrics.RequestMetricsMiddleware: Server-Timing headers, /api/metrics/ and
+# the slow-request log. SERVER_TIMING says who gets the header: 'staff' (admins
+# and is_staff users), 'all' or 'none'; it gives away query counts and DB time.
+REQUEST_METRICS = {
+    'ENABLED': os.environ.get('REQUEST_METRICS', '1') == '1',
+    # the test suite's first requests pay for cold caches; don't log them all
+    'SLOW_REQUEST_MS': int(os.environ.get('SLOW_REQUEST_MS', 500)),
+    'SERVER_TIMING': os.environ.get('SERVER_TIMING', 'staff'),
+}
+
+# api.throttling.ThrottleMiddleware: token buckets per route and client (user id
+# from a valid access token, else IP). LocalBucketStore counts per process; with
+# several workers use CacheBucketStore and point its 'alias' at a shared CACHES
+# entry (Redis). Set THROTTLE_PROXY_COUNT to the number of proxies that append
+# to X-Forwarded-For (1 on Heroku) so clients are told apart by their own IP.
+THROTTLE = {
+    'ENABLED': os.environ.get('THROTTLE', '1') == '1',
+    'BACKEND': os.environ.get('THROTTLE_BACKEND', 'api.throttling.LocalBucketStore'),
+    'OPTIONS': {},
+    'PROXY_COUNT': int(os.environ.get('THROTTLE_PROXY_COUNT', 0)),
+    'DEFAULT_RATE': os.environ.get('THROTTLE_DEFAULT_RATE', '300/m'),
+    'RATES': {
+        # password hashing: each attempt costs a worker a few hundred ms
+        'token_obtain_pair': '10/m',
+        'register': '5/m',
+        'class_list_create': '120/m',
+        'schedule_list_create': '120/m',
+        'instructor-list': '120/m',
+        'timetable': '120/m',
+        'search': '60/m',
+        # load balancer probes all come from one address
+        'ready': None,
+    },
+}
+
+# ...and load shedding: past these limits everything except writes to the
+# PROTECTED routes gets 503 + Retry-After. Queue time comes from the router's
+# X-Request-Start header; latency is the median of this process's requests
+# over the last LATENCY_WINDOW_SECONDS, once there are MIN_SAMPLES of them.
+# 0 turns a check off.
+LOAD_SHEDDING = {
+    'MAX_QUEUE_MS': int(os.environ.get('SHED_MAX_QUEUE_MS', 2000)),
+    'MAX_LATENCY_MS': int(os.environ.get('SHED_MAX_LATENCY_MS', 3000)),
+    'MAX_IN_FLIGHT': int(os.environ.get('SHED_MAX_IN_FLIGHT', 0)),
+    'MIN_SAMPLES': int(os.environ.get('SHED_MIN_SAMPLES', 20)),
+    'RETRY_AFTER': 5,
+    # the load balancer's probe; shedding it would pull the instance out of rotation
+    'EXEMPT': ['ready'],
+    # slow by design, so they would skew the latency signal
+    'UNTIMED': ['enrollment-reports', 'enrollment_export', 'payment_export'],
+    'PROTECTED': [
+        'enrollment_list_create', 'enrollment_bulk_create', 'enrollment_detail',
+        'payment_list_create', 'payment_bulk_create', 'payment_detail',
+        # front-desk check-ins arrive in bursts at the start of class
+        'session-attendance', 'session-attendance-detail',
+    ],
+}
+
 ROOT_URLCONF = 'dojo_backend.urls'
 
+# Route the read-heavy endpoints to api/async_views.py; the ASGI entrypoint turns this on
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
+if ASYNC_VIEWS:
+    # WhiteNoise is sync-only: under ASGI it would run the whole middleware chain,
+    # async views included, in a worker thread. dojo_backend/asgi.py puts
+    # WhiteNoise in front of the ASGI app instead.
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -141,13 +301,47 @@ WSGI_APPLICATION = 'dojo_backend.wsgi.application'
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Connection reuse. Persistent connections (CONN_MAX_AGE) are checked before
+# each request, so a connection dropped by Postgres or PgBouncer is replaced
+# instead of failing the request. DB_POOL_MAX_SIZE switches to psycopg 3's
+# connection pool (needs `psycopg[binary,pool]`), which replaces persistent
+# connections. Behind PgBouncer in transaction mode set PGBOUNCER=1.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+PGBOUNCER = os.environ.get('PGBOUNCER') == '1'
+
+
+def postgres_database(url):
+    config = dj_database_url.parse(
+        url,
+        conn_max_age=0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+        conn_health_checks=not DB_POOL_MAX_SIZE,
+    )
+    if DB_POOL_MAX_SIZE:
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+    if PGBOUNCER:
+        # transaction pooling hands each transaction a different server connection
+        config['DISABLE_SERVER_SIDE_CURSORS'] = True
+    return config
+
+
+# Read replicas, comma-separated (DATABASE_REPLICA_URL for just one); they
+# become the aliases replica, replica_2, ... Reads only go to those named in
+# DATABASE_REPLICAS (all of them by default).
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in (os.environ.get('DATABASE_REPLICA_URLS') or os.environ.get('DATABASE_REPLICA_URL', '')).split(',')
+    if url.strip()
+]
+
 if DATABASE_URL:
     # Use Postgres configuration if the environment variable is found
     DATABASES = {
-        'default': dj_database_url.config(
-            default=DATABASE_URL,
-            conn_max_age=600
-        )
+        'default': postgres_database(DATABASE_URL),
     }
 else:
     # Fallback to local sqlite for local development only
@@ -155,9 +349,39 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
-        }
+            'OPTIONS': {
+                # take the write lock at BEGIN so concurrent writers queue instead of deadlocking
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+            # file-backed test db so threaded tests get real, separate connections
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        },
     }
 
+replica_aliases = []
+for i, url in enumerate(DATABASE_REPLICA_URLS):
+    alias = 'replica' if i == 0 else f'replica_{i + 1}'
+    DATABASES[alias] = postgres_database(url) if DATABASE_URL else dj_database_url.parse(url)
+    # tests read and write the primary's test database through every alias
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    replica_aliases.append(alias)
+
+if not DATABASE_URL and not replica_aliases:
+    # local SQLite: `replica` is a second alias of the same file, so the
+    # routing can be tried (DATABASE_REPLICAS=replica) and tested under any
+    # runner without a second database. Unless named there, nothing reads from it.
+    DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# api.routers: aliases safe requests read from (none: everything uses the
+# primary), and for how long a client that wrote keeps reading the primary
+REPLICA_ROUTING = {
+    'REPLICAS': [a for a in os.environ.get('DATABASE_REPLICAS', ','.join(replica_aliases)).split(',') if a],
+    'STICKY_SECONDS': int(os.environ.get('REPLICA_STICKY_SECONDS', 5)),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
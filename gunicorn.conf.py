@@ -0,0 +1,58 @@
+# Gunicorn settings, read with `gunicorn -c gunicorn.conf.py`.
+#
+# SERVER_MODE=wsgi (default) runs sync workers on dojo_backend.wsgi.
+# SERVER_MODE=asgi runs uvicorn workers on dojo_backend.asgi, which also switches
+# the read-heavy endpoints to the async views in api/async_views.py.
+#
+# GUNICORN_PRELOAD=1 (default) imports the app once in the master and forks the
+# workers from it, so a new or restarted worker serves at once instead of each
+# importing Django, DRF and the views. The hooks below keep that fork-safe and
+# warm each worker (api/readiness.py) before it takes requests.
+import multiprocessing
+import os
+
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(3, multiprocessing.cpu_count() * 2 + 1)))
+# settings.py picks shared caches (response cache versions) from this
+os.environ["WEB_CONCURRENCY"] = str(workers)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "dojo_backend.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "dojo_backend.wsgi:application"
+    worker_class = "sync"
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")  # e.g. "-" for stdout
+
+
+def when_ready(server):
+    if preload_app:
+        from api import readiness
+
+        # the URLconf and views too, not just what the WSGI module imports
+        readiness.warm(connect=False)
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        from api import readiness
+
+        # anything the master connected to stays with the master
+        readiness.release_connections()
+
+
+def post_worker_init(worker):
+    from django.db import DatabaseError
+
+    from api import readiness
+
+    # this worker's own connections (or pool), opened before it accepts requests
+    try:
+        readiness.warm()
+    except DatabaseError as exc:
+        # serve anyway; /api/ready/ reports the database until it is back
+        worker.log.warning("database not reachable at boot: %s", exc)